@@ -0,0 +1,180 @@
+import math
+import os
+import threading
+import time
+
+from instruments import INSTRUMENTS
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+def env_int(variable, default):
+    value = os.environ.get(variable)
+    return int(value) if value else default
+
+
+# Requests scored at once per model in each worker. 0 (the default) admits
+# everything, as before. ASD_MCHAT_MAX_CONCURRENT / ASD_AQ_MAX_CONCURRENT
+# override it for one model.
+MAX_CONCURRENT = env_int('ASD_MAX_CONCURRENT', 0)
+# Requests allowed to wait for a slot; any more are rejected at once (429)
+MAX_QUEUE = env_int('ASD_MAX_QUEUE', 16)
+# Longest a request waits for a slot before it is shed (503)
+QUEUE_TIMEOUT_SECONDS = float(os.environ.get('ASD_QUEUE_TIMEOUT_MS', 1000)) / 1000
+
+# Weight of the latest request in the moving average of scoring time that
+# Retry-After is estimated from
+SERVICE_TIME_ALPHA = 0.2
+
+# Optional request headers bounding how long a caller is still waiting:
+# an absolute unix time in seconds, or a budget in milliseconds counted from
+# arrival here. The earlier of the two applies.
+DEADLINE_HEADER = 'X-Request-Deadline'
+TIMEOUT_HEADER = 'X-Request-Timeout-Ms'
+
+
+# ============================================================================
+# ADMISSION CONTROL
+# ============================================================================
+#
+# One limiter per model and worker: at most `limit` requests score at once,
+# at most `max_queue` more wait for a slot, and a waiting request gives up
+# at its deadline or after QUEUE_TIMEOUT_SECONDS. Rejecting early keeps
+# latency bounded when the worker is overloaded; otherwise every request
+# queues, slows down and is retried by callers that have already timed out.
+
+class Limiter:
+    def __init__(self, limit, max_queue):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.slots = threading.Semaphore(limit)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'queue_timeout': 0, 'deadline': 0}
+        self.service_seconds = None
+
+    def retry_after(self):
+        # Whole seconds until the requests ahead should have drained
+        per_request = self.service_seconds or 0.0
+        backlog = (self.active + self.queued) / self.limit
+        return max(1, math.ceil(backlog * per_request))
+
+
+_LIMITERS = {
+    name: Limiter(env_int(f'ASD_{name.upper()}_MAX_CONCURRENT', MAX_CONCURRENT), MAX_QUEUE)
+    for name in INSTRUMENTS
+}
+
+
+def request_deadline(headers, now=None):
+    """Unix time the caller stops waiting, from the deadline headers.
+
+    Returns (deadline or None, None), or (None, error_body) for a header
+    that is not a number.
+    """
+    now = time.time() if now is None else now
+    deadlines = []
+    try:
+        if headers.get(DEADLINE_HEADER):
+            deadlines.append(float(headers[DEADLINE_HEADER]))
+        if headers.get(TIMEOUT_HEADER):
+            deadlines.append(now + float(headers[TIMEOUT_HEADER]) / 1000)
+    except ValueError:
+        return None, {
+            'error': 'Invalid deadline',
+            'message': f'{DEADLINE_HEADER} must be a unix time in seconds and {TIMEOUT_HEADER} a number of milliseconds.'
+        }
+    return (min(deadlines) if deadlines else None), None
+
+
+def rejection(limiter, reason, status, error, message):
+    with limiter.lock:
+        limiter.rejected[reason] += 1
+    return None, {
+        'status': status,
+        'retry_after': limiter.retry_after(),
+        'body': {'error': error, 'message': message},
+    }
+
+
+def admit(name, deadline=None):
+    """Wait for a scoring slot of one model.
+
+    Returns (ticket, None) once admitted; pass the ticket to release() when
+    the request is done. Returns (None, rejection) when the request is shed:
+    a dict with the HTTP status, the Retry-After seconds and the error body.
+    """
+    limiter = _LIMITERS[name]
+    if limiter.limit <= 0:
+        return {'limiter': None}, None
+
+    now = time.time()
+    if deadline is not None and deadline <= now:
+        return rejection(
+            limiter, 'deadline', 503, 'Deadline exceeded',
+            'The request deadline passed before it could be scored.'
+        )
+
+    if not limiter.slots.acquire(blocking=False):
+        with limiter.lock:
+            full = limiter.queued >= limiter.max_queue
+            if not full:
+                limiter.queued += 1
+        if full:
+            return rejection(
+                limiter, 'queue_full', 429, 'Too many requests',
+                f'The server is at capacity ({limiter.limit} scoring, {limiter.max_queue} waiting). Retry later.'
+            )
+
+        wait = QUEUE_TIMEOUT_SECONDS if deadline is None else min(QUEUE_TIMEOUT_SECONDS, deadline - now)
+        acquired = limiter.slots.acquire(timeout=max(wait, 0))
+        with limiter.lock:
+            limiter.queued -= 1
+        if not acquired:
+            if deadline is not None and time.time() >= deadline:
+                return rejection(
+                    limiter, 'deadline', 503, 'Deadline exceeded',
+                    'The request deadline passed while waiting for the model.'
+                )
+            return rejection(
+                limiter, 'queue_timeout', 503, 'Server busy',
+                f'No scoring slot became free within {QUEUE_TIMEOUT_SECONDS * 1000:.0f} ms. Retry later.'
+            )
+
+    with limiter.lock:
+        limiter.active += 1
+        limiter.admitted += 1
+    return {'limiter': limiter, 'started': time.perf_counter()}, None
+
+
+def release(ticket):
+    limiter = ticket['limiter']
+    if limiter is None:
+        return
+    elapsed = time.perf_counter() - ticket['started']
+    with limiter.lock:
+        limiter.active -= 1
+        if limiter.service_seconds is None:
+            limiter.service_seconds = elapsed
+        else:
+            limiter.service_seconds += SERVICE_TIME_ALPHA * (elapsed - limiter.service_seconds)
+    limiter.slots.release()
+
+
+def status():
+    # Limits, current load and rejection counts of this worker, for /health
+    return {
+        name: {
+            'enabled': limiter.limit > 0,
+            'max_concurrent': limiter.limit,
+            'max_queue': limiter.max_queue,
+            'active': limiter.active,
+            'queued': limiter.queued,
+            'admitted': limiter.admitted,
+            'rejected': dict(limiter.rejected),
+        }
+        for name, limiter in _LIMITERS.items()
+    }
@@ -1,11 +1,36 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, has_request_context, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
-import joblib
 import pandas as pd
 import numpy as np
+import functools
+import hmac
+import json
 import os
 import traceback
 
+from instruments import INSTRUMENTS
+from model_loader import (
+    MODEL_SPECS,
+    get_model,
+    load_models,
+    model_status,
+    on_model_loaded,
+    reload_model,
+    request_reload,
+    start_watcher,
+)
+import admission
+import coalescer
+import history
+import instruments
+import jobs
+import lookup_table
+import metrics
+import packed
+import result_cache
+import schema
+import whatif
+
 # ============================================================================
 # FLASK APP INITIALIZATION
 # ============================================================================
@@ -17,203 +42,56 @@ CORS(app)
 # LOAD TRAINED MODELS AND FEATURE NAMES
 # ============================================================================
 
-print("Loading trained models...")
-
-try:
-    # Load M-CHAT model (for 12-36 months)
-    MCHAT_MODEL = joblib.load('outputs/mchat_model.pkl')
-    MCHAT_FEATURES = joblib.load('outputs/mchat_feature_names.pkl')
-    print("✓ M-CHAT model loaded successfully")
-    print(f"  Expected features: {len(MCHAT_FEATURES)}")
-except Exception as e:
-    print(f"⚠ Warning: Could not load M-CHAT model: {e}")
-    MCHAT_MODEL = None
-    MCHAT_FEATURES = None
-
-try:
-    # Load AQ model (for 3-11 years)
-    AQ_MODEL = joblib.load('outputs/aq_model.pkl')
-    AQ_FEATURES = joblib.load('outputs/aq_feature_names.pkl')
-    print("✓ AQ model loaded successfully")
-    print(f"  Expected features: {len(AQ_FEATURES)}")
-except Exception as e:
-    print(f"⚠ Warning: Could not load AQ model: {e}")
-    AQ_MODEL = None
-    AQ_FEATURES = None
+# Models load lazily, on the first request that needs them (see
+# model_loader.py). ASD_PRELOAD_MODELS=mchat,aq loads them at import instead;
+# gunicorn.conf.py does this in the master process before forking.
+# Cached results belong to the model that produced them
+on_model_loaded(result_cache.clear)
+
+
+@on_model_loaded
+def attach_lookup_table(name):
+    # Check the configured M-CHAT lookup table against the new model
+    if name == 'mchat':
+        lookup_table.attach(get_model('mchat'))
+
+
+PRELOAD_MODELS = [name for name in os.environ.get('ASD_PRELOAD_MODELS', '').split(',') if name]
+if PRELOAD_MODELS:
+    load_models(PRELOAD_MODELS)
+
+# Bearer token for the /admin endpoints; unset disables them
+ADMIN_TOKEN = os.environ.get('ASD_ADMIN_TOKEN')
 
 
 # ============================================================================
 # HELPER FUNCTIONS FOR DATA PREPROCESSING
 # ============================================================================
 
-def preprocess_mchat_data(data):
-    df = pd.DataFrame([data])
-    
-    # 1. Encode binary yes/no columns
-    binary_columns = ['Jaundice', 'Family_ASD_History'] + [f'Q{i}' for i in range(1, 24)]
-    for col in binary_columns:
-        if col in df.columns:
-            if df[col].dtype == 'object':
-                df[col] = (df[col].str.lower() == 'yes').astype(int)
-            else:
-                df[col] = df[col].astype(int)
-    
-    # 2. Encode gender
-    if 'Gender' in df.columns:
-        if df['Gender'].dtype == 'object':
-            df['Gender'] = (df['Gender'].str.lower() == 'male').astype(int)
-        else:
-            df['Gender'] = df['Gender'].astype(int)
-    
-    # 3. FEATURE ENGINEERING (must match training exactly)
-
-    # Define M-CHAT clinical parameters
-
-    BEST7_QUESTIONS = [2, 5, 7, 9, 14, 15, 20]
-    INVERTED_QUESTIONS = [11, 18, 20, 22]
-    
-    # Create failure indicators
-    failure_cols = []
-    for i in range(1, 24):
-        q_col = f'Q{i}'
-        fail_col = f'Q{i}_Failed'
-        
-        if i in INVERTED_QUESTIONS:
-            df[fail_col] = df[q_col]
-        else:
-            df[fail_col] = (df[q_col] == 0).astype(int)
-        
-        failure_cols.append(fail_col)
-    
-    # Best7 features
-    best7_fail_cols = [f'Q{i}_Failed' for i in BEST7_QUESTIONS]
-    df['Best7_Failed_Count'] = df[best7_fail_cols].sum(axis=1)
-    df['Total_Failed_Count'] = df[failure_cols].sum(axis=1)
-    df['MCHAT_Risk_Flag'] = (
-        (df['Best7_Failed_Count'] >= 2) | 
-        (df['Total_Failed_Count'] >= 3)
-    ).astype(int)
-    df['Best7_Pass_Rate'] = 1 - (df['Best7_Failed_Count'] / len(BEST7_QUESTIONS))
-    df['Total_Pass_Rate'] = 1 - (df['Total_Failed_Count'] / 23)
-    
-    non_best7_fail_cols = [f'Q{i}_Failed' for i in range(1, 24) if i not in BEST7_QUESTIONS]
-    df['NonBest7_Failed_Count'] = df[non_best7_fail_cols].sum(axis=1)
-    df['Best7_to_NonBest7_Ratio'] = df['Best7_Failed_Count'] / (df['NonBest7_Failed_Count'] + 1)
-    
-    # Domain-specific features
-    social_questions = [2, 7, 9, 14, 15, 17, 19, 21, 23]
-    social_fail_cols = [f'Q{i}_Failed' for i in social_questions]
-    df['Social_Failed_Count'] = df[social_fail_cols].sum(axis=1)
-    df['Social_Pass_Rate'] = 1 - (df['Social_Failed_Count'] / len(social_questions))
-    
-    joint_attention = [6, 7, 9, 15]
-    joint_attention_cols = [f'Q{i}_Failed' for i in joint_attention]
-    df['JointAttention_Failed_Count'] = df[joint_attention_cols].sum(axis=1)
-    
-    df['PretendPlay_Failed'] = df['Q5_Failed']
-    
-    sensory_questions = [11, 18, 22]
-    sensory_fail_cols = [f'Q{i}_Failed' for i in sensory_questions]
-    df['Sensory_Failed_Count'] = df[sensory_fail_cols].sum(axis=1)
-    
-    # Interaction features
-    df['Q9_Q14_Interaction'] = df['Q9_Failed'] * df['Q14_Failed']
-    df['Q9_Q15_Interaction'] = df['Q9_Failed'] * df['Q15_Failed']
-    df['Q7_Q14_Interaction'] = df['Q7_Failed'] * df['Q14_Failed']
-    
-    df['Risk_Factors_Sum'] = df['Family_ASD_History'] + df['Jaundice']
-    df['Male_With_Family_History'] = df['Gender'] * df['Family_ASD_History']
-    df['High_Risk_Profile'] = (
-        (df['Family_ASD_History'] == 1) & 
-        (df['Best7_Failed_Count'] >= 1)
-    ).astype(int)
-    
-    df['Best7_All_Passed'] = (df['Best7_Failed_Count'] == 0).astype(int)
-    df['Best7_Multiple_Failed'] = (df['Best7_Failed_Count'] >= 2).astype(int)
-    
-    # Age-based features
-    df['Age_Squared'] = df['Age'] ** 2
-    df['Age_Group'] = pd.cut(
-        df['Age'], 
-        bins=[0, 18, 24, 30, 100], 
-        labels=[0, 1, 2, 3]
-    ).astype(int)
-    
-    # Statistical pattern features
-    question_fail_cols = [f'Q{i}_Failed' for i in range(1, 24)]
-    df['Failure_Mean'] = df[question_fail_cols].mean(axis=1)
-    df['Failure_Std'] = df[question_fail_cols].std(axis=1)
-    
-    # Consecutive failures
-    consecutive_failures = []
-    for _, row in df[question_fail_cols].iterrows():
-        max_consecutive = 0
-        current_consecutive = 0
-        for val in row:
-            if val == 1:
-                current_consecutive += 1
-                max_consecutive = max(max_consecutive, current_consecutive)
-            else:
-                current_consecutive = 0
-        consecutive_failures.append(max_consecutive)
-    
-    df['Max_Consecutive_Failures'] = consecutive_failures
-    
-    for feature in MCHAT_FEATURES:
-        if feature not in df.columns:
-            df[feature] = 0
-    
-    return df[MCHAT_FEATURES]
-
-
-def preprocess_aq_data(data):
-    df = pd.DataFrame([data])
-    
-    # 1. Encode binary columns
-    df['Jaundice'] = (df['Jaundice'].str.lower() == 'yes').astype(int) if df['Jaundice'].dtype == 'object' else df['Jaundice'].astype(int)
-    df['Family_ASD_History'] = (df['Family_ASD_History'].str.lower() == 'yes').astype(int) if df['Family_ASD_History'].dtype == 'object' else df['Family_ASD_History'].astype(int)
-    
-    # 2. Encode gender
-    if df['Gender'].dtype == 'object':
-        df['Gender'] = (df['Gender'].str.lower() == 'male').astype(int)
-    else:
-        df['Gender'] = df['Gender'].astype(int)
-    
-    # 3. FEATURE ENGINEERING (must match training exactly)
-    
-    # AQ subscales
-    social = ['Q1', 'Q2', 'Q3', 'Q4', 'Q5', 'Q6']
-    switching = ['Q7', 'Q8', 'Q9', 'Q10', 'Q11', 'Q12']
-    detail = ['Q13', 'Q14', 'Q15', 'Q16', 'Q17', 'Q18']
-    communication = ['Q19', 'Q20', 'Q21', 'Q22', 'Q23', 'Q24', 'Q25']
-    imagination = ['Q26', 'Q27', 'Q28', 'Q29', 'Q30']
-    
-    # Subscale means
-    df['Social_Mean'] = df[social].mean(axis=1)
-    df['Switching_Mean'] = df[switching].mean(axis=1)
-    df['Detail_Mean'] = df[detail].mean(axis=1)
-    df['Communication_Mean'] = df[communication].mean(axis=1)
-    df['Imagination_Mean'] = df[imagination].mean(axis=1)
-    
-    # Total AQ score
-    df['AQ_Total'] = df[[f'Q{i}' for i in range(1, 31)]].sum(axis=1)
-    
-    # High score count
-    df['High_Score_Count'] = (df[[f'Q{i}' for i in range(1, 31)]] >= 2).sum(axis=1)
-    
-    # Variability
-    df['Score_STD'] = df[[f'Q{i}' for i in range(1, 31)]].std(axis=1)
-    
-    # Interaction features
-    df['Comm_x_Family'] = df['Communication_Mean'] * df['Family_ASD_History']
-    df['Social_x_Family'] = df['Social_Mean'] * df['Family_ASD_History']
-    
-    # Ensure all expected features are present and in correct order
-    for feature in AQ_FEATURES:
-        if feature not in df.columns:
-            df[feature] = 0
+# Upper bound on records accepted by /predict/batch in a single request
+BATCH_MAX_RECORDS = 5000
+# Upper bound on children per /predict/whatif request (up to 187 variants each)
+WHATIF_MAX_RECORDS = 100
+# Features listed in each ?explain=true result, largest contribution first
+EXPLAIN_TOP_FEATURES = 10
+# Records scored together by /predict/stream before their results are sent
+STREAM_BATCH_ROWS = int(os.environ.get('ASD_STREAM_BATCH_ROWS', 500))
+
+
+def to_records(data):
+    # Preprocessors accept a single payload dict or a list of them
+    return data if isinstance(data, list) else [data]
+
+
+def preprocess_data(model_name, data, plan=None):
+    # Run the instrument's compiled feature pipeline (see instruments.py):
+    # the payloads become one answer matrix plus demographic vectors and the
+    # engineered features must match training exactly. Age must already be
+    # in the model's unit. plan defaults to the loaded model's plan.
+    plan = plan or get_model(model_name)['plan']
+    X = INSTRUMENTS[model_name]['preprocess'](to_records(data), plan)
     
-    return df[AQ_FEATURES]
+    return pd.DataFrame(X, columns=plan['feature_names'])
 
 
 def categorize_risk(percentage):
@@ -225,10 +103,111 @@ def categorize_risk(percentage):
         return 'High Risk'
 
 
+def format_prediction(model_used, model_version, age, age_unit, prediction, prediction_proba):
+    # Get risk probability (probability of ASD class)
+    risk_probability = prediction_proba[1]
+    risk_percentage = risk_probability * 100
+    
+    # Categorize risk
+    risk_category = categorize_risk(risk_percentage)
+    
+    return {
+        'model_used': model_used,
+        'model_version': model_version,
+        'age': age,
+        'age_unit': age_unit,
+        'prediction': int(prediction),
+        'prediction_label': 'ASD' if prediction == 1 else 'No ASD',
+        'confidence': float(risk_probability),
+        'risk_percentage': float(round(risk_percentage, 2)),
+        'risk_category': risk_category,
+        'probabilities': {
+            'no_asd': float(prediction_proba[0]),
+            'asd': float(prediction_proba[1])
+        },
+    }
+
+
+def check_age(value):
+    # Error body for an Age that is not a number, else None
+    try:
+        schema.encode_age(value)
+    except ValueError:
+        return {
+            'error': 'Invalid age',
+            'message': f'Age must be a number of months. Provided: {value!r}.'
+        }
+    return None
+
+
+def model_not_loaded(instrument):
+    return {
+        'error': f"{instrument['label']} model not loaded",
+        'message': f"The {instrument['label']} model file could not be loaded"
+    }
+
+
 # ============================================================================
 # API ENDPOINTS
 # ============================================================================
 
+def read_payload(single=True):
+    # Parse a JSON body, or a packed one (see packed.py) when sent as
+    # packed.PACKED_MIMETYPE. Returns (data, None) or (None, error_body).
+    if request.mimetype != packed.PACKED_MIMETYPE:
+        return request.get_json(), None
+    try:
+        records = packed.decode_records(request.get_data())
+    except ValueError as e:
+        return None, {'error': 'Invalid packed body', 'message': str(e)}
+    if not single:
+        return records, None
+    if len(records) != 1:
+        return None, {
+            'error': 'Invalid packed body',
+            'message': f'This endpoint takes exactly one record. Provided: {len(records)}.'
+        }
+    return records[0], None
+
+
+def wants_packed():
+    # JSON unless the client prefers the packed format in its Accept header
+    best = request.accept_mimetypes.best_match(['application/json', packed.PACKED_MIMETYPE])
+    return best == packed.PACKED_MIMETYPE
+
+
+def packed_response(results):
+    # Packed results carry no version field, so name the serving versions
+    # in a header: "mchat=3f2c9a1b7d04,aq=..."
+    versions = sorted({(r['model_used'], r['model_version']) for r in results if 'error' not in r})
+    response = Response(packed.encode_results(results), mimetype=packed.PACKED_MIMETYPE)
+    response.headers['X-Model-Versions'] = ','.join(f'{name}={version}' for name, version in versions)
+    return response
+
+
+def model_state_label(name):
+    # Models load on first use, so "not loaded" is normal until then
+    status = model_status(name)
+    if status['loaded']:
+        return 'loaded'
+    return 'failed' if status['error'] else 'not loaded'
+
+
+def timed(view):
+    # Record the request's latency and per-stage timings for /metrics
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        metrics.begin_request(request.endpoint)
+        status = 500
+        try:
+            response = app.make_response(view(*args, **kwargs))
+            status = response.status_code
+            return response
+        finally:
+            metrics.end_request(status)
+    return wrapper
+
+
 @app.route('/', methods=['GET'])
 def home():
     return jsonify({
@@ -236,40 +215,98 @@ def home():
         'version': '1.0.0',
         'status': 'active',
         'models': {
-            'mchat': {
-                'status': 'loaded' if MCHAT_MODEL else 'not loaded',
-                'age_range': '12-36 months',
-                'questions': 23
-            },
-            'aq': {
-                'status': 'loaded' if AQ_MODEL else 'not loaded',
-                'age_range': '3-11 years',
-                'questions': 30
+            name: {
+                'status': model_state_label(name),
+                'age_range': instrument['age_range'],
+                'questions': instrument['questions']
             }
+            for name, instrument in INSTRUMENTS.items()
         },
         'endpoints': {
             '/predict': 'POST - Make ASD risk prediction (auto-routes to correct model)',
-            '/predict/mchat': 'POST - M-CHAT prediction (12-36 months)',
-            '/predict/aq': 'POST - AQ prediction (3-11 years)',
-            '/health': 'GET - Check API health status'
+            **{
+                f'/predict/{name}': f"POST - {instrument['label']} prediction ({instrument['age_range']})"
+                for name, instrument in INSTRUMENTS.items()
+            },
+            '/predict/batch': 'POST - Batch prediction for a list of records (mixed ages allowed)',
+            '/predict/stream': 'POST - Streaming prediction (NDJSON in, NDJSON out)',
+            '/predict/whatif': 'POST - Risk change from each single-answer change, and the risk across ages',
+            '/jobs': 'POST - Upload a CSV/JSONL screening file for background scoring',
+            '/jobs/<id>': 'GET - Job status and progress',
+            '/jobs/<id>/events': 'GET - Stream job progress (Server-Sent Events)',
+            '/jobs/<id>/results': 'GET - Download job results (JSONL)',
+            '/history': 'GET - Stored results, newest first (filter by child_id, model, risk_category, from, to)',
+            '/history/<child_id>/trend': 'GET - One child\'s results over time, per model',
+            '/admin/reload': 'POST - Reload changed model files without a restart (needs ASD_ADMIN_TOKEN)',
+            '/health': 'GET - Check API health status',
+            '/metrics': 'GET - Latency histograms (Prometheus text format)'
         }
     })
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
+    models = {name: model_status(name) for name in INSTRUMENTS}
     return jsonify({
         'status': 'healthy',
-        'mchat_model_loaded': MCHAT_MODEL is not None,
-        'aq_model_loaded': AQ_MODEL is not None
+        **{f'{name}_model_loaded': status['loaded'] for name, status in models.items()},
+        'models': models,
+        'cache': result_cache.stats(),
+        'coalescing': coalescer.status(),
+        'admission': admission.status(),
+        'history': history.status(),
+        'mchat_lookup_table': lookup_table.serving_status()
     })
 
 
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    # Load, smoke-test and swap in the current model files in this worker,
+    # then ask every other worker to do the same (model_loader.request_reload).
+    # Requests in flight finish on the version they started with.
+    if not ADMIN_TOKEN:
+        return jsonify({
+            'error': 'Admin endpoints are disabled',
+            'message': 'Set ASD_ADMIN_TOKEN to enable them'
+        }), 403
+    
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    names = request.args.getlist('model') or list(MODEL_SPECS)
+    unknown = [name for name in names if name not in MODEL_SPECS]
+    if unknown:
+        return jsonify({
+            'error': 'Unknown model',
+            'message': f"Models are {', '.join(MODEL_SPECS)}. Provided: {', '.join(unknown)}."
+        }), 400
+    
+    outcomes = {name: reload_model(name) for name in names}
+    rejected = any(outcome['status'] == 'rejected' for outcome in outcomes.values())
+    return jsonify({
+        'pid': os.getpid(),
+        'models': outcomes,
+        # False when the reload marker could not be written: only this
+        # worker reloaded
+        'all_workers': request_reload(names)
+    }), 422 if rejected else 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/predict', methods=['POST'])
+@timed
 def predict():
     try:
-        # Get JSON data from request
-        data = request.get_json()
+        # Get JSON (or packed) data from request
+        with metrics.stage('parse'):
+            data, error = read_payload()
+        if error:
+            return jsonify(error), 400
         
         if not data:
             return jsonify({
@@ -285,35 +322,17 @@ def predict():
             }), 400
         
         age_in_months = data['Age']
+        with metrics.stage('validate'):
+            error = check_age(age_in_months)
+            if not error:
+                model_name, error = instruments.route(age_in_months)
         
-        # M-CHAT: 12-36 months (1-3 years)
-        # AQ: 36-132 months (3-11 years)
+        if error:
+            return jsonify(error), 400
         
-        # Age validation and routing logic based on months:
-        if age_in_months < 12:
-            # Too young for both models
-            return jsonify({
-                'error': 'Age out of range',
-                'message': f'Child is too young ({age_in_months} months / {age_in_months/12:.1f} years). M-CHAT is for 12-36 months minimum.'
-            }), 400
-        
-        elif age_in_months <= 36:
-            # Ages 12-36 months: Use M-CHAT model
-            return predict_mchat_internal(data)
-        
-        elif age_in_months <= 132:
-            # Ages 37-132 months (3-11 years): Use AQ model
-            # Convert months to years for AQ model
-            data['Age'] = age_in_months / 12
-            return predict_aq_internal(data)
-        
-        else:
-            # Age > 132 months (> 11 years): Too old for our models
-            years = age_in_months / 12
-            return jsonify({
-                'error': 'Age out of range',
-                'message': f'Child is too old ({age_in_months} months / {years:.1f} years). Maximum supported: AQ for up to 11 years (132 months). Consider using adult ASD screening tools.'
-            }), 400
+        # Convert months to the model's unit (years for AQ)
+        data['Age'] = instruments.model_age(INSTRUMENTS[model_name], age_in_months)
+        return predict_internal(model_name, data)
         
     except Exception as e:
         return jsonify({
@@ -323,160 +342,751 @@ def predict():
         }), 500
 
 
-@app.route('/predict/mchat', methods=['POST'])
-def predict_mchat():
+def predict_instrument(model_name):
+    # /predict/<name>: one instrument, skipping age routing
+    instrument = INSTRUMENTS[model_name]
     try:
-        data = request.get_json()
+        with metrics.stage('parse'):
+            data, error = read_payload()
+        if error:
+            return jsonify(error), 400
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        # Validate age range for M-CHAT
-        if 'Age' in data and (data['Age'] < 12 or data['Age'] > 36):
-            return jsonify({
-                'error': 'Invalid age for M-CHAT',
-                'message': f'M-CHAT is for ages 12-36 months. Provided: {data["Age"]} months.'
-            }), 400
+        # Validate the age against the instrument's band and convert it to
+        # the model's unit
+        if 'Age' in data:
+            age_in_months = data['Age']
+            error = check_age(age_in_months) or instruments.band_error(instrument, age_in_months)
+            if error:
+                return jsonify(error), 400
+            data['Age'] = instruments.model_age(instrument, age_in_months)
         
-        return predict_mchat_internal(data)
+        return predict_internal(model_name, data)
     
     except Exception as e:
         return jsonify({
-            'error': 'M-CHAT prediction failed',
+            'error': f"{instrument['label']} prediction failed",
             'message': str(e),
             'traceback': traceback.format_exc()
         }), 500
 
 
-@app.route('/predict/aq', methods=['POST'])
-def predict_aq():
+# /predict/mchat, /predict/aq, ... (endpoint names predict_mchat, predict_aq)
+for name in INSTRUMENTS:
+    app.add_url_rule(
+        f'/predict/{name}', f'predict_{name}',
+        timed(functools.partial(predict_instrument, name)), methods=['POST']
+    )
+
+
+# ============================================================================
+# INTERNAL PREDICTION FUNCTIONS
+# ============================================================================
+
+def admitted(handler):
+    # Admission control (see admission.py): wait for one of the model's
+    # scoring slots, or shed the request with 429/503 and Retry-After when
+    # its queue is full or the caller's deadline passes first
+    @functools.wraps(handler)
+    def wrapper(model_name, data):
+        deadline, error = admission.request_deadline(request.headers)
+        if error:
+            return jsonify(error), 400
+        with metrics.stage('admission'):
+            ticket, rejected = admission.admit(model_name, deadline)
+        if rejected:
+            response = jsonify(rejected['body'])
+            response.status_code = rejected['status']
+            response.headers['Retry-After'] = str(rejected['retry_after'])
+            return response
+        try:
+            return handler(model_name, data)
+        finally:
+            admission.release(ticket)
+    return wrapper
+
+
+@admitted
+def predict_internal(model_name, data):
+    # Age must already be in the model's unit (see instruments.model_age)
+    instrument = INSTRUMENTS[model_name]
+    metrics.set_model(model_name)
+    with metrics.stage('load_model'):
+        bundle = get_model(model_name)
+    if bundle is None:
+        return jsonify(model_not_loaded(instrument)), 500
+    
+    # Validate and encode every field in one pass
+    with metrics.stage('validate'):
+        record, errors = schema.validate(instrument['schema'], data)
+    
+    if errors:
+        return jsonify(schema.error_body(instrument['schema'], errors)), 400
+    
+    explaining = explain_requested()
+    if explaining:
+        if bundle['explainer'] is None:
+            return jsonify(explain_unavailable(bundle)), 501
+        result = explain_records(model_name, [record], bundle)[0]
+    else:
+        # Concurrent single requests may be scored together (see coalescer.py)
+        result = coalescer.score_one(model_name, record, bundle, functools.partial(score_model, model_name))
+    history.record([result], [data.get('child_id')], request.endpoint)
+    with metrics.stage('serialize'):
+        if wants_packed() and not explaining:
+            return packed_response([result])
+        return jsonify(result)
+
+
+def score_model(model_name, records, bundle):
+    # Serve records from the result cache and score only the misses, so a
+    # cache hit never touches the preprocessors or the model
+    if not result_cache.enabled():
+        return run_model(model_name, records, bundle)
+    
+    with metrics.stage('cache'):
+        keys = result_cache.cache_keys(model_name, records, bundle['identity'], bundle['threshold'])
+        results = [result_cache.get(key) if key else None for key in keys]
+    misses = [i for i, result in enumerate(results) if result is None]
+    
+    if misses:
+        scored = run_model(model_name, [records[i] for i in misses], bundle)
+        for i, result in zip(misses, scored):
+            results[i] = result
+            if keys[i]:
+                result_cache.put(keys[i], result)
+    
+    # Echo each request's own Age (24 and 24.0 share a cache entry)
+    return [dict(result, age=record['Age']) for result, record in zip(results, records)]
+
+
+def apply_threshold(bundle, prediction_probas):
+    """Derive labels from class probabilities.
+
+    With no threshold configured this is the rule scikit-learn's predict()
+    applies to tree ensembles: the most probable class, ties going to the
+    first. Otherwise a record is labelled ASD when its ASD probability is
+    at least the model's threshold.
+    """
+    classes = bundle['model'].classes_
+    if bundle['threshold'] is None:
+        return classes.take(np.argmax(prediction_probas, axis=1))
+    return classes.take((prediction_probas[:, 1] >= bundle['threshold']).astype(np.int64))
+
+
+def infer(bundle, X):
+    # Evaluate the model once; the label comes from the same probabilities
+    # instead of a second pass through predict()
+    with metrics.stage('predict_proba'):
+        prediction_probas = bundle['model'].predict_proba(X)
+    return apply_threshold(bundle, prediction_probas), prediction_probas
+
+
+def run_model(model_name, records, bundle):
+    # Records covered by a lookup table built from this model (M-CHAT only,
+    # see lookup_table.py) are read from it; the rest are preprocessed into
+    # one frame and scored in one call
+    predictions = np.zeros(len(records), dtype=np.int64)
+    prediction_probas = np.zeros((len(records), 2))
+    pending = np.arange(len(records))
+    
+    table = lookup_table.active_table(bundle)
+    if table is not None:
+        with metrics.stage('lookup_table'):
+            served, predictions, prediction_probas = lookup_table.lookup(table, records)
+        pending = np.flatnonzero(~served)
+        lookup_table.record_hits(len(records) - len(pending))
+        if bundle['threshold'] is not None:
+            # The table stores labels for the default rule; re-decide them
+            # from the stored (quantized) probabilities
+            predictions[served] = apply_threshold(bundle, prediction_probas[served])
+    
+    if len(pending):
+        with metrics.stage('preprocess'):
+            X = preprocess_data(model_name, [records[i] for i in pending], bundle['plan'])
+        predictions[pending], prediction_probas[pending] = infer(bundle, X)
+    
+    age_unit = INSTRUMENTS[model_name]['age_unit']
+    return [
+        format_prediction(model_name, bundle['version'], record['Age'], age_unit, prediction, proba)
+        for record, prediction, proba in zip(records, predictions, prediction_probas)
+    ]
+
+
+# ============================================================================
+# EXPLANATIONS
+# ============================================================================
+
+def explain_requested():
+    return request.args.get('explain', '').lower() in ('1', 'true', 'yes')
+
+
+def explain_unavailable(bundle):
+    return {
+        'error': 'Explanation unavailable',
+        'message': f"The {MODEL_SPECS[bundle['name']]['label']} model cannot be explained: {bundle['explain_error']}"
+    }
+
+
+def explanation_body(explainer, features, feature_contributions, input_contributions):
+    # Payload fields in question order (a list: jsonify sorts dict keys),
+    # then the features that moved this prediction most. Values are the model inputs the trees compared.
+    top = np.argsort(-np.abs(feature_contributions), kind='stable')[:EXPLAIN_TOP_FEATURES]
+    return {
+        'method': 'tree_path',
+        'units': explainer.units,
+        'base_value': explainer.bias,
+        'questions': [
+            {'field': field, 'contribution': float(contribution)}
+            for field, contribution in zip(explainer.input_fields, input_contributions)
+        ],
+        'top_features': [
+            {
+                'feature': explainer.feature_names[i],
+                'value': float(features[i]),
+                'contribution': float(feature_contributions[i]),
+            }
+            for i in top
+        ],
+    }
+
+
+def explain_records(model_name, records, bundle):
+    """Score validated records and attach an explanation to each result.
+
+    Explained records skip the result cache, the lookup table and request
+    coalescing: they need the feature matrix the explainer walks anyway.
+    """
+    age_unit = INSTRUMENTS[model_name]['age_unit']
+    with metrics.stage('preprocess'):
+        X = preprocess_data(model_name, records, bundle['plan'])
+    predictions, prediction_probas = infer(bundle, X)
+
+    explainer = bundle['explainer']
+    with metrics.stage('explain'):
+        features = X.to_numpy()
+        feature_contributions, input_contributions = explainer.explain(features)
+
+    return [
+        dict(
+            format_prediction(model_name, bundle['version'], record['Age'], age_unit, prediction, proba),
+            explanation=explanation_body(explainer, *rows)
+        )
+        for record, prediction, proba, *rows in zip(
+            records, predictions, prediction_probas, features, feature_contributions, input_contributions
+        )
+    ]
+
+
+# ============================================================================
+# BATCH PREDICTION
+# ============================================================================
+
+def route_batch(records):
+    """Validate records and split them into per-model groups.
+
+    Returns (groups, errors): groups maps a model name to a list of
+    (index, record) pairs ready for scoring, errors maps an input index to
+    the error body for that record. Scored records are the encoded rows from
+    schema.validate(), with Age in the model's unit (years for AQ).
+    """
+    groups = {name: [] for name in INSTRUMENTS}
+    errors = {}
+    
+    for index, record in enumerate(records):
+        if not isinstance(record, dict) or not record:
+            errors[index] = {'error': 'No data provided'}
+            continue
+        
+        if 'Age' not in record:
+            errors[index] = {
+                'error': 'Missing required field: Age',
+                'message': 'Age is required to determine which model to use'
+            }
+            continue
+        
+        error = check_age(record['Age'])
+        if not error:
+            model_name, error = instruments.route(record['Age'])
+        
+        if error:
+            errors[index] = error
+            continue
+        
+        instrument = INSTRUMENTS[model_name]
+        record = dict(record, Age=instruments.model_age(instrument, record['Age']))
+        
+        model_schema = instrument['schema']
+        row, field_errors = schema.validate(model_schema, record)
+        if field_errors:
+            errors[index] = schema.error_body(model_schema, field_errors)
+            continue
+        
+        groups[model_name].append((index, row))
+    
+    return groups, errors
+
+
+def score_group(model_name, group, explain=False):
+    """Score one routed group, returning a result or error per input index."""
+    instrument = INSTRUMENTS[model_name]
+    bundle = get_model(model_name)
+    
+    if bundle is None:
+        error = model_not_loaded(instrument)
+        return {index: error for index, _ in group}
+    
+    score = functools.partial(score_model, model_name)
+    if explain:
+        if bundle['explainer'] is None:
+            return {index: explain_unavailable(bundle) for index, _ in group}
+        score = functools.partial(explain_records, model_name)
+    
+    indices = [index for index, _ in group]
+    records = [record for _, record in group]
+    
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
+        return dict(zip(indices, score(records, bundle)))
+    except Exception:
+        if len(group) == 1:
+            raise
+    
+    # One bad record fails the whole vectorized call, so fall back to
+    # scoring one by one to report errors against the offending records
+    results = {}
+    for index, record in group:
+        try:
+            results[index] = score([record], bundle)[0]
+        except Exception as e:
+            results[index] = {
+                'error': f'{instrument["label"]} prediction failed',
+                'message': str(e)
+            }
+    return results
+
+
+def score_records(records, explain=False):
+    """Route, validate and score a list of records of any ages.
+
+    Returns one result or error body per record, in input order. Each model
+    is called once for its whole group. With explain, each result carries
+    an explanation (see explain_records).
+    """
+    with metrics.stage('validate'):
+        groups, results = route_batch(records)
+    
+    for model_name, group in groups.items():
+        if not group:
+            continue
+        try:
+            results.update(score_group(model_name, group, explain))
+        except Exception as e:
+            results.update({
+                index: {
+                    'error': f'{INSTRUMENTS[model_name]["label"]} prediction failed',
+                    'message': str(e)
+                }
+                for index, _ in group
+            })
+    
+    ordered = [results[index] for index in range(len(records))]
+    
+    # Queued for the history store, written off the request path
+    history.record(
+        ordered,
+        [record.get('child_id') if isinstance(record, dict) else None for record in records],
+        request.endpoint if has_request_context() else 'job'
+    )
+    return ordered
+
+
+@app.route('/predict/batch', methods=['POST'])
+@timed
+def predict_batch():
+    try:
+        metrics.set_model('mixed')
+        with metrics.stage('parse'):
+            data, error = read_payload(single=False)
+        if error:
+            return jsonify(error), 400
         
-        # Validate age range for AQ and convert to years
-        if 'Age' in data:
-            age_in_months = data['Age']
-            if age_in_months < 36 or age_in_months > 132:
-                return jsonify({
-                    'error': 'Invalid age for AQ',
-                    'message': f'AQ is for ages 36-132 months (3-11 years). Provided: {age_in_months} months.'
-                }), 400
-            # Convert to years
-            data['Age'] = age_in_months / 12
+        # Accept a bare list or {"records": [...]} (or a packed body)
+        records = data.get('records') if isinstance(data, dict) else data
+        
+        if not isinstance(records, list) or not records:
+            return jsonify({
+                'error': 'No data provided',
+                'message': 'Please send a JSON list of records (or {"records": [...]}) in the request body'
+            }), 400
+        
+        if len(records) > BATCH_MAX_RECORDS:
+            return jsonify({
+                'error': 'Batch too large',
+                'message': f'At most {BATCH_MAX_RECORDS} records are accepted per request. Provided: {len(records)}.'
+            }), 413
+        
+        explaining = explain_requested()
+        results = score_records(records, explain=explaining)
+        if wants_packed() and not explaining:
+            with metrics.stage('serialize'):
+                return packed_response(results)
         
-        return predict_aq_internal(data)
+        # Results come back in input order, each tagged with its index
+        ordered = [dict(result, index=index) for index, result in enumerate(results)]
+        failed = sum(1 for result in ordered if 'error' in result)
+        
+        with metrics.stage('serialize'):
+            return jsonify({
+                'count': len(ordered),
+                'succeeded': len(ordered) - failed,
+                'failed': failed,
+                'results': ordered
+            })
     
     except Exception as e:
         return jsonify({
-            'error': 'AQ prediction failed',
+            'error': 'Batch prediction failed',
             'message': str(e),
             'traceback': traceback.format_exc()
         }), 500
 
 
+def stream_results(lines):
+    """Yield one NDJSON result line per input line, a micro-batch at a time.
+
+    Only one micro-batch of records and results is held at once, so memory
+    stays flat however long the stream is. Errors are reported on the
+    offending line and never end the stream.
+    """
+    index = 0
+    for chunk in jobs.chunks(jobs.parse_json_lines(lines), STREAM_BATCH_ROWS):
+        try:
+            results = jobs.score_chunk(chunk, score_records)
+        except Exception as e:
+            results = [{'error': 'Prediction failed', 'message': str(e)}] * len(chunk)
+        
+        yield ''.join(
+            json.dumps(dict(result, index=index + offset)) + '\n'
+            for offset, result in enumerate(results)
+        )
+        index += len(chunk)
+
+
+@app.route('/predict/stream', methods=['POST'])
+def predict_stream():
+    # Newline-delimited JSON in, one result line per record out, in order.
+    # The body is read while results are written, never buffered whole.
+    return Response(
+        stream_with_context(stream_results(request.stream)),
+        mimetype='application/x-ndjson'
+    )
+
+
 # ============================================================================
-# INTERNAL PREDICTION FUNCTIONS
+# WHAT-IF ANALYSIS
 # ============================================================================
 
-def predict_mchat_internal(data):
-    if MCHAT_MODEL is None:
-        return jsonify({
-            'error': 'M-CHAT model not loaded',
-            'message': 'The M-CHAT model file could not be loaded'
-        }), 500
-    
-    # Note: Age is always in months for M-CHAT (12-36 months)
-    
-    # Validate required fields
-    required_fields = ['Age', 'Gender', 'Jaundice', 'Family_ASD_History'] + [f'Q{i}' for i in range(1, 24)]
-    missing_fields = [field for field in required_fields if field not in data]
-    
-    if missing_fields:
-        return jsonify({
-            'error': 'Missing required fields',
-            'missing_fields': missing_fields
-        }), 400
-    
-    # Preprocess data
-    X = preprocess_mchat_data(data)
+def answer_label(model_name, value):
+    # M-CHAT answers read back as they are sent; AQ scores are numbers
+    labels = INSTRUMENTS[model_name]['answer_labels']
+    return labels[value] if labels else value
+
+
+def risk_point(prediction, prediction_proba, base_risk=None):
+    risk_percentage = round(float(prediction_proba[1]) * 100, 2)
+    point = {
+        'prediction': int(prediction),
+        'risk_percentage': risk_percentage,
+        'risk_category': categorize_risk(risk_percentage),
+    }
+    if base_risk is not None:
+        point['risk_change'] = round(risk_percentage - base_risk, 2)
+    return point
+
+
+def whatif_group(model_name, group):
+    """Analyse every child of one routed group with a single model call.
+
+    Returns (results by input index, variants requested, variants scored).
+    """
+    instrument = INSTRUMENTS[model_name]
+    bundle = get_model(model_name)
+    if bundle is None:
+        return {index: model_not_loaded(instrument) for index, _ in group}, 0, 0
     
-    # Make prediction
-    prediction = MCHAT_MODEL.predict(X)[0]
-    prediction_proba = MCHAT_MODEL.predict_proba(X)[0]
+    # Each child's own row, then its answer variants, then its age variants,
+    # all in one list; identical rows (within a child or across children)
+    # are scored once
+    children = []
+    rows = []
+    for index, row in group:
+        answers = list(whatif.answer_variants(model_name, row))
+        ages = list(whatif.age_variants(model_name, row))
+        children.append((index, row, answers, ages, len(rows)))
+        rows.append(row)
+        rows.extend(variant for _, _, variant in answers)
+        rows.extend(variant for _, variant in ages)
+    unique_rows, positions = whatif.dedupe(rows)
     
-    # Get risk probability (probability of ASD class)
-    risk_probability = prediction_proba[1]
-    risk_percentage = risk_probability * 100
+    with metrics.stage('preprocess'):
+        X = preprocess_data(model_name, unique_rows, bundle['plan'])
+    predictions, prediction_probas = infer(bundle, X)
+    predictions = predictions[positions]
+    prediction_probas = prediction_probas[positions]
     
-    # Categorize risk
-    risk_category = categorize_risk(risk_percentage)
+    age_unit = instrument['age_unit']
+    results = {}
+    for index, row, answers, ages, start in children:
+        result = format_prediction(
+            model_name, bundle['version'], row['Age'], age_unit, predictions[start], prediction_probas[start]
+        )
+        base_risk = result['risk_percentage']
+        
+        changes = []
+        for offset, (question, alternative, _) in enumerate(answers, start + 1):
+            changes.append({
+                'question': question,
+                'answer': answer_label(model_name, row[question]),
+                'alternative': answer_label(model_name, alternative),
+                **risk_point(predictions[offset], prediction_probas[offset], base_risk),
+            })
+        # Largest effect first: the answers that drive this result
+        changes.sort(key=lambda change: -abs(change['risk_change']))
+        
+        curve_start = start + 1 + len(answers)
+        result['answer_changes'] = changes
+        result['age_curve'] = [
+            {'age_months': months, **risk_point(predictions[offset], prediction_probas[offset])}
+            for offset, (months, _) in enumerate(ages, curve_start)
+        ]
+        results[index] = result
     
-    return jsonify({
-        'model_used': 'mchat',
-        'age': data['Age'],
-        'age_unit': 'months',
-        'prediction': int(prediction),
-        'prediction_label': 'ASD' if prediction == 1 else 'No ASD',
-        'confidence': float(risk_probability),
-        'risk_percentage': float(round(risk_percentage, 2)),
-        'risk_category': risk_category,
-        'probabilities': {
-            'no_asd': float(prediction_proba[0]),
-            'asd': float(prediction_proba[1])
-        },
-    })
+    return results, len(rows), len(unique_rows)
 
 
-def predict_aq_internal(data):
-    if AQ_MODEL is None:
+@app.route('/predict/whatif', methods=['POST'])
+@timed
+def predict_whatif():
+    # Same payloads as /predict (one record) or /predict/batch (a list)
+    try:
+        with metrics.stage('parse'):
+            data = request.get_json()
+        single = isinstance(data, dict) and 'records' not in data
+        records = [data] if single else (data.get('records') if isinstance(data, dict) else data)
+        
+        if not isinstance(records, list) or not records:
+            return jsonify({
+                'error': 'No data provided',
+                'message': 'Please send one JSON record, or a list of records, in the request body'
+            }), 400
+        
+        if len(records) > WHATIF_MAX_RECORDS:
+            return jsonify({
+                'error': 'Batch too large',
+                'message': f'At most {WHATIF_MAX_RECORDS} records are accepted per request. Provided: {len(records)}.'
+            }), 413
+        
+        with metrics.stage('validate'):
+            groups, results = route_batch(records)
+        
+        models = [name for name, group in groups.items() if group]
+        metrics.set_model(models[0] if len(models) == 1 else 'mixed')
+        variants = scored = 0
+        for model_name in models:
+            group_results, group_variants, group_scored = whatif_group(model_name, groups[model_name])
+            results.update(group_results)
+            variants += group_variants
+            scored += group_scored
+        
+        with metrics.stage('serialize'):
+            if single:
+                result = results[0]
+                return jsonify(result), 400 if 'error' in result else 200
+            
+            ordered = [dict(results[index], index=index) for index in range(len(records))]
+            return jsonify({
+                'count': len(ordered),
+                'variants': variants,
+                'unique_variants': scored,
+                'results': ordered
+            })
+    
+    except Exception as e:
         return jsonify({
-            'error': 'AQ model not loaded',
-            'message': 'The AQ model file could not be loaded'
+            'error': 'What-if analysis failed',
+            'message': str(e),
+            'traceback': traceback.format_exc()
         }), 500
+
+
+# ============================================================================
+# ASYNCHRONOUS JOBS
+# ============================================================================
+
+# Jobs left queued or running by a server process that has since stopped
+# (see jobs.py); later ones are caught when they are next read
+jobs.recover_stale_jobs()
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    try:
+        # Multipart upload (field "file") or the raw file as the request body
+        upload = request.files.get('file')
+        filename = upload.filename if upload else request.args.get('filename')
+        fmt = jobs.detect_format(
+            filename,
+            upload.mimetype if upload else request.content_type,
+            request.args.get('format')
+        )
+        
+        if fmt not in jobs.JOB_FORMATS:
+            return jsonify({
+                'error': 'Unsupported file format',
+                'message': 'Upload a .csv or .jsonl file, or pass ?format=csv or ?format=jsonl'
+            }), 400
+        
+        job = jobs.create_job(upload.stream if upload else request.stream, fmt, filename)
+        jobs.submit(job['id'], score_records)
+        
+        return jsonify({
+            'job_id': job['id'],
+            'status': job['status'],
+            'status_url': f"/jobs/{job['id']}",
+            'events_url': f"/jobs/{job['id']}/events",
+            'results_url': f"/jobs/{job['id']}/results"
+        }), 202
     
-    # Note: Age has already been converted to years in the main predict() function
-    
-    # Validate required fields
-    required_fields = ['Age', 'Gender', 'Jaundice', 'Family_ASD_History'] + [f'Q{i}' for i in range(1, 31)]
-    missing_fields = [field for field in required_fields if field not in data]
+    except Exception as e:
+        return jsonify({
+            'error': 'Job submission failed',
+            'message': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    # Server-Sent Events: one status message per second until the job ends
+    if jobs.get_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return Response(jobs.job_events(job_id), mimetype='text/event-stream')
+
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
     
-    if missing_fields:
+    if job['status'] != 'completed':
         return jsonify({
-            'error': 'Missing required fields',
-            'missing_fields': missing_fields
-        }), 400
+            'error': 'Results not ready',
+            'message': f"Job is {job['status']}",
+            'status_url': f'/jobs/{job_id}'
+        }), 409
     
-    # Preprocess data
-    X = preprocess_aq_data(data)
+    return send_file(
+        jobs.results_path(job_id),
+        mimetype='application/x-ndjson',
+        as_attachment=True,
+        download_name=f'{job_id}-results.jsonl'
+    )
+
+
+# ============================================================================
+# RESULT HISTORY
+# ============================================================================
+
+def history_disabled():
+    return jsonify({
+        'error': 'History store is disabled',
+        'message': 'Set ASD_RESULT_DB to a SQLite file path to keep results'
+    }), 503
+
+
+def history_filters(args):
+    # Query arguments of GET /history as query_history() keywords.
+    # Returns (filters, None) or (None, error_body).
+    filters = {
+        'child_id': args.get('child_id'),
+        'model': args.get('model'),
+        'risk_category': args.get('risk_category'),
+        'cursor': args.get('cursor'),
+    }
+    if filters['model'] is not None and filters['model'] not in MODEL_SPECS:
+        return None, {'error': 'Invalid model', 'message': f"model must be one of: {', '.join(MODEL_SPECS)}"}
+    if filters['risk_category'] is not None and filters['risk_category'] not in history.RISK_CATEGORIES:
+        return None, {
+            'error': 'Invalid risk_category',
+            'message': f"risk_category must be one of: {', '.join(history.RISK_CATEGORIES)}"
+        }
     
-    # Make prediction
-    prediction = AQ_MODEL.predict(X)[0]
-    prediction_proba = AQ_MODEL.predict_proba(X)[0]
+    try:
+        limit = int(args.get('limit', history.HISTORY_DEFAULT_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= history.HISTORY_MAX_LIMIT:
+        return None, {'error': 'Invalid limit', 'message': f'limit must be 1-{history.HISTORY_MAX_LIMIT}'}
+    filters['limit'] = limit
     
-    # Get risk probability
-    risk_probability = prediction_proba[1]
-    risk_percentage = risk_probability * 100
+    for arg, keyword in (('from', 'since'), ('to', 'until')):
+        try:
+            filters[keyword] = history.parse_time(args[arg]) if arg in args else None
+        except ValueError:
+            return None, {
+                'error': f'Invalid {arg}',
+                'message': f'{arg} must be an ISO 8601 date or datetime, e.g. 2025-01-31 or 2025-01-31T08:00:00Z'
+            }
     
-    # Categorize risk
-    risk_category = categorize_risk(risk_percentage)
+    if filters['cursor'] is not None:
+        try:
+            history.decode_cursor(filters['cursor'])
+        except ValueError:
+            return None, {'error': 'Invalid cursor', 'message': 'Pass next_cursor from the previous page unchanged'}
+    return filters, None
+
+
+@app.route('/history', methods=['GET'])
+def result_history():
+    if not history.enabled():
+        return history_disabled()
     
+    filters, error = history_filters(request.args)
+    if error:
+        return jsonify(error), 400
+    
+    # Results this worker still has queued become visible to its own reads
+    history.flush()
+    results, next_cursor = history.query_history(**filters)
     return jsonify({
-        'model_used': 'aq',
-        'age': data['Age'],
-        'age_unit': 'years',
-        'prediction': int(prediction),
-        'prediction_label': 'ASD' if prediction == 1 else 'No ASD',
-        'confidence': float(risk_probability),
-        'risk_percentage': float(round(risk_percentage, 2)),
-        'risk_category': risk_category,
-        'probabilities': {
-            'no_asd': float(prediction_proba[0]),
-            'asd': float(prediction_proba[1])
-        },
+        'count': len(results),
+        'results': results,
+        'next_cursor': next_cursor
     })
 
 
+@app.route('/history/<child_id>/trend', methods=['GET'])
+def child_trend(child_id):
+    if not history.enabled():
+        return history_disabled()
+    
+    history.flush()
+    trend = history.child_trend(child_id)
+    if not trend['count']:
+        return jsonify({'error': 'No results for this child', 'child_id': child_id}), 404
+    return jsonify(trend)
+
+
 # ============================================================================
 # RUN THE APPLICATION
 # ============================================================================
@@ -489,12 +1099,25 @@ if __name__ == '__main__':
     print("\nAvailable endpoints:")
     print("  - GET  /            : API information")
     print("  - GET  /health      : Health check")
+    print("  - GET  /metrics     : Latency histograms (Prometheus format)")
     print("  - POST /predict     : Auto-route prediction based on age")
-    print("  - POST /predict/mchat : M-CHAT prediction (12-36 months)")
-    print("  - POST /predict/aq    : AQ prediction (3-11 years)")
+    for name, instrument in INSTRUMENTS.items():
+        print(f"  - POST /predict/{name:<6}: {instrument['label']} prediction ({instrument['age_range']})")
+    print("  - POST /predict/batch : Batch prediction (list of records, mixed ages)")
+    print("  - POST /predict/stream : Streaming prediction (NDJSON in, NDJSON out)")
+    print("  - POST /predict/whatif : What-if analysis (answer changes and risk by age)")
+    print("  - POST /jobs          : Upload a CSV/JSONL file for background scoring")
+    print("  - GET  /history       : Stored results (needs ASD_RESULT_DB)")
+    print("  - POST /admin/reload  : Reload changed model files (needs ASD_ADMIN_TOKEN)")
+    print("\nThis is the development server. For production run gunicorn, which")
+    print("uses gunicorn.conf.py and shares the preloaded models across workers:")
+    print("  gunicorn app:app")
     print("\n" + "=" * 80 + "\n")
     
+    # Hot-reload changed model files if ASD_MODEL_WATCH_SECONDS is set
+    start_watcher()
+    
     # Run Flask app
     # debug=True enables auto-reload when you change code
-    # Set to False in production
+    # Production traffic should go through gunicorn (see gunicorn.conf.py)
     app.run(host='0.0.0.0', port=5000, debug=True)
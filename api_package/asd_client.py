@@ -0,0 +1,67 @@
+"""Python client for the ASD screening API.
+
+Sends predictions in the packed binary format (see packed.py) by default:
+about 18 bytes per child instead of 600-800 bytes of JSON, and no JSON
+parsing on either side. Payloads are the same dicts the JSON API takes.
+
+    from asd_client import ScreeningClient
+
+    client = ScreeningClient('http://localhost:5000')
+    client.predict({'Age': 24, 'Gender': 'male', ..., 'Q23': 'no'})
+    client.predict_batch(records)
+
+Packed results hold model_used, prediction and probabilities; failed batch
+records come back as their error body. Pass packed=False for the full JSON
+results.
+"""
+import requests
+
+import packed
+
+
+class ScreeningAPIError(Exception):
+    """A request the API rejected as a whole (bad payload, model missing...)."""
+
+    def __init__(self, status_code, body):
+        super().__init__(f"{status_code}: {body.get('error')} - {body.get('message', '')}")
+        self.status_code = status_code
+        self.body = body
+
+
+class ScreeningClient:
+    def __init__(self, base_url='http://localhost:5000', packed=True, timeout=60, session=None):
+        self.base_url = base_url.rstrip('/')
+        self.packed = packed
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def post(self, path, records, single):
+        if not self.packed:
+            body = records[0] if single else records
+            response = self.session.post(self.base_url + path, json=body, timeout=self.timeout)
+        else:
+            # /predict/<name> takes that instrument's answers whatever the age
+            model_name = path.rsplit('/', 1)[-1]
+            response = self.session.post(
+                self.base_url + path,
+                data=packed.encode_records(records, model_name if model_name in packed.MODEL_CODES else None),
+                headers={'Content-Type': packed.PACKED_MIMETYPE, 'Accept': packed.PACKED_MIMETYPE},
+                timeout=self.timeout
+            )
+
+        # Errors about the request as a whole are always JSON
+        if response.status_code != 200:
+            raise ScreeningAPIError(response.status_code, response.json())
+        if response.headers.get('Content-Type', '').startswith(packed.PACKED_MIMETYPE):
+            return packed.decode_results(response.content)
+        return response.json()
+
+    def predict(self, record, path='/predict'):
+        """Score one child; path may also be /predict/<name>, e.g. /predict/mchat."""
+        result = self.post(path, [record], single=True)
+        return result[0] if self.packed else result
+
+    def predict_batch(self, records):
+        """Score a list of children of any ages, one result per record."""
+        results = self.post('/predict/batch', list(records), single=False)
+        return results if self.packed else results['results']
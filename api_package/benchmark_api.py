@@ -0,0 +1,401 @@
+"""Load test and latency benchmark for the screening API.
+
+Runs synthetic M-CHAT and AQ payloads (ages 12-132 months) through the
+API and reports throughput and p50/p95/p99 latency per scenario:
+
+    mchat   POST /predict with M-CHAT payloads (12-36 months)
+    aq      POST /predict with AQ payloads (37-132 months)
+    mixed   POST /predict with ages across the whole range
+    batch   POST /predict/batch with --batch-size mixed records per request
+
+In-process through the Flask test client (no network, no server):
+    python benchmark_api.py --target inprocess
+
+Against a local gunicorn server started for the run, or a running one:
+    python benchmark_api.py --target server --server-workers 4
+    python benchmark_api.py --target server --url http://localhost:5000
+
+Common options:
+    --scenarios mchat batch   --requests 2000   --concurrency 16
+    --batch-size 100          --no-cache        --out results.json
+    --format packed           (binary bodies, see packed.py)
+
+When mchat_model.pkl / aq_model.pkl are missing from the model directory,
+stand-in random forests are trained on synthetic data so the benchmark
+runs offline; results then say "stand_in_models": true. --out writes the
+results as JSON (with the git commit) so runs can be compared between
+commits.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import model_loader
+import packed
+import schema
+from features import AQ_QUESTION_FIELDS, MCHAT_QUESTION_FIELDS
+from instruments import INSTRUMENTS
+from model_loader import MODEL_DIR, MODEL_SPECS
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# ============================================================================
+# SYNTHETIC PAYLOADS
+# ============================================================================
+
+def mchat_payload(rng, age=None):
+    payload = {
+        'Age': int(age if age is not None else rng.integers(12, 37)),
+        'Gender': str(rng.choice(['male', 'female'])),
+        'Jaundice': str(rng.choice(['yes', 'no'], p=[0.2, 0.8])),
+        'Family_ASD_History': str(rng.choice(['yes', 'no'], p=[0.15, 0.85])),
+    }
+    answers = rng.random(len(MCHAT_QUESTION_FIELDS)) < 0.75
+    payload.update({field: 'yes' if answer else 'no' for field, answer in zip(MCHAT_QUESTION_FIELDS, answers)})
+    return payload
+
+
+def aq_payload(rng, age=None):
+    payload = {
+        'Age': int(age if age is not None else rng.integers(37, 133)),
+        'Gender': str(rng.choice(['male', 'female'])),
+        'Jaundice': str(rng.choice(['yes', 'no'], p=[0.2, 0.8])),
+        'Family_ASD_History': str(rng.choice(['yes', 'no'], p=[0.15, 0.85])),
+    }
+    payload.update({field: int(score) for field, score in zip(AQ_QUESTION_FIELDS, rng.integers(0, 4, size=30))})
+    return payload
+
+
+def mixed_payload(rng):
+    # Every routable age is equally likely, so about a fifth go to M-CHAT
+    age = int(rng.integers(12, 133))
+    return mchat_payload(rng, age) if age <= 36 else aq_payload(rng, age)
+
+
+PAYLOADS = {
+    'mchat': mchat_payload,
+    'aq': aq_payload,
+    'mixed': mixed_payload,
+}
+
+
+FORMATS = {
+    'json': {'Content-Type': 'application/json', 'Accept': 'application/json'},
+    'packed': {'Content-Type': packed.PACKED_MIMETYPE, 'Accept': packed.PACKED_MIMETYPE},
+}
+
+
+def encode_body(body, fmt):
+    # Bodies are encoded up front so client-side encoding is not timed
+    if fmt == 'packed':
+        return packed.encode_records(body if isinstance(body, list) else [body])
+    return json.dumps(body).encode('utf-8')
+
+
+def build_requests(scenario, count, batch_size, seed, fmt='json'):
+    """Return (path, encoded bodies, records per request) for one scenario."""
+    rng = np.random.default_rng(seed)
+    if scenario == 'batch':
+        bodies = [[mixed_payload(rng) for _ in range(batch_size)] for _ in range(count)]
+        path, records_per_request = '/predict/batch', batch_size
+    else:
+        bodies = [PAYLOADS[scenario](rng) for _ in range(count)]
+        path, records_per_request = '/predict', 1
+    return path, [encode_body(body, fmt) for body in bodies], records_per_request
+
+
+# ============================================================================
+# STAND-IN MODELS
+# ============================================================================
+
+def models_present(model_dir):
+    return all(os.path.exists(os.path.join(model_dir, spec['model_file'])) for spec in MODEL_SPECS.values())
+
+
+def make_stand_in_models(model_dir, rows=5000, seed=0):
+    """Train random forests on synthetic payloads into model_dir.
+
+    They use the real feature lists and feature engines, so preprocessing
+    and inference cost what they would with the real models of this size;
+    only their predictions are meaningless.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+
+    rng = np.random.default_rng(seed)
+    for name, spec in MODEL_SPECS.items():
+        shutil.copy(os.path.join(MODEL_DIR, spec['features_file']), model_dir)
+        features = list(joblib.load(os.path.join(model_dir, spec['features_file'])))
+        instrument = INSTRUMENTS[name]
+        plan = instrument['compile_plan'](features)
+
+        if name == 'mchat':
+            records = [mchat_payload(rng) for _ in range(rows)]
+            X = instrument['preprocess'](records, plan)
+            y = X[:, features.index('Total_Failed_Count')] >= 6
+        else:
+            # Encoded the way the API encodes them: validated rows, age in years
+            records = [schema.validate(instrument['schema'], aq_payload(rng))[0] for _ in range(rows)]
+            for record in records:
+                record['Age'] /= 12
+            X = instrument['preprocess'](records, plan)
+            y = X[:, features.index('AQ_Total')] >= 47
+        # Flip some labels so the trees grow to a realistic depth
+        y = np.where(rng.random(rows) < 0.1, ~y, y).astype(int)
+
+        model = RandomForestClassifier(n_estimators=100, random_state=seed, n_jobs=1)
+        model.fit(pd.DataFrame(X, columns=features), y)
+        joblib.dump(model, os.path.join(model_dir, spec['model_file']))
+
+
+# ============================================================================
+# TARGETS
+# ============================================================================
+
+class InProcessTarget:
+    """Calls the app through Flask test clients, one per thread."""
+
+    def __init__(self):
+        import app as api
+        self.app = api.app
+        self.local = threading.local()
+
+    def post(self, path, data, headers):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.post(path, data=data, headers=headers)
+        return response.status_code, response.get_data()
+
+    def close(self):
+        pass
+
+
+class ServerTarget:
+    """Sends HTTP requests to a server, one keep-alive session per thread."""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.local = threading.local()
+
+    def post(self, path, data, headers):
+        import requests
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        response = session.post(self.url + path, data=data, headers=headers, timeout=60)
+        return response.status_code, response.content
+
+    def close(self):
+        pass
+
+
+class SpawnedServerTarget(ServerTarget):
+    """Starts gunicorn on a free local port for the length of the run."""
+
+    def __init__(self, env, workers):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        # Short graceful timeout: idle keep-alive connections hold up shutdown
+        env = dict(env, ASD_API_BIND=f'127.0.0.1:{port}', ASD_API_ACCESS_LOG=os.devnull,
+                   ASD_API_GRACEFUL_TIMEOUT='2')
+        if workers:
+            env['ASD_API_WORKERS'] = str(workers)
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'app:app'],
+            cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        super().__init__(f'http://127.0.0.1:{port}')
+        self.wait_until_ready()
+
+    def wait_until_ready(self, timeout=60):
+        import requests
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError('gunicorn exited during start-up')
+            try:
+                if requests.get(self.url + '/health', timeout=1).status_code == 200:
+                    return
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f'server at {self.url} did not become ready')
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+# ============================================================================
+# RUNNING
+# ============================================================================
+
+def run_scenario(target, scenario, count, concurrency, batch_size, warmup, seed, fmt='json'):
+    path, bodies, records_per_request = build_requests(scenario, count + warmup, batch_size, seed, fmt)
+    headers = FORMATS[fmt]
+    for body in bodies[:warmup]:
+        target.post(path, body, headers)
+    bodies = bodies[warmup:]
+
+    latencies = np.zeros(len(bodies))
+    errors = []
+    next_index = iter(range(len(bodies)))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                i = next(next_index, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                status, content = target.post(path, bodies[i], headers)
+                if status != 200:
+                    # Whole-request errors are JSON in either format
+                    errors.append(f'{status}: {json.loads(content).get("error")}')
+            except Exception as e:
+                errors.append(str(e))
+            latencies[i] = time.perf_counter() - start
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        'scenario': scenario,
+        'path': path,
+        'format': fmt,
+        'request_bytes': round(float(np.mean([len(body) for body in bodies])), 1),
+        'requests': len(bodies),
+        'records_per_request': records_per_request,
+        'concurrency': concurrency,
+        'errors': len(errors),
+        'first_errors': errors[:5],
+        'seconds': round(elapsed, 4),
+        'requests_per_second': round(len(bodies) / elapsed, 2),
+        'records_per_second': round(len(bodies) * records_per_request / elapsed, 2),
+        'latency_ms': {
+            'mean': round(float(latencies.mean()) * 1000, 3),
+            'p50': round(float(p50), 3),
+            'p95': round(float(p95), 3),
+            'p99': round(float(p99), 3),
+            'max': round(float(latencies.max()) * 1000, 3),
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=API_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print("\n" + "=" * 80)
+    print(f"{'scenario':<10} {'requests':>8} {'errors':>6} {'req/s':>9} {'records/s':>10} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    print("=" * 80)
+    for result in results:
+        latency = result['latency_ms']
+        print(f"{result['scenario']:<10} {result['requests']:>8} {result['errors']:>6} "
+              f"{result['requests_per_second']:>9.1f} {result['records_per_second']:>10.1f} "
+              f"{latency['p50']:>8.2f} {latency['p95']:>8.2f} {latency['p99']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=['inprocess', 'server'], default='inprocess')
+    parser.add_argument('--url', help='benchmark a running server instead of starting one')
+    parser.add_argument('--server-workers', type=int, help='gunicorn workers for the started server')
+    parser.add_argument('--scenarios', nargs='+', choices=['mchat', 'aq', 'mixed', 'batch'],
+                        default=['mchat', 'aq', 'mixed', 'batch'])
+    parser.add_argument('--requests', type=int, default=500, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed requests before each scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--batch-size', type=int, default=100, help='records per /predict/batch request')
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--format', choices=sorted(FORMATS), default='json',
+                        help='request and response encoding (packed: see packed.py)')
+    parser.add_argument('--no-cache', action='store_true', help='disable the result cache (ASD_CACHE_SIZE=0)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    model_dir = args.model_dir
+    stand_in = not args.url and not models_present(model_dir)
+    if stand_in:
+        model_dir = tempfile.mkdtemp(prefix='asd-stand-in-models-')
+        print(f"Model files not found; training stand-in models in {model_dir}")
+        make_stand_in_models(model_dir, seed=args.seed)
+
+    # Configure the app (in this process or the server) before it loads
+    os.environ['ASD_MODEL_DIR'] = model_loader.MODEL_DIR = model_dir
+    if args.no_cache:
+        os.environ['ASD_CACHE_SIZE'] = '0'
+
+    if args.url:
+        target = ServerTarget(args.url)
+    elif args.target == 'server':
+        target = SpawnedServerTarget(os.environ, args.server_workers)
+    else:
+        target = InProcessTarget()
+
+    try:
+        results = [
+            run_scenario(
+                target, scenario, args.requests, args.concurrency, args.batch_size, args.warmup, args.seed,
+                args.format
+            )
+            for scenario in args.scenarios
+        ]
+    finally:
+        target.close()
+        if stand_in:
+            shutil.rmtree(model_dir, ignore_errors=True)
+
+    print_results(results)
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_commit': git_commit(),
+        'target': args.url or args.target,
+        'stand_in_models': stand_in,
+        'cache': not args.no_cache,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""Micro-benchmarks for the NumPy feature engine.
+
+Usage:
+    python benchmark_features.py runlength [--sizes 1 1000 1000000] [--repeat 3]
+    python benchmark_features.py aq [--sizes 1 1000 100000]
+    python benchmark_features.py explain [--sizes 1 100 10000]
+
+Each benchmark times the vectorized routine against the pandas/Python code
+it replaced and prints one line per batch size. explain instead compares
+attributing a prediction (?explain=true) with making it.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import explain
+from features import AQ_COLUMNS, AQ_QUESTION_FIELDS, MCHAT_BLOCKS, MCHAT_COLUMNS, longest_run, write_features
+from instruments import INSTRUMENTS
+
+AQ = INSTRUMENTS['aq']
+MCHAT = INSTRUMENTS['mchat']
+
+
+def best_time(func, repeat):
+    # Best-of-N wall time in seconds
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def print_header(title):
+    print("\n" + "=" * 80)
+    print(title)
+    print("=" * 80)
+    print(f"{'rows':>10}  {'baseline':>12}  {'vectorized':>12}  {'speedup':>9}")
+
+
+def print_row(rows, baseline, vectorized):
+    baseline_text = f"{baseline * 1000:10.3f}ms" if baseline is not None else f"{'skipped':>12}"
+    speedup_text = f"{baseline / vectorized:8.1f}x" if baseline is not None else f"{'-':>9}"
+    print(f"{rows:>10}  {baseline_text}  {vectorized * 1000:10.3f}ms  {speedup_text}")
+
+
+# ============================================================================
+# Max_Consecutive_Failures
+# ============================================================================
+
+def iterrows_longest_run(df):
+    # The per-row loop preprocess_mchat_data used before longest_run()
+    consecutive_failures = []
+    for _, row in df.iterrows():
+        max_consecutive = 0
+        current_consecutive = 0
+        for val in row:
+            if val == 1:
+                current_consecutive += 1
+                max_consecutive = max(max_consecutive, current_consecutive)
+            else:
+                current_consecutive = 0
+        consecutive_failures.append(max_consecutive)
+    return consecutive_failures
+
+
+def bench_runlength(sizes, repeat, baseline_max_rows):
+    print_header("Max_Consecutive_Failures: iterrows loop vs longest_run()")
+    rng = np.random.default_rng(0)
+
+    for rows in sizes:
+        failed = rng.integers(0, 2, size=(rows, 23)).astype(np.int8)
+        df = pd.DataFrame(failed, columns=[f'Q{i}_Failed' for i in range(1, 24)])
+
+        vectorized = best_time(lambda: longest_run(failed), repeat)
+
+        baseline = None
+        if rows <= baseline_max_rows:
+            expected = iterrows_longest_run(df)
+            assert np.array_equal(longest_run(failed), expected)
+            baseline = best_time(lambda: iterrows_longest_run(df), 1 if rows > 10000 else repeat)
+
+        print_row(rows, baseline, vectorized)
+
+
+# ============================================================================
+# AQ features
+# ============================================================================
+
+def pandas_aq_features(records, plan):
+    # The DataFrame-based preprocess_aq_data the AQ engine replaced
+    df = pd.DataFrame(records)
+    for column in ('Gender', 'Jaundice', 'Family_ASD_History'):
+        df[column] = df[column].astype(int)
+
+    social = ['Q1', 'Q2', 'Q3', 'Q4', 'Q5', 'Q6']
+    switching = ['Q7', 'Q8', 'Q9', 'Q10', 'Q11', 'Q12']
+    detail = ['Q13', 'Q14', 'Q15', 'Q16', 'Q17', 'Q18']
+    communication = ['Q19', 'Q20', 'Q21', 'Q22', 'Q23', 'Q24', 'Q25']
+    imagination = ['Q26', 'Q27', 'Q28', 'Q29', 'Q30']
+
+    df['Social_Mean'] = df[social].mean(axis=1)
+    df['Switching_Mean'] = df[switching].mean(axis=1)
+    df['Detail_Mean'] = df[detail].mean(axis=1)
+    df['Communication_Mean'] = df[communication].mean(axis=1)
+    df['Imagination_Mean'] = df[imagination].mean(axis=1)
+    df['AQ_Total'] = df[[f'Q{i}' for i in range(1, 31)]].sum(axis=1)
+    df['High_Score_Count'] = (df[[f'Q{i}' for i in range(1, 31)]] >= 2).sum(axis=1)
+    df['Score_STD'] = df[[f'Q{i}' for i in range(1, 31)]].std(axis=1)
+    df['Comm_x_Family'] = df['Communication_Mean'] * df['Family_ASD_History']
+    df['Social_x_Family'] = df['Social_Mean'] * df['Family_ASD_History']
+
+    blocks = {'answers': df[AQ_QUESTION_FIELDS].to_numpy(dtype=np.float64)}
+    columns = {name: df[name].to_numpy(dtype=np.float64) for name, _ in plan['columns']}
+    return write_features(plan, len(df), blocks, columns)
+
+
+def vectorized_aq_features(records, plan):
+    return AQ['preprocess'](records, plan)
+
+
+def bench_aq(sizes, repeat, baseline_max_rows):
+    print_header("AQ features from validated records: pandas vs NumPy engine")
+    rng = np.random.default_rng(0)
+    # Every AQ feature the engine produces, in engine order
+    plan = AQ['compile_plan'](AQ_QUESTION_FIELDS + AQ_COLUMNS)
+
+    for rows in sizes:
+        answers = rng.integers(0, 4, size=(rows, len(AQ_QUESTION_FIELDS)))
+        flags = rng.integers(0, 2, size=(rows, 3))
+        records = [
+            {
+                'Age': 7.0,
+                'Gender': int(gender),
+                'Jaundice': int(jaundice),
+                'Family_ASD_History': int(family_history),
+                **dict(zip(AQ_QUESTION_FIELDS, row.tolist())),
+            }
+            for row, (gender, jaundice, family_history) in zip(answers, flags)
+        ]
+
+        vectorized = best_time(lambda: vectorized_aq_features(records, plan), repeat)
+
+        baseline = None
+        if rows <= baseline_max_rows:
+            assert np.array_equal(vectorized_aq_features(records, plan), pandas_aq_features(records, plan))
+            baseline = best_time(lambda: pandas_aq_features(records, plan), repeat)
+
+        print_row(rows, baseline, vectorized)
+
+
+# ============================================================================
+# Attribution (?explain=true)
+# ============================================================================
+
+def bench_explain(sizes, repeat, baseline_max_rows):
+    # A stand-in M-CHAT forest the size of the served one (100 trees); the
+    # baseline is predict_proba alone, so the ratio is the cost of explaining
+    from sklearn.ensemble import RandomForestClassifier
+
+    print("\n" + "=" * 80)
+    print("M-CHAT attribution: predict_proba vs explainer (100-tree random forest)")
+    print("=" * 80)
+    print(f"{'rows':>10}  {'predict':>12}  {'explain':>12}  {'overhead':>9}")
+
+    rng = np.random.default_rng(0)
+    plan = MCHAT['compile_plan'](MCHAT_BLOCKS['answers'] + MCHAT_BLOCKS['failed'] + MCHAT_COLUMNS)
+    X_train = MCHAT['smoke_set'](plan, 5000, rng)
+    y = (X_train[:, plan['feature_names'].index('Total_Failed_Count')] + rng.normal(0, 2, 5000) > 11)
+    model = RandomForestClassifier(n_estimators=100, random_state=0).fit(X_train, y.astype(int))
+    explainer, _ = explain.build_explainer('mchat', model, plan['feature_names'])
+
+    for rows in sizes:
+        X = MCHAT['smoke_set'](plan, rows, rng)
+        predict = best_time(lambda: model.predict_proba(X), repeat)
+        explained = best_time(lambda: explainer.explain(X), repeat)
+        print(f"{rows:>10}  {predict * 1000:10.3f}ms  {explained * 1000:10.3f}ms  {explained / predict:8.2f}x")
+
+
+BENCHMARKS = {
+    'runlength': bench_runlength,
+    'aq': bench_aq,
+    'explain': bench_explain,
+}
+
+# Batch sizes used when --sizes is not given
+DEFAULT_SIZES = {
+    'runlength': [1, 1000, 1000000],
+    'aq': [1, 1000, 100000],
+    'explain': [1, 100, 10000],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS) + ['all'])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        help='batch sizes (rows) to time (default depends on the benchmark)')
+    parser.add_argument('--repeat', type=int, default=3, help='best-of-N repetitions')
+    parser.add_argument('--baseline-max-rows', type=int, default=1000000,
+                        help='skip the slow baseline above this many rows')
+    args = parser.parse_args()
+
+    names = sorted(BENCHMARKS) if args.benchmark == 'all' else [args.benchmark]
+    for name in names:
+        BENCHMARKS[name](args.sizes or DEFAULT_SIZES[name], args.repeat, args.baseline_max_rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+
+import metrics
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# How long the first request of a group waits for others to join, in
+# milliseconds. 0 (the default) scores every request on its own.
+COALESCE_MS = float(os.environ.get('ASD_COALESCE_MS', 0))
+# A group is scored as soon as it holds this many requests
+COALESCE_MAX_BATCH = int(os.environ.get('ASD_COALESCE_MAX_BATCH', 32))
+
+
+# ============================================================================
+# COALESCING
+# ============================================================================
+#
+# Requests coalesce without a background thread. The first request to reach
+# an empty slot becomes the group's leader: it waits up to COALESCE_MS for
+# others to join (or until the group is full), then scores the whole group
+# in one call and hands every member its own result. A request therefore
+# waits at most COALESCE_MS plus the time to score one group.
+
+class Group:
+    def __init__(self):
+        self.records = []
+        self.results = None
+        self.started = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+# (model name, bundle id) -> group still accepting records. Keyed on the
+# bundle so records are only ever scored by the model they were routed to.
+_OPEN = {}
+_LOCK = threading.Lock()
+
+
+def enabled():
+    return COALESCE_MS > 0 and COALESCE_MAX_BATCH > 1
+
+
+def run_group(model_name, group, bundle, score):
+    # Score the group in one call; if that fails, score record by record so
+    # one bad record cannot fail the others
+    metrics.COALESCED_BATCH_SIZE.observe((model_name,), len(group.records))
+    try:
+        group.results = score(group.records, bundle)
+    except Exception:
+        results = []
+        for record in group.records:
+            try:
+                results.append(score([record], bundle)[0])
+            except Exception as e:
+                results.append(e)
+        group.results = results
+
+
+def score_one(model_name, record, bundle, score):
+    """Score one record, batched with concurrent requests when enabled.
+
+    score(records, bundle) must return one result per record, in order.
+    Raises whatever scoring this record raised.
+    """
+    if not enabled():
+        return score([record], bundle)[0]
+
+    key = (model_name, id(bundle))
+    arrived = time.perf_counter()
+    with _LOCK:
+        group = _OPEN.get(key)
+        leader = group is None
+        if leader:
+            group = _OPEN[key] = Group()
+        index = len(group.records)
+        group.records.append(record)
+        if len(group.records) >= COALESCE_MAX_BATCH:
+            # Full: close it to newcomers and wake the leader
+            del _OPEN[key]
+            group.full.set()
+
+    if leader:
+        group.full.wait(COALESCE_MS / 1000)
+        with _LOCK:
+            if _OPEN.get(key) is group:
+                del _OPEN[key]
+        group.started = time.perf_counter()
+        try:
+            run_group(model_name, group, bundle, score)
+        finally:
+            group.done.set()
+    else:
+        group.done.wait()
+
+    # Time spent waiting for the group to be dispatched, for /metrics
+    metrics.add_stage('coalesce_wait', group.started - arrived)
+
+    result = group.results[index]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def status():
+    # Configuration for /health
+    return {
+        'enabled': enabled(),
+        'window_ms': COALESCE_MS,
+        'max_batch': COALESCE_MAX_BATCH,
+    }
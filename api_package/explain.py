@@ -0,0 +1,151 @@
+"""Per-feature and per-question attribution for tree-ensemble predictions.
+
+Path-based attribution: walking a tree from its root to a leaf, every split
+moves the predicted value from the parent node's value to the child's. That
+change is credited to the feature the node splits on. Per tree, the credits
+sum exactly to (leaf value - root value). Averaged over a forest, the bias
+(mean root value) plus every feature's contribution therefore equals the
+predicted ASD probability.
+
+Each node's parent, the feature its parent splits on and the change in
+value on entering it are precomputed when the model loads. Explaining a
+batch finds the leaf every row reaches in every tree (with the estimator's
+own compiled apply() when it has one), walks back up to the roots in
+max_depth vectorized steps and sums the credits with one bincount. Feature
+contributions are then rolled up to the payload fields (Q1..Qn and the
+demographics) through each instrument's feature sources (instruments.py).
+"""
+import numpy as np
+
+import tree_runtime
+from instruments import INSTRUMENTS
+
+# Rows explained together; bounds the (steps, rows, trees) work arrays
+BLOCK_ROWS = 256
+# scikit-learn's apply() has a fixed cost of a few milliseconds per call
+# (it fans out over threads); smaller batches walk the compiled trees
+APPLY_MIN_ROWS = 128
+
+# name -> (feature sources, payload fields) used for the roll-up
+INPUTS = {
+    name: (instrument['feature_sources'], instrument['input_fields'])
+    for name, instrument in INSTRUMENTS.items()
+}
+
+
+def rollup_matrix(feature_names, sources, input_fields):
+    """(features, inputs) matrix sharing each feature among its sources.
+
+    A feature computed from k payload fields passes 1/k of its contribution
+    to each, so every row sums to 1 and roll-ups keep the total.
+    """
+    column = {field: i for i, field in enumerate(input_fields)}
+    matrix = np.zeros((len(feature_names), len(input_fields)))
+    for row, name in enumerate(feature_names):
+        fields = sources[name]
+        matrix[row, [column[field] for field in fields]] = 1 / len(fields)
+    return matrix
+
+
+class Explainer:
+    """Precomputed attribution tables for one compiled tree ensemble.
+
+    Forest contributions are in probability units: bias plus contributions
+    is the ASD probability. Gradient boosting is attributed in log-odds:
+    bias plus contributions is the raw score fed to the sigmoid.
+
+    leaves maps a feature matrix to the (rows, trees) leaf node numbers in
+    the compiled numbering; it defaults to CompiledTrees.leaves().
+    """
+
+    def __init__(self, trees, sources, input_fields, leaves=None):
+        self.trees = trees
+        self.leaves = leaves or trees.leaves
+        self.feature_names = trees.feature_names
+        self.input_fields = list(input_fields)
+        self.rollup = rollup_matrix(self.feature_names, sources, self.input_fields)
+
+        if trees.kind == 'forest':
+            # ASD-class probability of every node, averaged over the trees
+            value = trees.value[:, list(trees.classes_).index(1)] / len(trees.roots)
+            self.units = 'probability'
+            bias = 0.0
+        else:
+            value = trees.meta['learning_rate'] * trees.value[:, 0]
+            self.units = 'log_odds'
+            bias = trees.meta['init']
+
+        # Roots are their own parent, so their gain is 0 and rows that
+        # reached a shallow leaf add nothing on the remaining steps
+        nodes = np.arange(len(value))
+        internal = np.flatnonzero(trees.left != nodes)
+        self.parent = nodes.astype(np.int32)
+        self.parent[trees.left[internal]] = internal
+        self.parent[trees.right[internal]] = internal
+        self.gain = value - value[self.parent]
+        self.parent_feature = trees.feature[self.parent]
+        self.bias = float(bias + value[trees.roots].sum())
+
+    def contributions(self, X):
+        """(rows, features) contribution of every feature to every row."""
+        n_features = len(self.feature_names)
+        leaves = self.leaves(X)
+        out = np.empty((len(X), n_features))
+        for start in range(0, len(X), BLOCK_ROWS):
+            out[start:start + BLOCK_ROWS] = self.path_contributions(leaves[start:start + BLOCK_ROWS], n_features)
+        return out
+
+    def path_contributions(self, node, n_features):
+        # Walk from the leaves back to the roots, keeping the feature and
+        # value change of every step for a single bincount at the end
+        rows = np.arange(len(node))[:, None] * n_features
+        depth = self.trees.max_depth
+        slots = np.empty((depth,) + node.shape, dtype=np.intp)
+        gains = np.empty((depth,) + node.shape)
+        for step in range(depth):
+            slots[step] = rows + self.parent_feature[node]
+            gains[step] = self.gain[node]
+            node = self.parent[node]
+
+        totals = np.bincount(slots.ravel(), weights=gains.ravel(), minlength=len(rows) * n_features)
+        return totals.reshape(len(rows), n_features)
+
+    def explain(self, X):
+        """Returns (feature contributions, input contributions) per row.
+
+        Input contributions are indexed like input_fields.
+        """
+        contributions = self.contributions(X)
+        return contributions, contributions @ self.rollup
+
+
+def sklearn_leaves(model, trees):
+    # Leaf numbers from the fitted estimator's apply(), shifted into the
+    # compiled numbering where every tree starts at its root
+    def leaves(X):
+        if len(X) < APPLY_MIN_ROWS:
+            return trees.leaves(X)
+        leaf = model.apply(X).reshape(len(X), -1)
+        return leaf + trees.roots
+    return leaves
+
+
+def build_explainer(name, model, feature_names):
+    """Build the Explainer of a loaded model.
+
+    Returns (explainer, None), or (None, reason) for a model that cannot be
+    explained. scikit-learn models are compiled with export_model, which
+    only the sklearn runtime can import.
+    """
+    sources, input_fields = INPUTS[name]
+    try:
+        if isinstance(model, tree_runtime.CompiledTrees):
+            return Explainer(model, sources, input_fields), None
+        from export_model import compile_model
+        trees = compile_model(model, feature_names, '')
+        if trees.kind != 'forest':
+            # Boosted trees are shallow, so the compiled walk is cheap
+            return Explainer(trees, sources, input_fields), None
+        return Explainer(trees, sources, input_fields, sklearn_leaves(model, trees)), None
+    except (ValueError, KeyError) as e:
+        return None, str(e)
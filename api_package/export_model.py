@@ -0,0 +1,218 @@
+"""Export the scikit-learn models to the compiled NumPy tree runtime.
+
+Random forests, extra trees, single decision trees and binary gradient
+boosting are flattened into the node arrays tree_runtime.py evaluates, and
+written as <model>_model.npz next to the .pkl files. A server started with
+ASD_MODEL_RUNTIME=compiled then loads the .npz files and never imports
+scikit-learn.
+
+Export (both models by default):
+    python export_model.py export
+    python export_model.py export --models mchat --check-rows 100000
+
+Re-check existing exports against the .pkl files:
+    python export_model.py check
+
+Every export is checked before it is written: its probabilities must match
+the scikit-learn model's within --atol on a generated test set that lands
+on both sides of every split threshold. An export that fails is not written.
+"""
+import argparse
+import os
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.dummy import DummyClassifier
+from sklearn.ensemble import ExtraTreesClassifier, GradientBoostingClassifier, RandomForestClassifier
+from sklearn.tree import BaseDecisionTree
+
+import tree_runtime
+from model_loader import MODEL_DIR, MODEL_SPECS, file_sha256
+
+# ============================================================================
+# CONVERSION
+# ============================================================================
+
+def tree_arrays(tree, offset, normalize):
+    """Node arrays of one fitted sklearn Tree, renumbered from offset."""
+    nodes = np.arange(tree.node_count)
+    leaf = tree.children_left < 0
+
+    value = tree.value[:, 0, :].astype(np.float64)
+    if normalize:
+        # Class counts (or fractions) to a distribution, as predict_proba does
+        totals = value.sum(axis=1, keepdims=True)
+        value = value / np.where(totals == 0, 1, totals)
+
+    missing_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8))
+    return {
+        'feature': np.where(leaf, 0, tree.feature).astype(np.int32),
+        'threshold': np.where(leaf, np.inf, tree.threshold),
+        'left': (np.where(leaf, nodes, tree.children_left) + offset).astype(np.int32),
+        'right': (np.where(leaf, nodes, tree.children_right) + offset).astype(np.int32),
+        'missing_left': np.asarray(missing_left, dtype=bool) & ~leaf,
+        'value': value,
+    }
+
+
+def compile_model(model, feature_names, source_sha256):
+    """Flatten a fitted classifier into a CompiledTrees model.
+
+    Raises ValueError for model types the runtime cannot evaluate exactly.
+    """
+    meta = {
+        'format_version': tree_runtime.FORMAT_VERSION,
+        'source_type': type(model).__name__,
+        'source_sha256': source_sha256,
+        'feature_names': list(feature_names),
+        'classes': np.asarray(model.classes_).tolist(),
+    }
+
+    if isinstance(model, GradientBoostingClassifier):
+        if len(model.classes_) != 2:
+            raise ValueError('only binary gradient boosting can be exported')
+        if not (model.init_ == 'zero' or isinstance(model.init_, DummyClassifier)):
+            raise ValueError('gradient boosting with a custom init estimator cannot be exported')
+        trees = [estimator.tree_ for estimator in model.estimators_[:, 0]]
+        normalize = False
+        meta.update(
+            kind='boosting',
+            learning_rate=float(model.learning_rate),
+            # The prior log-odds every prediction starts from
+            init=float(model._raw_predict_init(np.zeros((1, len(feature_names))))[0, 0]),
+        )
+    elif isinstance(model, BaseDecisionTree) and hasattr(model, 'classes_'):
+        trees = [model.tree_]
+        normalize = True
+        meta.update(kind='forest')
+    elif isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        normalize = True
+        meta.update(kind='forest')
+    else:
+        raise ValueError(f'{type(model).__name__} is not a supported tree ensemble')
+
+    parts = []
+    roots = []
+    offset = 0
+    for tree in trees:
+        roots.append(offset)
+        parts.append(tree_arrays(tree, offset, normalize))
+        offset += tree.node_count
+
+    arrays = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+    arrays['roots'] = np.asarray(roots, dtype=np.int32)
+    meta['n_trees'] = len(trees)
+    meta['max_depth'] = int(max(tree.max_depth for tree in trees))
+    return tree_runtime.CompiledTrees(arrays, meta)
+
+
+# ============================================================================
+# PARITY CHECK
+# ============================================================================
+
+def generate_check_set(compiled, rows, seed=0):
+    """Feature rows spread around every split threshold of the model.
+
+    Each value is drawn near a random threshold of its feature: mostly just
+    either side of it, sometimes exactly on it (the <= edge case).
+    """
+    rng = np.random.default_rng(seed)
+    split = compiled.left != np.arange(len(compiled.left))
+    X = np.empty((rows, compiled.n_features_in_))
+
+    for column in range(compiled.n_features_in_):
+        thresholds = compiled.threshold[split & (compiled.feature == column)]
+        if not len(thresholds):
+            X[:, column] = rng.integers(0, 4, size=rows)
+            continue
+        spread = max(np.ptp(thresholds) / 4, 0.5)
+        base = rng.choice(thresholds, size=rows)
+        X[:, column] = base + rng.uniform(-spread, spread, size=rows)
+        exact = rng.random(rows) < 0.1
+        X[exact, column] = base[exact].astype(np.float32)
+    return X
+
+
+def check_parity(model, compiled, rows, atol):
+    """Compare probabilities and labels of the two models on generated rows."""
+    X = generate_check_set(compiled, rows)
+    expected = model.predict_proba(pd.DataFrame(X, columns=compiled.feature_names))
+    actual = compiled.predict_proba(X)
+
+    max_diff = float(np.abs(expected - actual).max())
+    labels_agree = float(np.mean(
+        model.classes_.take(np.argmax(expected, axis=1)) == compiled.classes_.take(np.argmax(actual, axis=1))
+    ))
+    return {
+        'rows': rows,
+        'max_abs_diff': max_diff,
+        'label_agreement': labels_agree,
+        'passed': max_diff <= atol,
+    }
+
+
+def print_check(name, check):
+    mark = '✓' if check['passed'] else '✗'
+    print(
+        f"{mark} {MODEL_SPECS[name]['label']}: max |Δp| = {check['max_abs_diff']:.3g} "
+        f"over {check['rows']:,} rows, labels agree on {check['label_agreement']:.2%}"
+    )
+
+
+# ============================================================================
+# COMMANDS
+# ============================================================================
+
+def export(name, model_dir, rows, atol):
+    spec = MODEL_SPECS[name]
+    model_path = os.path.join(model_dir, spec['model_file'])
+    out_path = os.path.join(model_dir, spec['export_file'])
+
+    model = joblib.load(model_path)
+    feature_names = list(joblib.load(os.path.join(model_dir, spec['features_file'])))
+    compiled = compile_model(model, feature_names, file_sha256(model_path))
+
+    result = check_parity(model, compiled, rows, atol)
+    print_check(name, result)
+    if not result['passed']:
+        print(f"  Not writing {out_path}")
+        return False
+
+    compiled.save(out_path + '.partial')
+    os.replace(out_path + '.partial', out_path)
+    print(f"  Wrote {out_path} ({compiled.meta['n_trees']} trees, depth {compiled.meta['max_depth']})")
+    return True
+
+
+def check(name, model_dir, rows, atol):
+    spec = MODEL_SPECS[name]
+    model_path = os.path.join(model_dir, spec['model_file'])
+    compiled = tree_runtime.load(os.path.join(model_dir, spec['export_file']))
+
+    if compiled.meta['source_sha256'] != file_sha256(model_path):
+        print(f"✗ {spec['label']}: export was made from a different {spec['model_file']}; re-export it")
+        return False
+    result = check_parity(joblib.load(model_path), compiled, rows, atol)
+    print_check(name, result)
+    return result['passed']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['export', 'check'])
+    parser.add_argument('--models', nargs='+', choices=sorted(MODEL_SPECS), default=sorted(MODEL_SPECS))
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--check-rows', type=int, default=20000, help='generated rows in the parity check')
+    parser.add_argument('--atol', type=float, default=1e-9, help='largest allowed probability difference')
+    args = parser.parse_args()
+
+    command = export if args.command == 'export' else check
+    results = [command(name, args.model_dir, args.check_rows, args.atol) for name in args.models]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
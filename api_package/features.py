@@ -0,0 +1,341 @@
+import numpy as np
+
+# ============================================================================
+# M-CHAT CLINICAL PARAMETERS
+# ============================================================================
+
+MCHAT_QUESTIONS = 23
+MCHAT_QUESTION_FIELDS = [f'Q{i}' for i in range(1, MCHAT_QUESTIONS + 1)]
+
+BEST7_QUESTIONS = [2, 5, 7, 9, 14, 15, 20]
+INVERTED_QUESTIONS = [11, 18, 20, 22]
+SOCIAL_QUESTIONS = [2, 7, 9, 14, 15, 17, 19, 21, 23]
+JOINT_ATTENTION_QUESTIONS = [6, 7, 9, 15]
+SENSORY_QUESTIONS = [11, 18, 22]
+
+# Failure counts the engine needs, each over a set of questions
+MCHAT_SUBSCALES = {
+    'Best7': BEST7_QUESTIONS,
+    'NonBest7': [i for i in range(1, MCHAT_QUESTIONS + 1) if i not in BEST7_QUESTIONS],
+    'Social': SOCIAL_QUESTIONS,
+    'JointAttention': JOINT_ATTENTION_QUESTIONS,
+    'Sensory': SENSORY_QUESTIONS,
+}
+
+# Upper edges of the Age_Group buckets (0, 18], (18, 24], (24, 30], (30, 100]
+AGE_GROUP_EDGES = np.array([18, 24, 30])
+
+
+def question_mask(questions, n_questions):
+    # Boolean mask over question columns for 1-based question numbers
+    mask = np.zeros(n_questions, dtype=bool)
+    mask[np.asarray(questions, dtype=np.intp) - 1] = True
+    return mask
+
+
+def question_fields(questions):
+    return [f'Q{i}' for i in questions]
+
+
+# ============================================================================
+# FEATURE PLANS
+# ============================================================================
+
+def compile_feature_plan(feature_names, blocks, columns):
+    """Map every model feature to a fixed slot of the model input matrix.
+
+    blocks maps a block name to the feature names of its matrix columns
+    (e.g. Q1..Q23), columns lists the single-column features an engine
+    produces. Compiled once per feature list at model load, so requests
+    skip name lookups and frame reindexing. Raises ValueError if the list
+    names a feature the engine cannot produce.
+    """
+    feature_names = list(feature_names)
+    duplicated = sorted({name for name in feature_names if feature_names.count(name) > 1})
+    if duplicated:
+        raise ValueError(f'Duplicate features in feature list: {duplicated}')
+
+    block_index = {
+        name: (block, column)
+        for block, names in blocks.items()
+        for column, name in enumerate(names)
+    }
+    unknown = [name for name in feature_names if name not in block_index and name not in columns]
+    if unknown:
+        raise ValueError(f'Feature list names features the preprocessor cannot produce: {unknown}')
+
+    block_plans = {}
+    scalar_plan = []
+    for slot, name in enumerate(feature_names):
+        if name in block_index:
+            block, column = block_index[name]
+            block_plans.setdefault(block, ([], []))
+            block_plans[block][0].append(column)
+            block_plans[block][1].append(slot)
+        else:
+            scalar_plan.append((name, slot))
+
+    return {
+        'feature_names': feature_names,
+        'width': len(feature_names),
+        'blocks': {
+            block: (np.array(source, dtype=np.intp), np.array(slots, dtype=np.intp))
+            for block, (source, slots) in block_plans.items()
+        },
+        'columns': scalar_plan,
+    }
+
+
+def write_features(plan, n, blocks, columns):
+    # Every slot is owned by exactly one plan entry, so np.empty is safe
+    X = np.empty((n, plan['width']), dtype=np.float64)
+    for block, (source, slots) in plan['blocks'].items():
+        X[:, slots] = blocks[block][:, source]
+    for name, slot in plan['columns']:
+        X[:, slot] = columns[name]
+    return X
+
+
+# ============================================================================
+# RUN LENGTHS
+# ============================================================================
+
+def byte_run_tables():
+    # For every byte value: longest run of ones, run starting at bit 0 and
+    # run ending at bit 7 (bit 0 is the leftmost question of the chunk)
+    bits = (np.arange(256)[:, None] >> np.arange(8)) & 1
+    current = np.zeros(256, dtype=np.int32)
+    longest = np.zeros(256, dtype=np.int32)
+    for column in bits.T:
+        current = (current + 1) * column
+        np.maximum(longest, current, out=longest)
+    leading = np.where(bits.all(axis=1), 8, np.argmin(bits, axis=1))
+    trailing = current
+    return longest.astype(np.int32), leading.astype(np.int32), trailing.astype(np.int32)
+
+
+BYTE_LONGEST_RUN, BYTE_LEADING_ONES, BYTE_TRAILING_ONES = byte_run_tables()
+
+
+def longest_run(binary):
+    """Length of the longest run of ones in each row of an (n, w) 0/1 matrix.
+
+    Rows are bit-packed eight columns to a byte and every byte is resolved
+    through 256-entry lookup tables (longest run inside the byte, ones at
+    its start, ones at its end). Runs that cross byte boundaries are joined
+    by carrying the open run from one byte to the next, so the only loop is
+    over the ceil(w / 8) byte columns, never over rows.
+    """
+    packed = np.packbits(np.asarray(binary, dtype=bool), axis=1, bitorder='little')
+    longest = np.zeros(packed.shape[0], dtype=np.int32)
+    carry = np.zeros(packed.shape[0], dtype=np.int32)
+
+    for chunk in packed.T:
+        np.maximum(longest, BYTE_LONGEST_RUN[chunk], out=longest)
+        np.maximum(longest, carry + BYTE_LEADING_ONES[chunk], out=longest)
+        carry = np.where(chunk == 0xFF, carry + 8, BYTE_TRAILING_ONES[chunk])
+
+    return longest
+
+
+# ============================================================================
+# M-CHAT FEATURES
+# ============================================================================
+#
+# Each instrument's derived features are computed from the arrays its
+# compiled pipeline (see instruments.py) has already built: the scored
+# answer matrix, one sum per subscale, the total and the demographics.
+
+def mchat_derived_features(scored, sums, total, columns):
+    """Add the engineered M-CHAT features to columns.
+
+    scored is the (n, 23) failure matrix, sums maps every MCHAT_SUBSCALES
+    entry to its failure count and total counts all failures; columns holds
+    the demographics. Mirrors the training-time pandas feature engineering
+    exactly.
+    """
+    failed = scored
+    age = columns['Age']
+    gender = columns['Gender']
+    jaundice = columns['Jaundice']
+    family_history = columns['Family_ASD_History']
+
+    best7 = sums['Best7']
+    non_best7 = sums['NonBest7']
+    social = sums['Social']
+    joint_attention = sums['JointAttention']
+    sensory = sums['Sensory']
+
+    # Best7 features
+    columns['Best7_Failed_Count'] = best7
+    columns['Total_Failed_Count'] = total
+    columns['MCHAT_Risk_Flag'] = ((best7 >= 2) | (total >= 3)).astype(np.int32)
+    columns['Best7_Pass_Rate'] = 1 - best7 / len(BEST7_QUESTIONS)
+    columns['Total_Pass_Rate'] = 1 - total / MCHAT_QUESTIONS
+    columns['NonBest7_Failed_Count'] = non_best7
+    columns['Best7_to_NonBest7_Ratio'] = best7 / (non_best7 + 1)
+
+    # Domain-specific features
+    columns['Social_Failed_Count'] = social
+    columns['Social_Pass_Rate'] = 1 - social / len(SOCIAL_QUESTIONS)
+    columns['JointAttention_Failed_Count'] = joint_attention
+    columns['PretendPlay_Failed'] = failed[:, 4]
+    columns['Sensory_Failed_Count'] = sensory
+
+    # Interaction features
+    columns['Q9_Q14_Interaction'] = failed[:, 8] * failed[:, 13]
+    columns['Q9_Q15_Interaction'] = failed[:, 8] * failed[:, 14]
+    columns['Q7_Q14_Interaction'] = failed[:, 6] * failed[:, 13]
+
+    columns['Risk_Factors_Sum'] = family_history + jaundice
+    columns['Male_With_Family_History'] = gender * family_history
+    columns['High_Risk_Profile'] = ((family_history == 1) & (best7 >= 1)).astype(np.int32)
+
+    columns['Best7_All_Passed'] = (best7 == 0).astype(np.int32)
+    columns['Best7_Multiple_Failed'] = (best7 >= 2).astype(np.int32)
+
+    # Age-based features; searchsorted on the upper edges reproduces the
+    # right-closed pd.cut bins used in training
+    columns['Age_Squared'] = age ** 2
+    columns['Age_Group'] = np.searchsorted(AGE_GROUP_EDGES, age, side='left')
+
+    # Statistical pattern features (sample std, ddof=1, as pandas computes it)
+    columns['Failure_Mean'] = total / MCHAT_QUESTIONS
+    columns['Failure_Std'] = failed.std(axis=1, ddof=1)
+    columns['Max_Consecutive_Failures'] = longest_run(failed)
+
+
+# Everything the M-CHAT engine can produce, in training order
+MCHAT_BLOCKS = {
+    'answers': MCHAT_QUESTION_FIELDS,
+    'failed': [f'{field}_Failed' for field in MCHAT_QUESTION_FIELDS],
+}
+MCHAT_COLUMNS = [
+    'Age', 'Gender', 'Jaundice', 'Family_ASD_History',
+    'Best7_Failed_Count', 'Total_Failed_Count', 'MCHAT_Risk_Flag', 'Best7_Pass_Rate',
+    'Total_Pass_Rate', 'NonBest7_Failed_Count', 'Best7_to_NonBest7_Ratio',
+    'Social_Failed_Count', 'Social_Pass_Rate', 'JointAttention_Failed_Count',
+    'PretendPlay_Failed', 'Sensory_Failed_Count',
+    'Q9_Q14_Interaction', 'Q9_Q15_Interaction', 'Q7_Q14_Interaction',
+    'Risk_Factors_Sum', 'Male_With_Family_History', 'High_Risk_Profile',
+    'Best7_All_Passed', 'Best7_Multiple_Failed',
+    'Age_Squared', 'Age_Group', 'Failure_Mean', 'Failure_Std', 'Max_Consecutive_Failures',
+]
+
+
+# Payload fields (questions and demographics) each M-CHAT feature is computed
+# from; explain.py splits a feature's attribution equally among them
+DEMOGRAPHIC_FIELDS = ['Age', 'Gender', 'Jaundice', 'Family_ASD_History']
+MCHAT_INPUT_FIELDS = MCHAT_QUESTION_FIELDS + DEMOGRAPHIC_FIELDS
+
+
+BEST7_FIELDS = question_fields(BEST7_QUESTIONS)
+MCHAT_FEATURE_SOURCES = {
+    **{field: [field] for field in MCHAT_INPUT_FIELDS},
+    **{f'{field}_Failed': [field] for field in MCHAT_QUESTION_FIELDS},
+    'Best7_Failed_Count': BEST7_FIELDS,
+    'Total_Failed_Count': MCHAT_QUESTION_FIELDS,
+    'MCHAT_Risk_Flag': MCHAT_QUESTION_FIELDS,
+    'Best7_Pass_Rate': BEST7_FIELDS,
+    'Total_Pass_Rate': MCHAT_QUESTION_FIELDS,
+    'NonBest7_Failed_Count': [field for field in MCHAT_QUESTION_FIELDS if field not in BEST7_FIELDS],
+    'Best7_to_NonBest7_Ratio': MCHAT_QUESTION_FIELDS,
+    'Social_Failed_Count': question_fields(SOCIAL_QUESTIONS),
+    'Social_Pass_Rate': question_fields(SOCIAL_QUESTIONS),
+    'JointAttention_Failed_Count': question_fields(JOINT_ATTENTION_QUESTIONS),
+    'PretendPlay_Failed': ['Q5'],
+    'Sensory_Failed_Count': question_fields(SENSORY_QUESTIONS),
+    'Q9_Q14_Interaction': ['Q9', 'Q14'],
+    'Q9_Q15_Interaction': ['Q9', 'Q15'],
+    'Q7_Q14_Interaction': ['Q7', 'Q14'],
+    'Risk_Factors_Sum': ['Family_ASD_History', 'Jaundice'],
+    'Male_With_Family_History': ['Gender', 'Family_ASD_History'],
+    'High_Risk_Profile': ['Family_ASD_History'] + BEST7_FIELDS,
+    'Best7_All_Passed': BEST7_FIELDS,
+    'Best7_Multiple_Failed': BEST7_FIELDS,
+    'Age_Squared': ['Age'],
+    'Age_Group': ['Age'],
+    'Failure_Mean': MCHAT_QUESTION_FIELDS,
+    'Failure_Std': MCHAT_QUESTION_FIELDS,
+    'Max_Consecutive_Failures': MCHAT_QUESTION_FIELDS,
+}
+
+# Every M-CHAT feature in the order the models are trained on (demographics,
+# answers, failure flags, then the engineered columns). train_model.py fits
+# on exactly this matrix and saves this list as mchat_feature_names.pkl.
+MCHAT_FEATURES = MCHAT_COLUMNS[:4] + MCHAT_BLOCKS['answers'] + MCHAT_BLOCKS['failed'] + MCHAT_COLUMNS[4:]
+
+
+# ============================================================================
+# AQ FEATURES
+# ============================================================================
+
+AQ_QUESTIONS = 30
+AQ_QUESTION_FIELDS = [f'Q{i}' for i in range(1, AQ_QUESTIONS + 1)]
+
+# Subscales in training order; each is a run of consecutive questions
+AQ_SUBSCALES = {
+    'Social': range(1, 7),
+    'Switching': range(7, 13),
+    'Detail': range(13, 19),
+    'Communication': range(19, 26),
+    'Imagination': range(26, 31),
+}
+# Answers of 2 or more count towards High_Score_Count
+AQ_HIGH_SCORE = 2
+
+
+def aq_derived_features(scored, sums, total, columns):
+    """Add the engineered AQ features to columns.
+
+    scored is the (n, 30) matrix of 0-3 scores, sums maps every AQ_SUBSCALES
+    entry to its score sum; see mchat_derived_features(). Mirrors the
+    training-time pandas feature engineering.
+    """
+    answers = scored
+    family_history = columns['Family_ASD_History']
+
+    # Summing integers and dividing once gives exactly the means pandas
+    # computed in training
+    for subscale, questions in AQ_SUBSCALES.items():
+        columns[f'{subscale}_Mean'] = sums[subscale] / len(questions)
+    columns['AQ_Total'] = total
+
+    columns['High_Score_Count'] = (answers >= AQ_HIGH_SCORE).sum(axis=1)
+
+    # Sample std (ddof=1). pandas holds the answers column-major and sums
+    # them one column at a time; a column-major float copy makes NumPy add
+    # in that same order, so the result is bit-identical to training
+    columns['Score_STD'] = np.asfortranarray(answers, dtype=np.float64).std(axis=1, ddof=1)
+
+    # Interaction features
+    columns['Comm_x_Family'] = columns['Communication_Mean'] * family_history
+    columns['Social_x_Family'] = columns['Social_Mean'] * family_history
+
+
+# Everything the AQ engine can produce, in training order
+AQ_BLOCKS = {
+    'answers': AQ_QUESTION_FIELDS,
+}
+AQ_COLUMNS = [
+    'Age', 'Gender', 'Jaundice', 'Family_ASD_History',
+    'Social_Mean', 'Switching_Mean', 'Detail_Mean', 'Communication_Mean', 'Imagination_Mean',
+    'AQ_Total', 'High_Score_Count', 'Score_STD', 'Comm_x_Family', 'Social_x_Family',
+]
+
+
+# Payload fields each AQ feature is computed from (see MCHAT_FEATURE_SOURCES)
+AQ_INPUT_FIELDS = AQ_QUESTION_FIELDS + DEMOGRAPHIC_FIELDS
+AQ_FEATURE_SOURCES = {
+    **{field: [field] for field in AQ_INPUT_FIELDS},
+    **{f'{subscale}_Mean': question_fields(questions) for subscale, questions in AQ_SUBSCALES.items()},
+    'AQ_Total': AQ_QUESTION_FIELDS,
+    'High_Score_Count': AQ_QUESTION_FIELDS,
+    'Score_STD': AQ_QUESTION_FIELDS,
+    'Comm_x_Family': question_fields(AQ_SUBSCALES['Communication']) + ['Family_ASD_History'],
+    'Social_x_Family': question_fields(AQ_SUBSCALES['Social']) + ['Family_ASD_History'],
+}
+
+# Every AQ feature in training order (see MCHAT_FEATURES)
+AQ_FEATURES = AQ_COLUMNS[:4] + AQ_QUESTION_FIELDS + AQ_COLUMNS[4:]
+
@@ -0,0 +1,78 @@
+# ============================================================================
+# GUNICORN CONFIGURATION - production server for the ASD Screening API
+# ============================================================================
+#
+# Run from this directory with:
+#     gunicorn app:app
+#
+# gunicorn picks this file up automatically. Every setting below can be
+# tuned through an environment variable without editing the file.
+
+import gc
+import multiprocessing
+import os
+
+# ----------------------------------------------------------------------------
+# Server socket
+# ----------------------------------------------------------------------------
+
+bind = os.environ.get('ASD_API_BIND', '0.0.0.0:5000')
+backlog = int(os.environ.get('ASD_API_BACKLOG', 2048))
+
+# ----------------------------------------------------------------------------
+# Worker processes
+# ----------------------------------------------------------------------------
+
+# Scoring is CPU bound (NumPy + scikit-learn), so one worker per core is the
+# default. Threads help when requests spend time waiting on slow clients.
+workers = int(os.environ.get('ASD_API_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('ASD_API_THREADS', 2))
+worker_class = 'gthread' if threads > 1 else 'sync'
+# Connections a gthread worker takes on at once, scoring or waiting for a
+# thread; beyond this they wait in the listen backlog. Per-model admission
+# limits (ASD_MAX_CONCURRENT, see admission.py) shed load inside the app.
+worker_connections = int(os.environ.get('ASD_API_WORKER_CONNECTIONS', 1000))
+
+timeout = int(os.environ.get('ASD_API_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('ASD_API_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('ASD_API_KEEPALIVE', 5))
+
+# Recycle workers periodically to bound memory growth; jitter staggers the
+# restarts so workers do not all recycle at once
+max_requests = int(os.environ.get('ASD_API_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('ASD_API_MAX_REQUESTS_JITTER', 0))
+
+# ----------------------------------------------------------------------------
+# Model sharing
+# ----------------------------------------------------------------------------
+
+# Import app.py once in the master process and load the models listed in
+# ASD_PRELOAD_MODELS there (both by default). Forked workers then share the
+# model memory copy-on-write instead of each unpickling its own copy. Set
+# ASD_PRELOAD_MODELS= (empty) to load lazily in each worker instead, e.g.
+# when a deployment only serves one age band.
+preload_app = True
+os.environ.setdefault('ASD_PRELOAD_MODELS', 'mchat,aq')
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far (the models included) out of the
+    # collector's generations. Otherwise the first collection in each worker
+    # writes to every object header and un-shares the pages again.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Each worker watches the model files itself (ASD_MODEL_WATCH_SECONDS),
+    # since a thread started in the master does not survive the fork
+    import model_loader
+    model_loader.start_watcher()
+
+
+# ----------------------------------------------------------------------------
+# Logging
+# ----------------------------------------------------------------------------
+
+accesslog = os.environ.get('ASD_API_ACCESS_LOG', '-')
+errorlog = os.environ.get('ASD_API_ERROR_LOG', '-')
+loglevel = os.environ.get('ASD_API_LOG_LEVEL', 'info')
@@ -0,0 +1,292 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# SQLite file every scored result is appended to. Unset (the default) keeps
+# no history. Point every server process at the same file.
+RESULT_DB = os.environ.get('ASD_RESULT_DB')
+# Queued results are written at least this often, in one transaction
+RESULT_FLUSH_SECONDS = float(os.environ.get('ASD_RESULT_FLUSH_MS', 500)) / 1000
+# Flush early once this many results are queued
+RESULT_FLUSH_ROWS = int(os.environ.get('ASD_RESULT_FLUSH_ROWS', 2000))
+# Results beyond this many waiting to be written are dropped (and counted)
+# rather than letting a stalled disk grow memory or slow requests
+RESULT_QUEUE_MAX = int(os.environ.get('ASD_RESULT_QUEUE_MAX', 200000))
+
+# Page size limits for GET /history
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 500
+
+RISK_CATEGORIES = ('Low Risk', 'Medium Risk', 'High Risk')
+
+
+# ============================================================================
+# RESULT STORE (SQLite)
+# ============================================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    child_id TEXT,
+    model TEXT NOT NULL,
+    model_version TEXT,
+    age REAL NOT NULL,
+    age_unit TEXT NOT NULL,
+    prediction INTEGER NOT NULL,
+    asd_probability REAL NOT NULL,
+    risk_percentage REAL NOT NULL,
+    risk_category TEXT NOT NULL,
+    source TEXT NOT NULL,
+    scored_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_child ON results (child_id, scored_at);
+CREATE INDEX IF NOT EXISTS results_model ON results (model, scored_at);
+CREATE INDEX IF NOT EXISTS results_category ON results (risk_category, scored_at);
+CREATE INDEX IF NOT EXISTS results_scored_at ON results (scored_at);
+"""
+
+COLUMNS = [
+    'child_id', 'model', 'model_version', 'age', 'age_unit', 'prediction',
+    'asd_probability', 'risk_percentage', 'risk_category', 'source', 'scored_at',
+]
+INSERT = f"INSERT INTO results ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+
+def enabled():
+    return bool(RESULT_DB)
+
+
+def connect():
+    # Short-lived connections, as in jobs.py; WAL lets readers run while a
+    # batch is being written
+    os.makedirs(os.path.dirname(os.path.abspath(RESULT_DB)), exist_ok=True)
+    connection = sqlite3.connect(RESULT_DB, timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+# ============================================================================
+# BATCHED WRITES
+# ============================================================================
+#
+# The request path only appends (results, child ids, source, time) to a
+# queue; rows are built and written by a background thread in each process,
+# one transaction per flush.
+
+_PENDING = deque()
+_STATE = {'pid': None, 'queued': 0, 'written': 0, 'dropped': 0, 'last_error': None}
+_STATE_LOCK = threading.Lock()
+_FLUSH_LOCK = threading.Lock()
+_WAKE = threading.Event()
+
+
+def record(results, child_ids, source):
+    """Queue scored results for the history store; returns immediately.
+
+    results and child_ids are parallel lists; error bodies are skipped.
+    Child ids are optional (None) and stored as text.
+    """
+    if not enabled():
+        return
+    with _STATE_LOCK:
+        if _STATE['queued'] + len(results) > RESULT_QUEUE_MAX:
+            _STATE['dropped'] += len(results)
+            return
+        _STATE['queued'] += len(results)
+    _PENDING.append((results, child_ids, source, time.time()))
+
+    start_writer()
+    if _STATE['queued'] >= RESULT_FLUSH_ROWS:
+        _WAKE.set()
+
+
+def result_rows(results, child_ids, source, scored_at):
+    for result, child_id in zip(results, child_ids):
+        if 'error' in result:
+            continue
+        yield (
+            None if child_id is None else str(child_id),
+            result['model_used'],
+            result.get('model_version'),
+            result['age'],
+            result['age_unit'],
+            result['prediction'],
+            result['probabilities']['asd'],
+            result['risk_percentage'],
+            result['risk_category'],
+            source,
+            scored_at,
+        )
+
+
+def flush():
+    """Write every queued result now. Returns the number of rows written."""
+    with _FLUSH_LOCK:
+        batches = []
+        while _PENDING:
+            batches.append(_PENDING.popleft())
+        if not batches:
+            return 0
+
+        queued = sum(len(batch[0]) for batch in batches)
+        rows = [row for batch in batches for row in result_rows(*batch)]
+        try:
+            with connect() as connection:
+                connection.executemany(INSERT, rows)
+            written, dropped, error = len(rows), 0, None
+        except Exception as e:
+            print(f"⚠ Warning: Could not write {len(rows)} results to the history store: {e}")
+            written, dropped, error = 0, len(rows), str(e)
+
+        with _STATE_LOCK:
+            _STATE['queued'] -= queued
+            _STATE['written'] += written
+            _STATE['dropped'] += dropped
+            if error:
+                _STATE['last_error'] = error
+        return written
+
+
+def run_writer():
+    while True:
+        _WAKE.wait(RESULT_FLUSH_SECONDS)
+        _WAKE.clear()
+        flush()
+
+
+def start_writer():
+    # Started on first use in each process, so gunicorn workers get their
+    # own writer rather than a thread lost in the fork
+    if _STATE['pid'] == os.getpid():
+        return
+    with _STATE_LOCK:
+        if _STATE['pid'] == os.getpid():
+            return
+        _STATE['pid'] = os.getpid()
+    threading.Thread(target=run_writer, name='asd-history-writer', daemon=True).start()
+    # Write what is still queued when the process exits cleanly
+    atexit.register(flush)
+
+
+def status():
+    # Store configuration and write counters of this process, for /health
+    return {
+        'enabled': enabled(),
+        'path': RESULT_DB,
+        'queued': _STATE['queued'],
+        'written': _STATE['written'],
+        'dropped': _STATE['dropped'],
+        'last_error': _STATE['last_error'],
+    }
+
+
+# ============================================================================
+# QUERIES
+# ============================================================================
+
+def parse_time(value):
+    """Unix time of an ISO 8601 date or datetime; naive values are UTC.
+
+    Raises ValueError for anything else.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec='milliseconds')
+
+
+def to_result(row):
+    result = dict(row)
+    result['scored_at'] = format_time(result['scored_at'])
+    return result
+
+
+def encode_cursor(row):
+    return f"{row['scored_at']!r}_{row['id']}"
+
+
+def decode_cursor(cursor):
+    scored_at, row_id = cursor.split('_')
+    return float(scored_at), int(row_id)
+
+
+def query_history(child_id=None, model=None, risk_category=None, since=None, until=None,
+                  limit=HISTORY_DEFAULT_LIMIT, cursor=None):
+    """One page of results, newest first, matching every filter given.
+
+    since/until are unix times (until is exclusive). Returns (results,
+    next_cursor); pass next_cursor back for the following page, None when
+    there is no more.
+    """
+    clauses = []
+    params = []
+    for column, value in (('child_id', child_id), ('model', model), ('risk_category', risk_category)):
+        if value is not None:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+    if since is not None:
+        clauses.append('scored_at >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append('scored_at < ?')
+        params.append(until)
+    if cursor is not None:
+        # Keyset pagination: resume strictly after the last row served
+        clauses.append('(scored_at, id) < (?, ?)')
+        params.extend(decode_cursor(cursor))
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    with connect() as connection:
+        rows = connection.execute(
+            f'SELECT * FROM results {where} ORDER BY scored_at DESC, id DESC LIMIT ?',
+            [*params, limit + 1]
+        ).fetchall()
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [to_result(row) for row in rows[:limit]], next_cursor
+
+
+def child_trend(child_id):
+    """Every result for one child, oldest first, grouped by model.
+
+    Each model's entry lists its assessments and the change in risk
+    percentage from the first to the latest.
+    """
+    with connect() as connection:
+        rows = connection.execute(
+            'SELECT * FROM results WHERE child_id = ? ORDER BY scored_at, id', (str(child_id),)
+        ).fetchall()
+
+    models = {}
+    for row in rows:
+        models.setdefault(row['model'], []).append(to_result(row))
+
+    return {
+        'child_id': str(child_id),
+        'count': len(rows),
+        'models': {
+            model: {
+                'count': len(points),
+                'first_scored_at': points[0]['scored_at'],
+                'latest_scored_at': points[-1]['scored_at'],
+                'latest_risk_category': points[-1]['risk_category'],
+                'risk_percentage_change': round(points[-1]['risk_percentage'] - points[0]['risk_percentage'], 2),
+                'assessments': points,
+            }
+            for model, points in models.items()
+        },
+    }
@@ -0,0 +1,319 @@
+"""Registry of the screening instruments the API serves.
+
+Every instrument is declared once, as data: its questions and how answers
+are encoded and scored, its inverted items and subscales, the function that
+adds its derived features (features.py), the ages it screens and its model
+files. compile_instrument() turns a declaration into what serving needs:
+the payload schema, a vectorized feature pipeline (one array conversion per
+batch, one scoring step, one matrix multiply for every subscale sum) and
+the smoke set hot reloads are checked with. compile_routes() turns the age
+bands into an interval table that route() searches with bisect.
+
+The single, batch, streaming, what-if and job paths in app.py all serve
+instruments through this registry, and so do model_loader.py, explain.py,
+whatif.py and train_model.py. Adding an instrument (say an adolescent
+questionnaire above 132 months) means writing its derived features,
+appending its declaration to DECLARATIONS and training its model; it is
+then routed by age and served at /predict/<name> like the others.
+"""
+from bisect import bisect_left
+from operator import itemgetter
+
+import numpy as np
+
+import schema
+from features import (
+    AQ_BLOCKS,
+    AQ_COLUMNS,
+    AQ_FEATURE_SOURCES,
+    AQ_FEATURES,
+    AQ_INPUT_FIELDS,
+    AQ_QUESTIONS,
+    AQ_SUBSCALES,
+    INVERTED_QUESTIONS,
+    MCHAT_BLOCKS,
+    MCHAT_COLUMNS,
+    MCHAT_FEATURE_SOURCES,
+    MCHAT_FEATURES,
+    MCHAT_INPUT_FIELDS,
+    MCHAT_QUESTIONS,
+    MCHAT_SUBSCALES,
+    aq_derived_features,
+    compile_feature_plan,
+    mchat_derived_features,
+    question_fields,
+    question_mask,
+    write_features,
+)
+
+# ============================================================================
+# DECLARATIONS
+# ============================================================================
+#
+# scoring is 'failure' (an item scores 1 when failed: answered "no", or
+# "yes" on an inverted item) or 'score' (the answer itself, reversed on
+# inverted items). blocks names the columns of the raw answer matrix
+# ('answers') and, under scored_block, of the scored one. Age bands are
+# inclusive, in months; an age on the edge of two bands goes to the first.
+
+DECLARATIONS = [
+    {
+        'name': 'mchat',
+        'label': 'M-CHAT',
+        'questions': MCHAT_QUESTIONS,
+        'answer_encoder': schema.encode_yes_no,
+        'answer_values': [0, 1],
+        # How what-if results read answers back
+        'answer_labels': {0: 'no', 1: 'yes'},
+        'scoring': 'failure',
+        'inverted': INVERTED_QUESTIONS,
+        'subscales': MCHAT_SUBSCALES,
+        'derive': mchat_derived_features,
+        'blocks': MCHAT_BLOCKS,
+        'scored_block': 'failed',
+        'columns': MCHAT_COLUMNS,
+        'features': MCHAT_FEATURES,
+        'input_fields': MCHAT_INPUT_FIELDS,
+        'feature_sources': MCHAT_FEATURE_SOURCES,
+        'age_months': (12, 36),
+        'age_unit': 'months',
+        'model_file': 'mchat_model.pkl',
+        'features_file': 'mchat_feature_names.pkl',
+        'export_file': 'mchat_model.npz',
+        'threshold_variable': 'ASD_MCHAT_THRESHOLD',
+    },
+    {
+        'name': 'aq',
+        'label': 'AQ',
+        'questions': AQ_QUESTIONS,
+        'answer_encoder': schema.encode_aq_score,
+        'answer_values': [0, 1, 2, 3],
+        'answer_labels': None,
+        'scoring': 'score',
+        'inverted': [],
+        'subscales': AQ_SUBSCALES,
+        'derive': aq_derived_features,
+        'blocks': AQ_BLOCKS,
+        'scored_block': None,
+        'columns': AQ_COLUMNS,
+        'features': AQ_FEATURES,
+        'input_fields': AQ_INPUT_FIELDS,
+        'feature_sources': AQ_FEATURE_SOURCES,
+        'age_months': (36, 132),
+        # The AQ model was trained on ages in years
+        'age_unit': 'years',
+        'model_file': 'aq_model.pkl',
+        'features_file': 'aq_feature_names.pkl',
+        'export_file': 'aq_model.npz',
+        'threshold_variable': 'ASD_AQ_THRESHOLD',
+    },
+]
+
+AGE_DIVISORS = {'months': 1, 'years': 12}
+
+
+# ============================================================================
+# AGE ROUTING
+# ============================================================================
+
+def compile_routes(declarations):
+    """Interval table of the age bands, ordered by upper edge.
+
+    An age routes to the first band whose upper edge is at or above it
+    (one bisect), provided it is not below that band's lower edge. Raises
+    ValueError for bands that overlap beyond a shared edge.
+    """
+    bands = sorted(declarations, key=lambda declaration: declaration['age_months'][1])
+    for previous, band in zip(bands, bands[1:]):
+        if band['age_months'][0] < previous['age_months'][1]:
+            raise ValueError(f"Age bands of {previous['name']} and {band['name']} overlap")
+    return {
+        'upper': [band['age_months'][1] for band in bands],
+        'lower': [band['age_months'][0] for band in bands],
+        'names': [band['name'] for band in bands],
+        'labels': [band['label'] for band in bands],
+    }
+
+
+ROUTES = compile_routes(DECLARATIONS)
+
+
+def route(age_in_months):
+    """Pick the instrument for an age in months.
+
+    Returns (name, None), or (None, error_body) for an age no band covers.
+    """
+    i = bisect_left(ROUTES['upper'], age_in_months)
+    if i < len(ROUTES['upper']) and age_in_months >= ROUTES['lower'][i]:
+        return ROUTES['names'][i], None
+
+    years = age_in_months / 12
+    if i == 0:
+        return None, {
+            'error': 'Age out of range',
+            'message': f"Child is too young ({age_in_months} months / {years:.1f} years). "
+                       f"{ROUTES['labels'][0]} is for {ROUTES['lower'][0]}-{ROUTES['upper'][0]} months minimum."
+        }
+    if i == len(ROUTES['upper']):
+        oldest = ROUTES['upper'][-1]
+        return None, {
+            'error': 'Age out of range',
+            'message': f"Child is too old ({age_in_months} months / {years:.1f} years). "
+                       f"Maximum supported: {ROUTES['labels'][-1]} for up to {oldest / 12:g} years ({oldest} months). "
+                       f"Consider using adult ASD screening tools."
+        }
+    return None, {
+        'error': 'Age out of range',
+        'message': f"No screening instrument covers {age_in_months} months. "
+                   f"{ROUTES['labels'][i - 1]} ends at {ROUTES['upper'][i - 1]} months and "
+                   f"{ROUTES['labels'][i]} starts at {ROUTES['lower'][i]} months."
+    }
+
+
+def age_range(instrument):
+    # The band in the instrument's own unit: "12-36 months", "3-11 years"
+    lower, upper = instrument['age_months']
+    if instrument['age_unit'] == 'months':
+        return f'{lower}-{upper} months'
+    return f'{lower / 12:g}-{upper / 12:g} years'
+
+
+def band_error(instrument, age_in_months):
+    # Error body for an age outside the instrument's band (the /predict/<name>
+    # endpoints, which skip routing), else None
+    lower, upper = instrument['age_months']
+    if lower <= age_in_months <= upper:
+        return None
+    band = f'{lower}-{upper} months'
+    if instrument['age_unit'] != 'months':
+        band += f' ({age_range(instrument)})'
+    return {
+        'error': f"Invalid age for {instrument['label']}",
+        'message': f"{instrument['label']} is for ages {band}. Provided: {age_in_months} months."
+    }
+
+
+def model_age(instrument, age_in_months):
+    # Age in the unit the instrument's model was trained on; months stay as
+    # sent so results echo them back unchanged
+    divisor = AGE_DIVISORS[instrument['age_unit']]
+    return age_in_months if divisor == 1 else age_in_months / divisor
+
+
+# ============================================================================
+# FEATURE PIPELINES
+# ============================================================================
+
+def compile_pipeline(declaration, instrument_schema):
+    """Compile a declaration into its vectorized feature functions.
+
+    Returns (encode, build_features): encode turns payload dicts into
+    (answers, age, gender, jaundice, family_history) arrays, build_features
+    turns those arrays into the (n, plan width) model input matrix.
+    """
+    n_questions = declaration['questions']
+    inverted = question_mask(declaration['inverted'], n_questions)
+    top_answer = max(declaration['answer_values'])
+    subscales = list(declaration['subscales'])
+    # Membership matrix (questions x subscales + total): one integer matrix
+    # multiply with the scored answers gives every subscale sum at once
+    membership = np.column_stack(
+        [question_mask(questions, n_questions) for questions in declaration['subscales'].values()]
+        + [np.ones(n_questions, dtype=bool)]
+    ).astype(np.int32)
+
+    # Schema order: the demographics, then the answers
+    fields = instrument_schema['fields']
+    n_demographics = len(fields) - n_questions
+    encoders = [encode for _, encode in instrument_schema['encoders']]
+    getter = itemgetter(*fields)
+
+    def encode(records):
+        # Validated rows (schema.validate) are already numbers: one getter
+        # call per row and a single array conversion. Raw payloads ("yes",
+        # "Male") go through the schema's encoders value by value.
+        rows = [getter(record) for record in records]
+        try:
+            values = np.array(rows, dtype=np.float64).reshape(len(rows), len(fields))
+        except (TypeError, ValueError):
+            values = None
+        if values is None or np.isnan(values).any():
+            values = np.array(
+                [[encode_value(value) for encode_value, value in zip(encoders, row)] for row in rows],
+                dtype=np.float64
+            ).reshape(len(rows), len(fields))
+        age = values[:, 0]
+        gender, jaundice, family_history = values[:, 1:n_demographics].astype(np.int8).T
+        answers = values[:, n_demographics:].astype(np.int8)
+        return answers, age, gender, jaundice, family_history
+
+    def build_features(answers, age, gender, jaundice, family_history, plan):
+        answers = np.asarray(answers, dtype=np.int32)
+        columns = {
+            'Age': np.asarray(age, dtype=np.float64),
+            'Gender': np.asarray(gender, dtype=np.int32),
+            'Jaundice': np.asarray(jaundice, dtype=np.int32),
+            'Family_ASD_History': np.asarray(family_history, dtype=np.int32),
+        }
+
+        if declaration['scoring'] == 'failure':
+            scored = np.where(inverted, answers, answers == 0).astype(np.int32)
+        elif inverted.any():
+            scored = np.where(inverted, top_answer - answers, answers)
+        else:
+            scored = answers
+
+        sums = scored @ membership
+        declaration['derive'](scored, dict(zip(subscales, sums.T)), sums[:, -1], columns)
+
+        blocks = {'answers': answers}
+        if declaration['scored_block']:
+            blocks[declaration['scored_block']] = scored
+        return write_features(plan, len(answers), blocks, columns)
+
+    return encode, build_features
+
+
+def compile_instrument(declaration):
+    """Everything serving needs for one declared instrument."""
+    question_names = question_fields(range(1, declaration['questions'] + 1))
+    answer_encoder = declaration['answer_encoder']
+    instrument_schema = schema.compile_schema(
+        declaration['label'],
+        schema.DEMOGRAPHIC_FIELDS + [(field, answer_encoder) for field in question_names]
+    )
+    encode, build_features = compile_pipeline(declaration, instrument_schema)
+    instrument = dict(declaration, question_fields=question_names, schema=instrument_schema)
+
+    def compile_plan(feature_names):
+        return compile_feature_plan(feature_names, declaration['blocks'], declaration['columns'])
+
+    def preprocess(records, plan):
+        """Build the model input matrix of payload dicts in plan order."""
+        return build_features(*encode(records), plan)
+
+    lower, upper = declaration['age_months']
+    # Every whole month routed to this instrument (what-if age curves)
+    ages = [months for months in range(lower, upper + 1) if route(months)[0] == declaration['name']]
+
+    def smoke_set(plan, rows, rng):
+        # Random answers and routed ages, as the model sees them
+        answers = rng.integers(0, len(declaration['answer_values']), size=(rows, declaration['questions']), dtype=np.int8)
+        age = rng.integers(ages[0], ages[-1] + 1, size=rows) / AGE_DIVISORS[declaration['age_unit']]
+        gender, jaundice, family_history = rng.integers(0, 2, size=(3, rows), dtype=np.int8)
+        return build_features(answers, age, gender, jaundice, family_history, plan)
+
+    instrument.update(
+        encode=encode,
+        build_features=build_features,
+        preprocess=preprocess,
+        compile_plan=compile_plan,
+        smoke_set=smoke_set,
+        ages=ages,
+        age_range=age_range(declaration),
+    )
+    return instrument
+
+
+# name -> compiled instrument, in declaration order
+INSTRUMENTS = {declaration['name']: compile_instrument(declaration) for declaration in DECLARATIONS}
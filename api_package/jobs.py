@@ -0,0 +1,359 @@
+import csv
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Uploaded files, result files and the SQLite job table live here. Point
+# every server process at the same directory so any worker can report on
+# any job.
+JOB_DIR = os.environ.get(
+    'ASD_JOB_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs')
+)
+# Background threads scoring jobs in each server process
+JOB_WORKERS = int(os.environ.get('ASD_JOB_WORKERS', 2))
+# Records scored per chunk; progress is saved after every chunk
+JOB_CHUNK_ROWS = int(os.environ.get('ASD_JOB_CHUNK_ROWS', 1000))
+
+# Each process refreshes the heartbeat of the jobs it has queued or running
+# this often. A job whose heartbeat is older than ASD_JOB_STALE_SECONDS lost
+# its process (recycled by max_requests, or crashed) and is marked failed.
+JOB_HEARTBEAT_SECONDS = 10
+JOB_STALE_SECONDS = float(os.environ.get('ASD_JOB_STALE_SECONDS', 60))
+
+JOB_FORMATS = ('csv', 'jsonl')
+ACTIVE_STATUSES = ('queued', 'running')
+STALE_ERROR = 'The server process running this job stopped before it finished. Upload the file again.'
+
+_EXECUTOR = None
+# ids of the jobs queued or running in this process, for the heartbeat
+_ACTIVE = set()
+_ACTIVE_LOCK = threading.Lock()
+
+
+# ============================================================================
+# JOB STORE (SQLite)
+# ============================================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    format TEXT NOT NULL,
+    filename TEXT,
+    total INTEGER,
+    processed INTEGER NOT NULL DEFAULT 0,
+    succeeded INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    updated_at REAL NOT NULL,
+    heartbeat_at REAL
+)
+"""
+
+
+def database_path():
+    return os.path.join(JOB_DIR, 'jobs.sqlite3')
+
+
+def connect():
+    # One short-lived connection per call keeps the store safe to use from
+    # request threads, job threads and other processes alike
+    os.makedirs(JOB_DIR, exist_ok=True)
+    connection = sqlite3.connect(database_path(), timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute(SCHEMA)
+    return connection
+
+
+def update_job(job_id, **fields):
+    fields['updated_at'] = time.time()
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+    with connect() as connection:
+        connection.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', [*fields.values(), job_id])
+
+
+def get_job(job_id):
+    """Return the job as a dict, or None if it does not exist."""
+    with connect() as connection:
+        row = connection.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    if job['status'] in ACTIVE_STATUSES and is_stale(job) and fail_stale_jobs(job_id):
+        return get_job(job_id)
+    job['progress'] = round(job['processed'] / job['total'], 4) if job['total'] else None
+    return job
+
+
+def job_path(job_id, name):
+    return os.path.join(JOB_DIR, job_id, name)
+
+
+def results_path(job_id):
+    return job_path(job_id, 'results.jsonl')
+
+
+# ============================================================================
+# INPUT PARSING
+# ============================================================================
+
+def coerce_csv_value(value):
+    # CSV cells arrive as text; numbers must become numbers again so ages
+    # route and AQ scores compute exactly as they do for JSON payloads
+    value = value.strip()
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+class UnreadableLine(dict):
+    """Error body standing in for a line that could not be parsed.
+
+    Its type, not its keys, marks it: a record may well have an 'error' field.
+    """
+
+
+def read_records(path, fmt):
+    """Yield one record (or an UnreadableLine) per row."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield {key: coerce_csv_value(value) for key, value in row.items() if key and value is not None}
+            return
+
+        yield from parse_json_lines(f)
+
+
+def parse_json_lines(lines):
+    """Yield one record (or an UnreadableLine) per line.
+
+    Blank lines are skipped. Works on text or bytes lines, so it can read a
+    file or a streamed request body without holding either in memory.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield UnreadableLine(error='Invalid JSON', message=f'Line {line_number}: {e}')
+
+
+def count_records(path, fmt):
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            return sum(1 for _ in csv.DictReader(f))
+        return sum(1 for line in f if line.strip())
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ============================================================================
+# RUNNING JOBS
+# ============================================================================
+
+def score_chunk(chunk, score_records):
+    """Score a chunk from parse_json_lines()/read_records(), in order.
+
+    Lines that failed to parse keep their error body and are not scored.
+    """
+    scorable = [i for i, record in enumerate(chunk) if not isinstance(record, UnreadableLine)]
+    results = list(chunk)
+    for i, result in zip(scorable, score_records([chunk[i] for i in scorable])):
+        results[i] = result
+    return results
+
+
+def executor():
+    # Created on first use, with the heartbeat thread, so no threads exist
+    # before gunicorn forks
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='asd-job')
+        threading.Thread(target=heartbeat, args=(JOB_HEARTBEAT_SECONDS,), name='asd-job-heartbeat', daemon=True).start()
+    return _EXECUTOR
+
+
+def job_owner():
+    # The process a job was submitted to, as shown by GET /jobs/<id>
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def send_heartbeat():
+    # Mark every job queued or running in this process as still alive
+    with _ACTIVE_LOCK:
+        active = list(_ACTIVE)
+    if not active:
+        return
+    with connect() as connection:
+        connection.execute(
+            f"UPDATE jobs SET heartbeat_at = ? WHERE id IN ({', '.join('?' * len(active))})",
+            [time.time(), *active]
+        )
+
+
+def heartbeat(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            send_heartbeat()
+        except sqlite3.Error as e:
+            print(f"⚠ Warning: Job heartbeat failed: {e}")
+
+
+def is_stale(job):
+    # A job never picked up has only its creation time to go by
+    last_seen = job['heartbeat_at'] or job['created_at']
+    return last_seen < time.time() - JOB_STALE_SECONDS
+
+
+def fail_stale_jobs(job_id=None):
+    """Mark queued or running jobs whose process stopped as failed.
+
+    Only jobs whose heartbeat is older than JOB_STALE_SECONDS are touched,
+    all of them or just job_id. Returns how many were marked.
+    """
+    now = time.time()
+    query = (
+        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, updated_at = ? "
+        "WHERE status IN ('queued', 'running') AND COALESCE(heartbeat_at, created_at) < ?"
+    )
+    params = [STALE_ERROR, now, now, now - JOB_STALE_SECONDS]
+    if job_id is not None:
+        query += ' AND id = ?'
+        params.append(job_id)
+    with connect() as connection:
+        return connection.execute(query, params).rowcount
+
+
+def recover_stale_jobs():
+    """Fail the jobs left behind by stopped processes; run at startup."""
+    if not os.path.exists(database_path()):
+        return 0
+    recovered = fail_stale_jobs()
+    if recovered:
+        print(f"⚠ Warning: Marked {recovered} job(s) failed whose server process stopped")
+    return recovered
+
+
+def create_job(stream, fmt, filename=None):
+    """Store an uploaded file and register it as a queued job."""
+    if fmt not in JOB_FORMATS:
+        raise ValueError(f'Unsupported format {fmt!r}; expected one of {JOB_FORMATS}')
+
+    job_id = uuid.uuid4().hex
+    os.makedirs(os.path.join(JOB_DIR, job_id))
+    with open(job_path(job_id, f'input.{fmt}'), 'wb') as f:
+        shutil.copyfileobj(stream, f, 1 << 20)
+
+    now = time.time()
+    with connect() as connection:
+        connection.execute(
+            'INSERT INTO jobs (id, status, format, filename, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, 'queued', fmt, filename, now, now)
+        )
+    return get_job(job_id)
+
+
+def submit(job_id, score_records):
+    """Queue a created job on the background pool of this process."""
+    with _ACTIVE_LOCK:
+        _ACTIVE.add(job_id)
+    update_job(job_id, owner=job_owner(), heartbeat_at=time.time())
+    executor().submit(run_job, job_id, score_records)
+
+
+def run_job(job_id, score_records):
+    """Score a job's file chunk by chunk, writing one JSON result per line.
+
+    score_records(records) must return one result or error body per record,
+    in order. Results are written to a temporary file that is renamed into
+    place only when the whole job succeeds.
+    """
+    job = get_job(job_id)
+    input_path = job_path(job_id, f'input.{job["format"]}')
+    partial_path = results_path(job_id) + '.partial'
+
+    try:
+        update_job(job_id, status='running', started_at=time.time(), total=count_records(input_path, job['format']))
+        processed = succeeded = failed = 0
+
+        with open(partial_path, 'w', encoding='utf-8') as out:
+            for chunk in chunks(read_records(input_path, job['format']), JOB_CHUNK_ROWS):
+                for offset, result in enumerate(score_chunk(chunk, score_records)):
+                    out.write(json.dumps(dict(result, index=processed + offset)) + '\n')
+                    if 'error' in result:
+                        failed += 1
+                    else:
+                        succeeded += 1
+
+                processed += len(chunk)
+                update_job(job_id, processed=processed, succeeded=succeeded, failed=failed)
+
+        os.replace(partial_path, results_path(job_id))
+        update_job(job_id, status='completed', finished_at=time.time())
+    except Exception as e:
+        update_job(
+            job_id,
+            status='failed',
+            finished_at=time.time(),
+            error=f'{e}\n{traceback.format_exc()}'
+        )
+    finally:
+        with _ACTIVE_LOCK:
+            _ACTIVE.discard(job_id)
+
+
+def job_events(job_id, interval=1.0):
+    """Yield Server-Sent Events with the job status until it finishes."""
+    while True:
+        job = get_job(job_id)
+        yield f'data: {json.dumps(job)}\n\n'
+        if job is None or job['status'] in ('completed', 'failed'):
+            return
+        time.sleep(interval)
+
+
+def detect_format(filename=None, content_type=None, requested=None):
+    # Explicit ?format= wins, then the file extension, then the content type
+    if requested:
+        return requested.lower()
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension in ('csv', 'jsonl', 'ndjson'):
+        return 'csv' if extension == 'csv' else 'jsonl'
+    content_type = (content_type or '').lower()
+    if 'csv' in content_type:
+        return 'csv'
+    if 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'jsonl'
+    return None
+
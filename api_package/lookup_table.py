@@ -0,0 +1,319 @@
+"""Precomputed M-CHAT lookup table.
+
+The M-CHAT input space is finite: 2^23 answer patterns x Gender x Jaundice
+x Family_ASD_History x integer ages 12-36. This tool scores the whole space
+(or a chosen set of ages) through the real feature engine and model once,
+offline, and stores every result as a 16-bit code in a memory-mapped .npy
+file. With ASD_MCHAT_LOOKUP_TABLE pointing at the file, the API answers
+covered M-CHAT requests with one indexed read instead of running inference.
+
+Build (one process per core by default):
+    python lookup_table.py build --out outputs/mchat_table.npy
+    python lookup_table.py build --out outputs/mchat_table.npy --ages 18 24 30 --workers 8
+
+Inspect:
+    python lookup_table.py info outputs/mchat_table.npy
+
+Every table records the sha256 of the model file it was built from, and the
+API refuses to serve a table whose hash does not match the loaded model.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from features import MCHAT_QUESTIONS
+from instruments import INSTRUMENTS
+from model_loader import MODEL_DIR, file_sha256
+
+# ============================================================================
+# TABLE LAYOUT
+# ============================================================================
+
+FORMAT_VERSION = 1
+MCHAT = INSTRUMENTS['mchat']
+MCHAT_AGES = MCHAT['ages']
+
+# Each entry is a uint16: bit 15 holds the predicted label, bits 0-14 the
+# ASD probability quantized to 1/32767 (worst-case error 1.5e-5)
+LABEL_BIT = 15
+PROBA_SCALE = (1 << LABEL_BIT) - 1
+
+ANSWER_PATTERNS = 1 << MCHAT_QUESTIONS
+# Gender, Jaundice and Family_ASD_History bits for every age
+DEMOGRAPHIC_PATTERNS = 8
+ROWS_PER_AGE = DEMOGRAPHIC_PATTERNS * ANSWER_PATTERNS
+
+ANSWER_WEIGHTS = np.left_shift(1, np.arange(MCHAT_QUESTIONS, dtype=np.int64))
+
+
+def table_index(answers, gender, jaundice, family_history, age_slot):
+    """Row of each record: age slot, then the 3 flags, then the 23 answer bits."""
+    packed = np.asarray(answers, dtype=np.int64) @ ANSWER_WEIGHTS
+    demographic = (
+        (np.asarray(family_history, dtype=np.int64) << 2)
+        | (np.asarray(jaundice, dtype=np.int64) << 1)
+        | np.asarray(gender, dtype=np.int64)
+    )
+    return (np.asarray(age_slot, dtype=np.int64) * DEMOGRAPHIC_PATTERNS + demographic) * ANSWER_PATTERNS + packed
+
+
+def decode_rows(start, stop, ages):
+    # Inverse of table_index for a contiguous block of rows
+    rows = np.arange(start, stop, dtype=np.int64)
+    packed = rows % ANSWER_PATTERNS
+    demographic = (rows // ANSWER_PATTERNS) % DEMOGRAPHIC_PATTERNS
+    age_slot = rows // ROWS_PER_AGE
+
+    answers = ((packed[:, None] >> np.arange(MCHAT_QUESTIONS)) & 1).astype(np.int8)
+    gender = (demographic & 1).astype(np.int8)
+    jaundice = ((demographic >> 1) & 1).astype(np.int8)
+    family_history = ((demographic >> 2) & 1).astype(np.int8)
+    age = np.asarray(ages, dtype=np.float64)[age_slot]
+    return answers, age, gender, jaundice, family_history
+
+
+def encode_entries(predictions, prediction_probas):
+    quantized = np.rint(np.clip(prediction_probas[:, 1], 0, 1) * PROBA_SCALE).astype(np.uint16)
+    return quantized | (np.asarray(predictions, dtype=np.uint16) << LABEL_BIT)
+
+
+def decode_entries(entries):
+    # Returns (predictions, (n, 2) probabilities)
+    predictions = (entries >> LABEL_BIT).astype(np.int64)
+    asd = (entries & PROBA_SCALE).astype(np.float64) / PROBA_SCALE
+    return predictions, np.column_stack([1 - asd, asd])
+
+
+def meta_path(table_path):
+    return table_path + '.json'
+
+
+# ============================================================================
+# BUILD
+# ============================================================================
+
+_WORKER = {}
+
+
+def init_worker(model_path, features_path, table_path, ages):
+    # Runs once per worker process: load the model and map the output file
+    features = list(joblib.load(features_path))
+    _WORKER['model'] = joblib.load(model_path)
+    _WORKER['plan'] = MCHAT['compile_plan'](features)
+    _WORKER['table'] = np.load(table_path, mmap_mode='r+')
+    _WORKER['ages'] = ages
+
+
+def score_rows(start, stop):
+    """Score table rows [start, stop) and write them into the mapped file."""
+    model = _WORKER['model']
+    plan = _WORKER['plan']
+    X = MCHAT['build_features'](*decode_rows(start, stop, _WORKER['ages']), plan)
+    X = pd.DataFrame(X, columns=plan['feature_names'])
+    prediction_probas = model.predict_proba(X)
+    predictions = model.classes_.take(np.argmax(prediction_probas, axis=1))
+    _WORKER['table'][start:stop] = encode_entries(predictions, prediction_probas)
+    return stop - start
+
+
+def build_table(model_path, features_path, out_path, ages=None, workers=None, chunk_rows=1 << 18):
+    """Score every covered input and write the table plus its metadata."""
+    ages = sorted(set(ages or MCHAT_AGES))
+    if any(age not in MCHAT_AGES for age in ages):
+        raise ValueError(f'Ages must be integers within 12-36 months: {ages}')
+
+    total_rows = len(ages) * ROWS_PER_AGE
+    workers = workers or os.cpu_count()
+    model_sha256 = file_sha256(model_path)
+
+    # A stale metadata file would vouch for a half-written table
+    if os.path.exists(meta_path(out_path)):
+        os.remove(meta_path(out_path))
+    table = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.uint16, shape=(total_rows,))
+    del table
+
+    print(f"Scoring {total_rows:,} inputs ({len(ages)} ages) with {workers} workers...")
+    start_time = time.perf_counter()
+    done = 0
+    chunks = [(start, min(start + chunk_rows, total_rows)) for start in range(0, total_rows, chunk_rows)]
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(model_path, features_path, out_path, ages),
+    ) as pool:
+        futures = [pool.submit(score_rows, start, stop) for start, stop in chunks]
+        for future in as_completed(futures):
+            done += future.result()
+            elapsed = time.perf_counter() - start_time
+            print(f"  {done:,}/{total_rows:,} rows ({100 * done / total_rows:.1f}%) in {elapsed:.0f}s", end='\r')
+
+    elapsed = time.perf_counter() - start_time
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'model': 'mchat',
+        'model_sha256': model_sha256,
+        'feature_names': list(joblib.load(features_path)),
+        'ages': ages,
+        'rows': total_rows,
+        'dtype': 'uint16',
+        'label_bit': LABEL_BIT,
+        'proba_scale': PROBA_SCALE,
+        'build_seconds': round(elapsed, 1),
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    # Metadata is written last, so only a completed table is ever served
+    with open(meta_path(out_path), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"\n✓ Lookup table written to {out_path} in {elapsed:.0f}s")
+    return meta
+
+
+# ============================================================================
+# SERVING
+# ============================================================================
+
+def load_table(path):
+    """Memory-map a built table. Raises ValueError if it is incomplete."""
+    if not os.path.exists(meta_path(path)):
+        raise ValueError(f'No metadata next to {path}; the build did not finish')
+    with open(meta_path(path)) as f:
+        meta = json.load(f)
+    if meta.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f'Unsupported table format: {meta.get("format_version")}')
+
+    values = np.load(path, mmap_mode='r')
+    if values.shape != (meta['rows'],) or values.dtype != np.uint16:
+        raise ValueError(f'Table shape {values.shape} / {values.dtype} does not match its metadata')
+
+    age_slots = np.full(max(MCHAT_AGES) + 1, -1, dtype=np.int64)
+    age_slots[meta['ages']] = np.arange(len(meta['ages']))
+    return {'path': path, 'meta': meta, 'values': values, 'age_slots': age_slots}
+
+
+def check_table(table, bundle):
+    """Return None if the table was built from this model, else the reason."""
+    if table['meta']['model_sha256'] != bundle['sha256']:
+        return 'model hash mismatch: table was built from a different model file'
+    if table['meta']['feature_names'] != bundle['features']:
+        return 'feature list mismatch'
+    return None
+
+
+def lookup(table, records):
+    """Read results for records the table covers.
+
+    Returns (served, predictions, prediction_probas); rows where served is
+    False (ages outside the table, non-integer ages) must be inferred.
+    """
+    answers, age, gender, jaundice, family_history = MCHAT['encode'](records)
+
+    whole = (age == np.floor(age)) & (age >= 0) & (age < len(table['age_slots']))
+    age_slot = np.full(len(records), -1, dtype=np.int64)
+    age_slot[whole] = table['age_slots'][age[whole].astype(np.int64)]
+    served = age_slot >= 0
+
+    index = table_index(answers[served], gender[served], jaundice[served], family_history[served], age_slot[served])
+    predictions = np.zeros(len(records), dtype=np.int64)
+    prediction_probas = np.zeros((len(records), 2), dtype=np.float64)
+    predictions[served], prediction_probas[served] = decode_entries(table['values'][index])
+    return served, predictions, prediction_probas
+
+
+# Table the API serves M-CHAT requests from; unset means always infer
+LOOKUP_TABLE_PATH = os.environ.get('ASD_MCHAT_LOOKUP_TABLE')
+
+_SERVING = {'table': None, 'status': 'disabled', 'reason': None, 'hits': 0}
+# Request and coalescer threads all count hits
+_HITS_LOCK = threading.Lock()
+
+
+def attach(bundle):
+    """Validate the configured table against a freshly loaded M-CHAT model.
+
+    Called on every M-CHAT (re)load. A table built from another model file
+    is refused and requests fall back to inference.
+    """
+    if not LOOKUP_TABLE_PATH:
+        return
+    try:
+        # Read from disk every time: a table rebuilt for the new model
+        # replaces the one in memory
+        table = load_table(LOOKUP_TABLE_PATH)
+        reason = check_table(table, bundle)
+    except (OSError, ValueError) as e:
+        table, reason = None, str(e)
+
+    _SERVING['table'] = table
+    _SERVING['reason'] = reason
+    _SERVING['status'] = 'refused' if reason else 'active'
+    if reason:
+        print(f"⚠ Warning: Not serving M-CHAT lookup table {LOOKUP_TABLE_PATH}: {reason}")
+    else:
+        print(f"✓ Serving M-CHAT lookup table {LOOKUP_TABLE_PATH} ({table['meta']['rows']:,} entries)")
+
+
+def active_table(bundle):
+    # The table only answers for the exact model file it was built from
+    table = _SERVING['table']
+    if _SERVING['status'] != 'active' or table['meta']['model_sha256'] != bundle['sha256']:
+        return None
+    return table
+
+
+def record_hits(count):
+    with _HITS_LOCK:
+        _SERVING['hits'] += count
+
+
+def serving_status():
+    # Lookup table state for /health
+    table = _SERVING['table']
+    with _HITS_LOCK:
+        hits = _SERVING['hits']
+    return {
+        'path': LOOKUP_TABLE_PATH,
+        'status': _SERVING['status'],
+        'reason': _SERVING['reason'],
+        'ages': table['meta']['ages'] if table else None,
+        'hits': hits,
+    }
+
+
+# ============================================================================
+# COMMAND LINE
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='score the input space and write a table')
+    build.add_argument('--model', default=os.path.join(MODEL_DIR, 'mchat_model.pkl'))
+    build.add_argument('--features', default=os.path.join(MODEL_DIR, 'mchat_feature_names.pkl'))
+    build.add_argument('--out', default=os.path.join(MODEL_DIR, 'mchat_table.npy'))
+    build.add_argument('--ages', type=int, nargs='+', help='ages in months to cover (default: 12-36)')
+    build.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+    build.add_argument('--chunk-rows', type=int, default=1 << 18, help='rows scored per task')
+
+    info = commands.add_parser('info', help='print the metadata of a built table')
+    info.add_argument('table')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        build_table(args.model, args.features, args.out, args.ages, args.workers, args.chunk_rows)
+    else:
+        table = load_table(args.table)
+        print(json.dumps(dict(table['meta'], feature_names=len(table['meta']['feature_names'])), indent=2))
+
+
+if __name__ == '__main__':
+    main()
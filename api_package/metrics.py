@@ -0,0 +1,238 @@
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Opt-in sampling profiler: requests slower than this many milliseconds dump
+# a flamegraph-compatible profile. 0 (the default) turns the profiler off.
+PROFILE_SLOW_MS = float(os.environ.get('ASD_PROFILE_SLOW_MS', 0))
+# How often the profiler samples the stacks of in-flight requests
+PROFILE_INTERVAL_MS = float(os.environ.get('ASD_PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = os.environ.get(
+    'ASD_PROFILE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+)
+
+
+# ============================================================================
+# HISTOGRAMS
+# ============================================================================
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """Thread-safe Prometheus-style histogram with a fixed set of labels."""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # label values -> [count per bucket (last is +Inf), sum]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        # Text exposition format; bucket counts are cumulative
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self.series.items())
+
+        for label_values, counts, total in series:
+            labels = ','.join(
+                f'{name}="{escape_label(value)}"' for name, value in zip(self.label_names, label_values)
+            )
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total!r}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    'asd_request_duration_seconds',
+    'End-to-end latency of prediction requests.',
+    ('endpoint', 'model', 'status'),
+)
+STAGE_SECONDS = Histogram(
+    'asd_stage_duration_seconds',
+    'Latency of each stage of a prediction request.',
+    ('stage', 'model', 'status'),
+)
+COALESCED_BATCH_SIZE = Histogram(
+    'asd_coalesced_batch_size',
+    'Single-record requests scored together by the coalescer.',
+    ('model',),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+HISTOGRAMS = [REQUEST_SECONDS, STAGE_SECONDS, COALESCED_BATCH_SIZE]
+
+
+# ============================================================================
+# REQUEST TIMING
+# ============================================================================
+
+# Timings of the request running on the current thread
+_REQUEST = threading.local()
+
+
+def begin_request(endpoint):
+    """Start timing a request on this thread."""
+    _REQUEST.endpoint = endpoint
+    _REQUEST.model = 'none'
+    _REQUEST.stages = {}
+    _REQUEST.start = time.perf_counter()
+    if PROFILE_SLOW_MS > 0:
+        sampler().track(threading.get_ident())
+
+
+def set_model(model_name):
+    # Label for the model that served the current request
+    if getattr(_REQUEST, 'stages', None) is not None:
+        _REQUEST.model = model_name
+
+
+def add_stage(name, seconds):
+    # Add time measured elsewhere to a stage of the current request
+    stages = getattr(_REQUEST, 'stages', None)
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one stage of the current request.
+
+    Outside a timed request (batch jobs, background threads) this does
+    nothing. A stage entered twice in one request adds up.
+    """
+    stages = getattr(_REQUEST, 'stages', None)
+    if stages is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def end_request(status):
+    """Record the current request's timings under its final status code."""
+    stages = getattr(_REQUEST, 'stages', None)
+    if stages is None:
+        return
+    elapsed = time.perf_counter() - _REQUEST.start
+    model = _REQUEST.model
+    status = str(status)
+
+    REQUEST_SECONDS.observe((_REQUEST.endpoint, model, status), elapsed)
+    for name, seconds in stages.items():
+        STAGE_SECONDS.observe((name, model, status), seconds)
+    _REQUEST.stages = None
+
+    if PROFILE_SLOW_MS > 0:
+        samples = sampler().untrack(threading.get_ident())
+        if samples and elapsed * 1000 >= PROFILE_SLOW_MS:
+            path = write_profile(samples, _REQUEST.endpoint, elapsed)
+            print(f"⚠ Slow request ({_REQUEST.endpoint}, {elapsed * 1000:.1f}ms): profile written to {path}")
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ============================================================================
+# SAMPLING PROFILER
+# ============================================================================
+
+def fold_stack(frame):
+    # "outer;...;inner" frame names, the collapsed format flamegraph.pl and
+    # speedscope read
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_qualname} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    """Background thread that samples the stacks of tracked request threads."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = {}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name='asd-profiler', daemon=True)
+        self.thread.start()
+
+    def track(self, thread_id):
+        with self.lock:
+            self.samples[thread_id] = Counter()
+
+    def untrack(self, thread_id):
+        with self.lock:
+            return self.samples.pop(thread_id, None)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, counts in self.samples.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        counts[fold_stack(frame)] += 1
+
+
+_SAMPLER = None
+_SAMPLER_LOCK = threading.Lock()
+
+
+def sampler():
+    # Started on first use so the thread is created in each gunicorn worker,
+    # not in the master before forking
+    global _SAMPLER
+    if _SAMPLER is None:
+        with _SAMPLER_LOCK:
+            if _SAMPLER is None:
+                _SAMPLER = Sampler(PROFILE_INTERVAL_MS / 1000)
+    return _SAMPLER
+
+
+def write_profile(samples, endpoint, elapsed):
+    """Write collapsed stacks ("stack count" per line) and return the path."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{endpoint}-{elapsed * 1000:.0f}ms.folded"
+    path = os.path.join(PROFILE_DIR, name)
+    with open(path, 'w') as f:
+        for stack, count in samples.most_common():
+            f.write(f'{stack} {count}\n')
+    return path
@@ -0,0 +1,533 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import explain
+import tree_runtime
+from instruments import INSTRUMENTS
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Model artifacts live next to this file unless ASD_MODEL_DIR points elsewhere,
+# so the API loads the same files whatever directory the server starts in
+MODEL_DIR = os.environ.get(
+    'ASD_MODEL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outputs')
+)
+
+# Memory-map model arrays so workers on one host share them through the page
+# cache. This pays off with ASD_MODEL_RUNTIME=compiled, whose .npz exports
+# are nothing but node arrays: all of them are mapped. scikit-learn pickles
+# gain almost nothing, since joblib only maps plain NumPy buffers and each
+# tree unpickles its nodes into private memory. Set ASD_MODEL_MMAP=0 to load
+# fully into memory.
+MODEL_MMAP = os.environ.get('ASD_MODEL_MMAP', '1') == '1'
+
+# 'sklearn' unpickles the .pkl models. 'compiled' serves the .npz exports
+# written by export_model.py with the NumPy tree evaluator in
+# tree_runtime.py, so scikit-learn is never imported.
+MODEL_RUNTIME = os.environ.get('ASD_MODEL_RUNTIME', 'sklearn')
+
+# Poll the model files every this many seconds and hot-reload a model whose
+# files changed. 0 (the default) turns the watcher off.
+WATCH_SECONDS = float(os.environ.get('ASD_MODEL_WATCH_SECONDS', 0))
+
+# POST /admin/reload reaches a single worker. That worker reloads and then
+# rewrites this marker file, which the watcher of every worker polls (every
+# RELOAD_POLL_SECONDS when file watching is off), so all of them follow.
+# Defaults to .reload in the model directory.
+RELOAD_MARKER = os.environ.get('ASD_RELOAD_MARKER')
+ADMIN_RELOADS = bool(os.environ.get('ASD_ADMIN_TOKEN'))
+RELOAD_POLL_SECONDS = 1.0
+
+# Generated rows a new model version must score sensibly before it serves
+SMOKE_ROWS = 256
+
+
+def env_threshold(variable):
+    # Decision threshold on the ASD probability; unset keeps the model's own
+    # rule (the most probable class, exactly as predict() decides)
+    value = os.environ.get(variable)
+    return float(value) if value else None
+
+
+# One spec per declared instrument (see instruments.py)
+MODEL_SPECS = {
+    name: {
+        'label': instrument['label'],
+        'model_file': instrument['model_file'],
+        'features_file': instrument['features_file'],
+        'export_file': instrument['export_file'],
+        'compile_plan': instrument['compile_plan'],
+        'smoke_set': instrument['smoke_set'],
+        'threshold': env_threshold(instrument['threshold_variable']),
+    }
+    for name, instrument in INSTRUMENTS.items()
+}
+
+# name -> loaded bundle (model, features, plan and load statistics)
+_LOADED = {name: None for name in MODEL_SPECS}
+# name -> error message of a failed load; failures are not retried
+_ERRORS = {name: None for name in MODEL_SPECS}
+_LOCKS = {name: threading.Lock() for name in MODEL_SPECS}
+# Callables run with the model name after a model is (re)loaded
+_LOAD_HOOKS = []
+# name -> outcome of the last reload_model() call, for /health
+_RELOADS = {name: None for name in MODEL_SPECS}
+
+
+# ============================================================================
+# LOADING
+# ============================================================================
+
+def model_nbytes(model):
+    """Count the array bytes held by a fitted model.
+
+    Returns (total_bytes, mmap_bytes). Walks instance attributes, containers
+    and extension types that expose their arrays through __getstate__
+    (e.g. scikit-learn's Tree).
+    """
+    total = 0
+    mapped = 0
+    # Maps id -> object; holding the objects keeps the temporary arrays
+    # returned by __getstate__ alive so their ids cannot be reused
+    seen = {}
+    stack = [model]
+
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen[id(obj)] = obj
+
+        if isinstance(obj, np.ndarray):
+            total += obj.nbytes
+            base = obj
+            while isinstance(base, np.ndarray) and not isinstance(base, np.memmap):
+                base = base.base
+            if isinstance(base, np.memmap):
+                mapped += obj.nbytes
+            if obj.dtype == object:
+                stack.extend(obj.ravel())
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__'):
+            stack.extend(vars(obj).values())
+        elif type(obj).__module__.startswith('sklearn') and hasattr(obj, '__getstate__'):
+            state = obj.__getstate__()
+            if isinstance(state, dict):
+                stack.extend(state.values())
+
+    return total, mapped
+
+
+def file_sha256(path):
+    # Content hash of a model file; identifies the exact model version
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_identity(sha256, features):
+    # A model version is its file plus the feature list it is served with:
+    # changing either one changes the version, and with it the cache keys
+    listed = hashlib.sha256(json.dumps(list(features)).encode()).hexdigest()
+    return hashlib.sha256(f'{sha256}:{listed}'.encode()).hexdigest()
+
+
+def on_model_loaded(hook):
+    """Register hook(name) to run whenever a model is (re)loaded."""
+    _LOAD_HOOKS.append(hook)
+    return hook
+
+
+def model_files(spec):
+    # Files a load reads under the configured runtime
+    if MODEL_RUNTIME == 'compiled':
+        return [os.path.join(MODEL_DIR, spec['export_file'])]
+    return [os.path.join(MODEL_DIR, spec['model_file']), os.path.join(MODEL_DIR, spec['features_file'])]
+
+
+def read_model_files(spec):
+    # Returns (model, features, path, sha256) for the configured runtime
+    if MODEL_RUNTIME == 'compiled':
+        # The export carries its feature list and the hash of the .pkl it
+        # was made from, so caches and lookup tables keyed on that model
+        # stay valid
+        path = os.path.join(MODEL_DIR, spec['export_file'])
+        model = tree_runtime.load(path, mmap_mode='r' if MODEL_MMAP else None)
+        return model, model.feature_names, path, model.meta['source_sha256']
+
+    path = os.path.join(MODEL_DIR, spec['model_file'])
+    model = joblib.load(path, mmap_mode='r' if MODEL_MMAP else None)
+    features = list(joblib.load(os.path.join(MODEL_DIR, spec['features_file'])))
+    return model, features, path, file_sha256(path)
+
+
+def check_feature_list(model, features):
+    # A model fitted on named columns records them. A feature list from
+    # another training run (a deployment caught between its two renames)
+    # would feed it columns in the wrong order, so the pair is refused.
+    fitted = getattr(model, 'feature_names_in_', None)
+    if fitted is None or list(fitted) == list(features):
+        return
+    fitted, features = list(fitted), list(features)
+    i = next((i for i, (a, b) in enumerate(zip(fitted, features)) if a != b), min(len(fitted), len(features)))
+    raise ValueError(
+        f'Feature list does not match the columns the model was fitted on: {len(features)} listed, '
+        f'{len(fitted)} fitted; column {i} is {features[i] if i < len(features) else None!r} '
+        f'in the list and {fitted[i] if i < len(fitted) else None!r} in the model'
+    )
+
+
+def compile_bundle(name, model, features, model_path, sha256):
+    check_feature_list(model, features)
+    # Compile the feature list into a fixed column plan. A feature the
+    # preprocessors cannot produce stops here (ValueError) rather than being
+    # silently filled with 0 on every request.
+    plan = MODEL_SPECS[name]['compile_plan'](features)
+    total_bytes, mmap_bytes = model_nbytes(model)
+    # Attribution tables for ?explain=true, built once per model version
+    explainer, explain_error = explain.build_explainer(name, model, plan['feature_names'])
+    identity = model_identity(sha256, features)
+    return {
+        'name': name,
+        'model': model,
+        'features': features,
+        'plan': plan,
+        'path': model_path,
+        'runtime': MODEL_RUNTIME,
+        # Hash of the model file (what lookup tables and exports record)
+        'sha256': sha256,
+        'identity': identity,
+        # Short form of the identity, returned with every prediction
+        'version': identity[:12],
+        'threshold': MODEL_SPECS[name]['threshold'],
+        'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'bytes': total_bytes,
+        'mmap_bytes': mmap_bytes,
+        'explainer': explainer,
+        'explain_error': explain_error,
+    }
+
+
+def install(name, bundle):
+    # Serve a bundle. Replacing the dict entry is atomic: requests already
+    # holding the previous bundle finish with it.
+    _LOADED[name] = bundle
+    _ERRORS[name] = None
+    for hook in _LOAD_HOOKS:
+        hook(name)
+
+    print(f"✓ {MODEL_SPECS[name]['label']} model loaded successfully in {bundle['load_seconds']:.2f}s")
+    print(f"  Version: {bundle['version']}")
+    print(f"  Expected features: {len(bundle['features'])}")
+    print(f"  Array memory: {bundle['bytes']} bytes ({bundle['mmap_bytes']} memory-mapped, shared between workers)")
+    if MODEL_MMAP and bundle['mmap_bytes'] < bundle['bytes'] / 2:
+        print("  Most model arrays are private to this process; ASD_MODEL_RUNTIME=compiled maps them all")
+
+
+def load_model(name):
+    """Load one model and its feature list, replacing any loaded version.
+
+    Returns the loaded bundle, or None if the files could not be read. A
+    feature list the preprocessors cannot produce raises ValueError.
+    """
+    spec = MODEL_SPECS[name]
+
+    start = time.perf_counter()
+    signature = files_signature(name)
+    try:
+        loaded = read_model_files(spec)
+    except Exception as e:
+        print(f"⚠ Warning: Could not load {spec['label']} model: {e}")
+        _ERRORS[name] = str(e)
+        return None
+
+    try:
+        bundle = compile_bundle(name, *loaded)
+    except ValueError as e:
+        _ERRORS[name] = str(e)
+        raise
+    bundle['load_seconds'] = time.perf_counter() - start
+    bundle['files_signature'] = signature
+
+    install(name, bundle)
+    return bundle
+
+
+# ============================================================================
+# HOT RELOAD
+# ============================================================================
+
+def smoke_test(bundle, previous=None, rows=SMOKE_ROWS):
+    """Score a generated smoke set with a candidate bundle.
+
+    Raises ValueError if the model's output is unusable. Returns the share
+    of smoke rows on which it agrees with the previous version, if any.
+    """
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(
+        MODEL_SPECS[bundle['name']]['smoke_set'](bundle['plan'], rows, rng),
+        columns=bundle['plan']['feature_names']
+    )
+
+    classes = np.asarray(bundle['model'].classes_).tolist()
+    if classes != [0, 1]:
+        raise ValueError(f'model classes must be [0, 1], got {classes}')
+    probas = np.asarray(bundle['model'].predict_proba(X), dtype=np.float64)
+    if probas.shape != (rows, 2):
+        raise ValueError(f'predict_proba returned shape {probas.shape}, expected {(rows, 2)}')
+    if not np.isfinite(probas).all() or (probas < 0).any() or (probas > 1).any():
+        raise ValueError('predict_proba returned values outside [0, 1]')
+    if not np.allclose(probas.sum(axis=1), 1):
+        raise ValueError('predict_proba rows do not sum to 1')
+
+    if previous is None:
+        return None
+    previous_probas = np.asarray(previous['model'].predict_proba(X))
+    return float(np.mean(np.argmax(probas, axis=1) == np.argmax(previous_probas, axis=1)))
+
+
+def reload_model(name):
+    """Load the model's current files and swap them in if they pass checks.
+
+    The files are read and smoke-tested while the previous version keeps
+    serving; a version that fails keeps the previous one in place. Returns
+    the outcome (also shown on /health): status is 'reloaded', 'unchanged'
+    or 'rejected'.
+    """
+    spec = MODEL_SPECS[name]
+    with _LOCKS[name]:
+        previous = _LOADED[name]
+        outcome = {
+            'status': None,
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'version': None,
+            'previous_version': previous['version'] if previous else None,
+        }
+
+        start = time.perf_counter()
+        signature = files_signature(name)
+        try:
+            bundle = compile_bundle(name, *read_model_files(spec))
+            if previous is not None and bundle['identity'] == previous['identity']:
+                outcome.update(status='unchanged', version=previous['version'])
+            else:
+                outcome['smoke_agreement'] = smoke_test(bundle, previous)
+                outcome.update(status='reloaded', version=bundle['version'])
+        except Exception as e:
+            print(f"⚠ Warning: New {spec['label']} model rejected: {e}")
+            outcome.update(status='rejected', error=str(e), version=outcome['previous_version'])
+
+        if outcome['status'] == 'reloaded':
+            bundle['load_seconds'] = time.perf_counter() - start
+            bundle['files_signature'] = signature
+            install(name, bundle)
+        _RELOADS[name] = outcome
+    return outcome
+
+
+def files_signature(name):
+    # (path, mtime, size) of each file a load reads; None for a missing file
+    signature = []
+    for path in model_files(MODEL_SPECS[name]):
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None))
+    return tuple(signature)
+
+
+def poll_model_files(seen, pending):
+    """One pass of the file watcher: reload models whose files changed.
+
+    seen maps a model name to the signature last acted on; pending to a
+    changed signature waiting to settle. A change is acted on only once it
+    has stayed the same for a whole poll, so a file still being copied is
+    not loaded half-written.
+    """
+    for name in MODEL_SPECS:
+        signature = files_signature(name)
+        if signature == seen[name]:
+            pending.pop(name, None)
+            continue
+        if pending.get(name) != signature:
+            pending[name] = signature
+            continue
+
+        seen[name] = signature
+        del pending[name]
+        # A model nobody has asked for yet loads the new files on first use
+        if _LOADED[name] is not None or _ERRORS[name] is not None:
+            reload_model(name)
+
+
+def loaded_signatures():
+    # The files each model was loaded from, as the watcher starts from. A
+    # worker forked from a master that loaded older files reloads the
+    # current ones once they have settled.
+    return {
+        name: _LOADED[name]['files_signature'] if _LOADED[name] is not None else files_signature(name)
+        for name in MODEL_SPECS
+    }
+
+
+# pid of the process running the watcher; the last reload marker it acted on
+_WATCHER = {'pid': None, 'marker': None}
+
+
+def reload_marker_path():
+    return RELOAD_MARKER or os.path.join(MODEL_DIR, '.reload')
+
+
+def request_reload(names):
+    """Ask the watcher of every worker to reload the given models.
+
+    Call after reloading them in this process, which the marker then skips.
+    Returns False if the marker could not be written.
+    """
+    marker = json.dumps({
+        'id': uuid.uuid4().hex,
+        'models': list(names),
+        'at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'pid': os.getpid(),
+    })
+    path = reload_marker_path()
+    try:
+        # Written aside and renamed in, so a watcher never reads half of it
+        with open(f'{path}.{os.getpid()}.tmp', 'w') as f:
+            f.write(marker)
+        os.replace(f'{path}.{os.getpid()}.tmp', path)
+    except OSError as e:
+        print(f"⚠ Warning: Could not ask the other workers to reload: {e}")
+        return False
+    _WATCHER['marker'] = marker
+    return True
+
+
+def poll_reload_marker():
+    """Reload the models named in a reload marker this process has not seen.
+
+    A worker started after the last marker was written (a recycled worker,
+    forked from the master's preloaded models) acts on it once.
+    """
+    try:
+        with open(reload_marker_path()) as f:
+            marker = f.read()
+    except OSError:
+        return
+    if marker == _WATCHER['marker']:
+        return
+    _WATCHER['marker'] = marker
+    try:
+        names = json.loads(marker)['models']
+    except (ValueError, KeyError, TypeError):
+        print(f"⚠ Warning: Ignoring unreadable reload marker {reload_marker_path()}")
+        return
+    for name in names:
+        if name in MODEL_SPECS and (_LOADED[name] is not None or _ERRORS[name] is not None):
+            reload_model(name)
+
+
+def watch_model_files(interval, watch_files=True):
+    seen = loaded_signatures()
+    pending = {}
+    while True:
+        time.sleep(interval)
+        try:
+            poll_reload_marker()
+            if watch_files:
+                poll_model_files(seen, pending)
+        except Exception as e:
+            print(f"⚠ Warning: Model file watcher failed: {e}")
+
+
+def start_watcher():
+    """Start the watcher thread if ASD_MODEL_WATCH_SECONDS or ASD_ADMIN_TOKEN is set.
+
+    It polls the model files (with ASD_MODEL_WATCH_SECONDS) and the reload
+    marker (with ASD_ADMIN_TOKEN). Call once per serving process (gunicorn
+    does it after forking each worker); later calls in the same process do
+    nothing.
+    """
+    if (WATCH_SECONDS <= 0 and not ADMIN_RELOADS) or _WATCHER['pid'] == os.getpid():
+        return
+    _WATCHER['pid'] = os.getpid()
+    interval = WATCH_SECONDS if WATCH_SECONDS > 0 else RELOAD_POLL_SECONDS
+    threading.Thread(
+        target=watch_model_files, args=(interval, WATCH_SECONDS > 0), name='asd-model-watcher', daemon=True
+    ).start()
+
+
+def get_model(name):
+    """Return the loaded bundle for a model, loading it on first use.
+
+    Returns None if the model could not be loaded.
+    """
+    bundle = _LOADED[name]
+    if bundle is not None or _ERRORS[name] is not None:
+        return bundle
+
+    with _LOCKS[name]:
+        # Another thread may have finished loading while we waited
+        if _LOADED[name] is None and _ERRORS[name] is None:
+            try:
+                load_model(name)
+            except ValueError:
+                pass
+    return _LOADED[name]
+
+
+def load_models(names=None):
+    """Eagerly load the given models (all by default), e.g. before forking."""
+    for name in names or MODEL_SPECS:
+        with _LOCKS[name]:
+            if _LOADED[name] is None:
+                load_model(name)
+
+
+def model_status(name):
+    # Load state and statistics of one model, for /health
+    bundle = _LOADED[name]
+    if bundle is None:
+        return {
+            'loaded': False,
+            'error': _ERRORS[name],
+            'version': None,
+            'loaded_at': None,
+            'threshold': MODEL_SPECS[name]['threshold'],
+            'runtime': MODEL_RUNTIME,
+            'load_seconds': None,
+            'bytes': None,
+            'mmap_bytes': None,
+            'explainable': None,
+            'last_reload': _RELOADS[name],
+        }
+    return {
+        'loaded': True,
+        'error': None,
+        'version': bundle['version'],
+        'loaded_at': bundle['loaded_at'],
+        'threshold': bundle['threshold'],
+        'runtime': bundle['runtime'],
+        'load_seconds': round(bundle['load_seconds'], 4),
+        'bytes': bundle['bytes'],
+        'mmap_bytes': bundle['mmap_bytes'],
+        'explainable': bundle['explainer'] is not None,
+        'last_reload': _RELOADS[name],
+    }
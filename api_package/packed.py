@@ -0,0 +1,182 @@
+import json
+
+import numpy as np
+
+from instruments import INSTRUMENTS, route
+from schema import encode_gender, encode_yes_no
+
+# ============================================================================
+# PACKED FORMAT
+# ============================================================================
+#
+# A compact binary alternative to JSON for backend-to-API traffic. Every
+# integer and float is little-endian.
+#
+# Request body: PACKED_MAGIC followed by one 18-byte record per child:
+#     age          float64  age in months, as "Age" in JSON
+#     answers      uint64   2 bits per question, Q1 in the lowest bits,
+#                           as the instrument's schema encodes them
+#                           (M-CHAT yes=1/no=0, AQ scores 0-3)
+#     n_questions  uint8    the instrument's question count (23 for
+#                           M-CHAT, 30 for AQ); 0 for an age no instrument
+#                           covers
+#     flags        uint8    bit 0 male, bit 1 jaundice, bit 2 family history
+#
+# A record is decoded into the JSON payload it stands for and then routed
+# and validated exactly like one, so both formats give the same answers.
+#
+# Response body: PACKED_MAGIC, a uint32 record count, one 19-byte result per
+# record in input order, then a UTF-8 JSON object mapping the index of every
+# failed record to its error body ({} when all succeeded). A result's model
+# code is the instrument's position in instruments.DECLARATIONS, from 1.
+
+PACKED_MIMETYPE = 'application/vnd.asd.packed'
+PACKED_MAGIC = b'ASD\x01'
+
+RECORD_DTYPE = np.dtype([
+    ('age', '<f8'),
+    ('answers', '<u8'),
+    ('n_questions', 'u1'),
+    ('flags', 'u1'),
+])
+RESULT_DTYPE = np.dtype([
+    ('status', 'u1'),
+    ('model', 'u1'),
+    ('prediction', 'u1'),
+    ('no_asd', '<f8'),
+    ('asd', '<f8'),
+])
+
+# Every instrument in the registry must fit the record layout
+MAX_QUESTIONS = max(instrument['questions'] for instrument in INSTRUMENTS.values())
+if MAX_QUESTIONS > 32 or max(max(i['answer_values']) for i in INSTRUMENTS.values()) > 3:
+    raise ValueError('Packed records hold at most 32 questions of 2 bits each')
+QUESTION_SHIFTS = np.arange(MAX_QUESTIONS, dtype=np.uint64) * np.uint64(2)
+QUESTION_FIELDS = [f'Q{i}' for i in range(1, MAX_QUESTIONS + 1)]
+FLAG_FIELDS = ['Gender', 'Jaundice', 'Family_ASD_History']
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+MODEL_CODES = {name: code for code, name in enumerate(INSTRUMENTS, start=1)}
+MODEL_NAMES = {code: name for name, code in MODEL_CODES.items()}
+
+
+# ============================================================================
+# REQUESTS
+# ============================================================================
+
+def encode_records(records, model_name=None):
+    """Pack JSON-style payload dicts into a request body.
+
+    Each record is packed with the questions of the instrument its age routes
+    to, or of model_name for requests to /predict/<model_name>. A record no
+    instrument covers is packed without answers, so the API reports its age
+    as it would over JSON. Accepts the same values as the JSON API ("yes"/"no",
+    "male"/"female", 0/1, AQ scores 0-3) and raises ValueError for anything
+    else.
+    """
+    packed = np.zeros(len(records), dtype=RECORD_DTYPE)
+    for i, record in enumerate(records):
+        try:
+            age = float(record['Age'])
+            name = model_name or route(age)[0]
+            answers, n_questions = 0, 0
+            if name is not None:
+                instrument = INSTRUMENTS[name]
+                n_questions, encode = instrument['questions'], instrument['answer_encoder']
+                for shift, field in enumerate(instrument['question_fields']):
+                    answers |= encode(record[field]) << (2 * shift)
+            flags = (
+                encode_gender(record['Gender'])
+                | encode_yes_no(record['Jaundice']) << 1
+                | encode_yes_no(record['Family_ASD_History']) << 2
+            )
+            packed[i] = (age, answers, n_questions, flags)
+        except KeyError as e:
+            raise ValueError(f'record {i}: missing field {e.args[0]}')
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'record {i}: {e}')
+    return PACKED_MAGIC + packed.tobytes()
+
+
+def decode_records(body):
+    """Unpack a request body into JSON-style payload dicts.
+
+    Raises ValueError when the body is not a packed request.
+    """
+    if not body.startswith(PACKED_MAGIC):
+        raise ValueError('body does not start with the packed format marker')
+    if (len(body) - len(PACKED_MAGIC)) % RECORD_DTYPE.itemsize:
+        raise ValueError(f'body length is not a whole number of {RECORD_DTYPE.itemsize}-byte records')
+
+    packed = np.frombuffer(body, dtype=RECORD_DTYPE, offset=len(PACKED_MAGIC))
+    if (packed['n_questions'] > MAX_QUESTIONS).any():
+        raise ValueError(f'records hold at most {MAX_QUESTIONS} questions')
+
+    # Every question of every record in one shift-and-mask
+    answers = ((packed['answers'][:, None] >> QUESTION_SHIFTS) & np.uint64(3)).astype(np.int64).tolist()
+    flags = ((packed['flags'][:, None] >> np.arange(3, dtype=np.uint8)) & 1).tolist()
+
+    records = []
+    for age, n_questions, row, row_flags in zip(
+        packed['age'].tolist(), packed['n_questions'].tolist(), answers, flags
+    ):
+        # Whole months come back as ints, as they would from JSON
+        record = {'Age': int(age) if age.is_integer() else age}
+        record.update(zip(FLAG_FIELDS, row_flags))
+        record.update(zip(QUESTION_FIELDS[:n_questions], row[:n_questions]))
+        records.append(record)
+    return records
+
+
+# ============================================================================
+# RESPONSES
+# ============================================================================
+
+def encode_results(results):
+    """Pack prediction results and error bodies into a response body."""
+    packed = np.zeros(len(results), dtype=RESULT_DTYPE)
+    errors = {}
+    for i, result in enumerate(results):
+        if 'error' in result:
+            packed[i]['status'] = STATUS_ERROR
+            errors[str(i)] = {key: value for key, value in result.items() if key != 'index'}
+            continue
+        probabilities = result['probabilities']
+        packed[i] = (
+            STATUS_OK, MODEL_CODES[result['model_used']], result['prediction'],
+            probabilities['no_asd'], probabilities['asd']
+        )
+    return (
+        PACKED_MAGIC
+        + np.uint32(len(results)).astype('<u4').tobytes()
+        + packed.tobytes()
+        + json.dumps(errors).encode('utf-8')
+    )
+
+
+def decode_results(body):
+    """Unpack a response body into one dict per record, in input order.
+
+    Successful records become {'model_used', 'prediction', 'probabilities'};
+    failed ones their error body.
+    """
+    if not body.startswith(PACKED_MAGIC):
+        raise ValueError('body does not start with the packed format marker')
+    offset = len(PACKED_MAGIC)
+    count = int(np.frombuffer(body, dtype='<u4', count=1, offset=offset)[0])
+    offset += 4
+    packed = np.frombuffer(body, dtype=RESULT_DTYPE, count=count, offset=offset)
+    errors = json.loads(body[offset + count * RESULT_DTYPE.itemsize:])
+
+    results = []
+    for i, (status, model, prediction, no_asd, asd) in enumerate(packed.tolist()):
+        if status == STATUS_ERROR:
+            results.append(errors[str(i)])
+            continue
+        results.append({
+            'model_used': MODEL_NAMES[model],
+            'prediction': prediction,
+            'probabilities': {'no_asd': no_asd, 'asd': asd},
+        })
+    return results
@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from instruments import INSTRUMENTS
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Entries kept in the in-process LRU; 0 disables result caching
+CACHE_SIZE = int(os.environ.get('ASD_CACHE_SIZE', 10000))
+
+# Optional shared backend (e.g. redis://localhost:6379/0) so all workers and
+# hosts reuse each other's results. Needs the `redis` package.
+CACHE_REDIS_URL = os.environ.get('ASD_CACHE_REDIS_URL')
+CACHE_REDIS_TTL = int(os.environ.get('ASD_CACHE_REDIS_TTL', 86400))
+
+
+# ============================================================================
+# CACHE KEYS
+# ============================================================================
+
+def cache_keys(model_name, records, model_identity, threshold=None):
+    """Canonical cache key for each record, or None for all if they cannot be encoded.
+
+    Keys are built from the instrument's own encoding of the records (see
+    instruments.py), the arrays its feature pipeline reads, so two records
+    share a key exactly when the model sees the same input. The model
+    identity (model file and feature list, see model_loader.model_identity)
+    makes results from a previous model version unreachable, and a custom
+    decision threshold gets its own keys.
+    """
+    try:
+        answers, age, gender, jaundice, family_history = INSTRUMENTS[model_name]['encode'](records)
+    except (KeyError, TypeError, ValueError, AttributeError):
+        # Malformed records go through the normal path and fail there
+        return [None] * len(records)
+    rows = np.column_stack([gender, jaundice, family_history, answers]).astype(np.int8)
+    version = model_identity[:16] if threshold is None else f'{model_identity[:16]}@{threshold!r}'
+    prefix = f'{model_name}:{version}:'
+    return [f'{prefix}{row.tobytes().hex()}:{float(row_age)!r}' for row, row_age in zip(rows, age)]
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+class LRUCache:
+    """Thread-safe in-process LRU map with a fixed entry limit."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self, prefix=''):
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class RedisCache:
+    """Shared cache backend; entries expire after CACHE_REDIS_TTL seconds."""
+
+    def __init__(self, url, ttl):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get('asd:result:' + key)
+        return json.loads(value) if value is not None else None
+
+    def put(self, key, value):
+        self.client.set('asd:result:' + key, json.dumps(value), ex=self.ttl)
+
+
+def make_shared_backend():
+    if not CACHE_REDIS_URL:
+        return None
+    try:
+        return RedisCache(CACHE_REDIS_URL, CACHE_REDIS_TTL)
+    except ImportError:
+        print("⚠ Warning: ASD_CACHE_REDIS_URL is set but the redis package is not installed")
+        return None
+
+
+_LOCAL = LRUCache(CACHE_SIZE)
+_SHARED = make_shared_backend()
+_STATS = {'hits': 0, 'misses': 0, 'shared_hits': 0, 'shared_errors': 0}
+# Request threads update the counters concurrently
+_STATS_LOCK = threading.Lock()
+
+
+def count(counter):
+    with _STATS_LOCK:
+        _STATS[counter] += 1
+
+
+# ============================================================================
+# PUBLIC API
+# ============================================================================
+
+def enabled():
+    return CACHE_SIZE > 0
+
+
+def get(key):
+    """Look a key up locally, then in the shared backend."""
+    value = _LOCAL.get(key)
+    if value is None and _SHARED is not None:
+        try:
+            value = _SHARED.get(key)
+        except Exception:
+            # A shared cache outage must never fail a prediction
+            count('shared_errors')
+        if value is not None:
+            count('shared_hits')
+            _LOCAL.put(key, value)
+
+    count('hits' if value is not None else 'misses')
+    return value
+
+
+def put(key, value):
+    _LOCAL.put(key, value)
+    if _SHARED is not None:
+        try:
+            _SHARED.put(key, value)
+        except Exception:
+            count('shared_errors')
+
+
+def clear(model_name=None):
+    """Drop cached results for one model (all models by default)."""
+    _LOCAL.clear(f'{model_name}:' if model_name else '')
+
+
+def stats():
+    # Counters for /health
+    with _STATS_LOCK:
+        counters = dict(_STATS)
+    lookups = counters['hits'] + counters['misses']
+    return {
+        'enabled': enabled(),
+        'backend': 'lru+redis' if _SHARED is not None else 'lru',
+        'size': len(_LOCAL),
+        'max_size': CACHE_SIZE,
+        'hits': counters['hits'],
+        'misses': counters['misses'],
+        'hit_rate': round(counters['hits'] / lookups, 4) if lookups else None,
+        'evictions': _LOCAL.evictions,
+        'shared_hits': counters['shared_hits'],
+        'shared_errors': counters['shared_errors'],
+    }
@@ -0,0 +1,100 @@
+import math
+
+# ============================================================================
+# FIELD ENCODERS
+# ============================================================================
+#
+# An encoder takes one raw payload value and returns its canonical number,
+# or raises ValueError with a message for the caller. Encoders are plain
+# dict lookups where possible: 1, 1.0 and True hash alike, so one table
+# covers numeric and boolean forms, and strings fall back to a
+# case-insensitive lookup.
+
+def choice_encoder(codes, description):
+    def encode(value):
+        try:
+            return codes[value]
+        except (KeyError, TypeError):
+            pass
+        if isinstance(value, str):
+            code = codes.get(value.strip().lower())
+            if code is not None:
+                return code
+        raise ValueError(f'must be {description}')
+    return encode
+
+
+def encode_age(value):
+    # Ages stay as sent (24 and 24.0 are echoed back as given); the model
+    # routers check the range
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError('must be a number')
+    return value
+
+
+encode_yes_no = choice_encoder({'yes': 1, 'no': 0, 1: 1, 0: 0}, '"yes" or "no" (or 1/0)')
+encode_gender = choice_encoder({'male': 1, 'female': 0, 1: 1, 0: 0}, '"male" or "female" (or 1/0)')
+encode_aq_score = choice_encoder({0: 0, 1: 1, 2: 2, 3: 3}, 'an integer score from 0 to 3')
+
+
+# ============================================================================
+# SCHEMAS
+# ============================================================================
+
+DEMOGRAPHIC_FIELDS = [
+    ('Age', encode_age),
+    ('Gender', encode_gender),
+    ('Jaundice', encode_yes_no),
+    ('Family_ASD_History', encode_yes_no),
+]
+
+
+def compile_schema(label, fields):
+    """Fix the field order and encoders of one instrument's payload."""
+    return {
+        'label': label,
+        'fields': [name for name, _ in fields],
+        'encoders': list(fields),
+    }
+
+
+def validate(schema, record):
+    """Check and encode one payload in a single pass.
+
+    Returns (row, errors). row maps every schema field to its canonical
+    value (flags and answers as 0/1, AQ scores as 0-3); fields outside the
+    schema are dropped. errors lists every problem found, one dict per field,
+    so a caller can fix them all at once. row is only usable when errors is
+    empty.
+    """
+    row = {}
+    errors = []
+    for name, encode in schema['encoders']:
+        try:
+            value = record[name]
+        except KeyError:
+            errors.append({'field': name, 'error': 'missing'})
+            continue
+        try:
+            row[name] = encode(value)
+        except ValueError as e:
+            errors.append({'field': name, 'error': 'invalid', 'message': str(e), 'value': value})
+    return row, errors
+
+
+def error_body(schema, errors):
+    # Response body for a payload that failed validate()
+    missing = [error['field'] for error in errors if error['error'] == 'missing']
+    if len(missing) == len(errors):
+        return {
+            'error': 'Missing required fields',
+            'missing_fields': missing,
+            'field_errors': errors
+        }
+    return {
+        'error': 'Invalid fields',
+        'message': f"{len(errors)} {schema['label']} field(s) are missing or invalid",
+        'missing_fields': missing,
+        'field_errors': errors
+    }
+
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import admission
+import app as api
+from test_scoring import mchat_bundle, random_mchat_records
+
+
+@pytest.fixture
+def limiters(monkeypatch):
+    limiters = {'mchat': admission.Limiter(1, 1), 'aq': admission.Limiter(0, 0)}
+    monkeypatch.setattr(admission, '_LIMITERS', limiters)
+    return limiters
+
+
+def test_queue_is_bounded_and_drains(limiters):
+    held, _ = admission.admit('mchat')
+    outcomes = []
+    waiter = threading.Thread(target=lambda: outcomes.append(admission.admit('mchat')))
+    waiter.start()
+    while limiters['mchat'].queued == 0:
+        time.sleep(0.001)
+
+    # One scoring, one waiting: the next is turned away at once
+    ticket, rejected = admission.admit('mchat')
+    assert ticket is None and rejected['status'] == 429 and rejected['retry_after'] >= 1
+
+    admission.release(held)
+    waiter.join()
+    ticket, rejected = outcomes[0]
+    assert rejected is None
+    admission.release(ticket)
+
+    status = admission.status()['mchat']
+    assert status['admitted'] == 2 and status['active'] == 0 and status['queued'] == 0
+    assert status['rejected'] == {'queue_full': 1, 'queue_timeout': 0, 'deadline': 0}
+    # A model without a limit admits everything
+    assert admission.admit('aq') == ({'limiter': None}, None)
+
+
+def test_waiting_gives_up_at_timeout_or_deadline(limiters, monkeypatch):
+    monkeypatch.setattr(admission, 'QUEUE_TIMEOUT_SECONDS', 0.02)
+    held, _ = admission.admit('mchat')
+
+    _, rejected = admission.admit('mchat')
+    assert rejected['status'] == 503 and rejected['body']['error'] == 'Server busy'
+    _, rejected = admission.admit('mchat', deadline=time.time() + 0.005)
+    assert rejected['body']['error'] == 'Deadline exceeded'
+    admission.release(held)
+
+    # An expired deadline is shed even when a slot is free
+    _, rejected = admission.admit('mchat', deadline=time.time() - 1)
+    assert rejected['status'] == 503
+    assert limiters['mchat'].rejected == {'queue_full': 0, 'queue_timeout': 1, 'deadline': 2}
+
+
+def test_request_deadline_headers():
+    deadline, error = admission.request_deadline({'X-Request-Timeout-Ms': '250'}, now=100.0)
+    assert deadline == 100.25 and error is None
+    deadline, _ = admission.request_deadline({'X-Request-Timeout-Ms': '250', 'X-Request-Deadline': '100.1'}, now=100.0)
+    assert deadline == 100.1
+    assert admission.request_deadline({}) == (None, None)
+    assert admission.request_deadline({'X-Request-Deadline': 'soon'})[1]['error'] == 'Invalid deadline'
+
+
+def test_endpoints_shed_with_retry_after(limiters, monkeypatch):
+    bundle = mchat_bundle(RandomForestClassifier, n_estimators=5)
+    monkeypatch.setattr(api, 'get_model', lambda name: bundle)
+    client = api.app.test_client()
+    record = random_mchat_records(1, seed=30)[0]
+
+    held, _ = admission.admit('mchat')
+    response = client.post('/predict', json=record, headers={'X-Request-Timeout-Ms': '10'})
+    assert response.status_code == 503 and response.headers['Retry-After'] == '1'
+    assert response.get_json()['error'] == 'Deadline exceeded'
+    assert client.post('/predict/mchat', json=record, headers={'X-Request-Deadline': 'x'}).status_code == 400
+    admission.release(held)
+
+    assert client.post('/predict', json=record).status_code == 200
+    health = client.get('/health').get_json()['admission']['mchat']
+    assert health['admitted'] == 2 and health['rejected']['deadline'] == 1
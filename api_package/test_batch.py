@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import app as api
+import explain
+from features import AQ_FEATURES
+from instruments import INSTRUMENTS
+from test_scoring import mchat_bundle, random_mchat_records
+
+
+def random_aq_payloads(n, seed=0):
+    # API payloads: Age in months, answers as scores
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            'Age': int(rng.integers(37, 133)),
+            'Gender': str(rng.choice(['male', 'female'])),
+            'Jaundice': str(rng.choice(['yes', 'no'])),
+            'Family_ASD_History': str(rng.choice(['yes', 'no'])),
+            **{f'Q{i}': int(rng.integers(0, 4)) for i in range(1, 31)},
+        }
+        for _ in range(n)
+    ]
+
+
+def aq_bundle():
+    plan = INSTRUMENTS['aq']['compile_plan'](AQ_FEATURES)
+    records = [dict(record, Age=record['Age'] / 12) for record in random_aq_payloads(300, seed=1)]
+    X = api.preprocess_data('aq', records, plan)
+    y = (X['AQ_Total'] > 45).astype(int)
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    explainer, explain_error = explain.build_explainer('aq', model, plan['feature_names'])
+    return {
+        'name': 'aq', 'model': model, 'plan': plan, 'sha256': '1' * 64, 'identity': '1' * 64,
+        'version': '1' * 12,
+        'threshold': None, 'explainer': explainer, 'explain_error': explain_error,
+    }
+
+
+@pytest.fixture
+def bundles(monkeypatch):
+    # Both models, with every predict_proba call recorded as (model, rows)
+    bundles = {'mchat': mchat_bundle(RandomForestClassifier, n_estimators=10), 'aq': aq_bundle()}
+    calls = []
+    for name, bundle in bundles.items():
+        predict_proba = bundle['model'].predict_proba
+        monkeypatch.setattr(
+            bundle['model'], 'predict_proba',
+            lambda X, name=name, predict_proba=predict_proba: calls.append((name, len(X))) or predict_proba(X)
+        )
+    monkeypatch.setattr(api, 'get_model', bundles.get)
+    monkeypatch.setattr(api.result_cache, 'enabled', lambda: False)
+    return bundles, calls
+
+
+def test_mixed_batch_scores_each_model_once_in_input_order(bundles):
+    _, calls = bundles
+    mchat = random_mchat_records(4, seed=41)
+    aq = random_aq_payloads(3, seed=42)
+    records = [mchat[0], aq[0], mchat[1], mchat[2], aq[1], aq[2], mchat[3]]
+
+    body = api.app.test_client().post('/predict/batch', json=records).get_json()
+
+    assert sorted(calls) == [('aq', 3), ('mchat', 4)]
+    assert (body['count'], body['succeeded'], body['failed']) == (7, 7, 0)
+    assert [result['index'] for result in body['results']] == list(range(7))
+    assert [result['model_used'] for result in body['results']] == ['mchat', 'aq', 'mchat', 'mchat', 'aq', 'aq', 'mchat']
+
+    # Each result is what the single-record endpoint returns for that record
+    client = api.app.test_client()
+    for record, result in zip(records, body['results']):
+        single = client.post('/predict', json=record).get_json()
+        assert dict(result, index=None) == dict(single, index=None)
+
+
+def test_batch_reports_errors_per_record(bundles):
+    _, calls = bundles
+    good = random_mchat_records(2, seed=43)
+    missing = dict(good[0])
+    del missing['Q7']
+    records = [good[0], {'Age': 3}, missing, 'not a record', {'Gender': 'male'}, good[1], dict(good[1], Age=150)]
+
+    body = api.app.test_client().post('/predict/batch', json=records).get_json()
+    results = body['results']
+
+    assert calls == [('mchat', 2)]
+    assert (body['count'], body['succeeded'], body['failed']) == (7, 2, 5)
+    assert 'error' not in results[0] and 'error' not in results[5]
+    assert results[1]['error'] == 'Age out of range' and 'too young' in results[1]['message']
+    assert results[2]['missing_fields'] == ['Q7']
+    assert results[3]['error'] == 'No data provided'
+    assert results[4]['error'] == 'Missing required field: Age'
+    assert results[6]['error'] == 'Age out of range' and 'too old' in results[6]['message']
+    assert [result['index'] for result in results] == list(range(7))
+
+
+def test_batch_size_cap(bundles, monkeypatch):
+    _, calls = bundles
+    monkeypatch.setattr(api, 'BATCH_MAX_RECORDS', 3)
+    client = api.app.test_client()
+
+    response = client.post('/predict/batch', json=random_mchat_records(4, seed=44))
+    assert response.status_code == 413
+    assert response.get_json()['error'] == 'Batch too large'
+    assert calls == []
+
+    assert client.post('/predict/batch', json={'records': random_mchat_records(3, seed=44)}).status_code == 200
+    assert client.post('/predict/batch', json=[]).status_code == 400
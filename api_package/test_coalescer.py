@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+import coalescer
+
+
+def run_concurrently(records, score):
+    bundle = {}
+    results = [None] * len(records)
+
+    def call(i):
+        try:
+            results[i] = coalescer.score_one('mchat', records[i], bundle, score)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(records))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@pytest.fixture
+def window(monkeypatch):
+    monkeypatch.setattr(coalescer, 'COALESCE_MS', 200)
+    monkeypatch.setattr(coalescer, 'COALESCE_MAX_BATCH', 8)
+
+
+def test_concurrent_requests_share_one_call(window):
+    calls = []
+
+    def score(records, bundle):
+        calls.append(len(records))
+        return [{'value': record * 10} for record in records]
+
+    results = run_concurrently(list(range(8)), score)
+
+    assert results == [{'value': i * 10} for i in range(8)]
+    # A full group is scored at once instead of waiting out the window
+    assert calls == [8]
+
+
+def test_bad_record_only_fails_its_own_request(window):
+    def score(records, bundle):
+        if -1 in records:
+            raise ValueError('bad record')
+        return list(records)
+
+    results = run_concurrently([1, -1, 3, 4], score)
+
+    assert results[0] == 1 and results[2] == 3 and results[3] == 4
+    assert isinstance(results[1], ValueError)
+
+
+def test_wait_is_bounded_by_the_window(monkeypatch):
+    monkeypatch.setattr(coalescer, 'COALESCE_MS', 20)
+    start = time.perf_counter()
+    assert coalescer.score_one('aq', 5, {}, lambda records, bundle: list(records)) == 5
+    assert time.perf_counter() - start < 0.5
+
+
+def test_disabled_scores_directly(monkeypatch):
+    monkeypatch.setattr(coalescer, 'COALESCE_MS', 0)
+    assert coalescer.score_one('aq', 5, {}, lambda records, bundle: [records]) == [5]
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from sklearn.dummy import DummyClassifier
+from sklearn.ensemble import ExtraTreesClassifier, GradientBoostingClassifier, RandomForestClassifier
+
+import app as api
+import explain
+from export_model import compile_model
+from features import AQ_COLUMNS, AQ_QUESTION_FIELDS, MCHAT_BLOCKS, MCHAT_COLUMNS
+from instruments import INSTRUMENTS
+from test_features import random_aq_records
+from test_scoring import mchat_bundle, random_mchat_records
+
+
+@pytest.mark.parametrize('model_class, params', [
+    (RandomForestClassifier, {'n_estimators': 20}),
+    (ExtraTreesClassifier, {'n_estimators': 20, 'max_depth': 8}),
+    (GradientBoostingClassifier, {'n_estimators': 20}),
+])
+def test_contributions_add_up_to_the_prediction(model_class, params):
+    bundle = mchat_bundle(model_class, **params)
+    X = api.preprocess_data('mchat', random_mchat_records(300, seed=21), bundle['plan'])
+    explainer = bundle['explainer']
+
+    features, inputs = explainer.explain(X)
+    total = explainer.bias + features.sum(axis=1)
+    if explainer.units == 'log_odds':
+        total = 1 / (1 + np.exp(-total))
+
+    np.testing.assert_allclose(total, bundle['model'].predict_proba(X)[:, 1], atol=1e-9)
+    np.testing.assert_allclose(inputs.sum(axis=1), features.sum(axis=1), atol=1e-12)
+    # Compiled runtime models are explained directly and agree
+    compiled, _ = explain.build_explainer('mchat', compile_model(bundle['model'], X.columns, ''), X.columns)
+    np.testing.assert_allclose(compiled.contributions(X), features)
+
+
+def test_rollup_shares_engineered_features_among_their_questions():
+    feature_names = MCHAT_BLOCKS['answers'] + MCHAT_BLOCKS['failed'] + MCHAT_COLUMNS
+    sources, inputs = explain.INPUTS['mchat']
+    matrix = explain.rollup_matrix(feature_names, sources, inputs)
+
+    np.testing.assert_allclose(matrix.sum(axis=1), 1)
+    row = matrix[feature_names.index('Q9_Q14_Interaction')]
+    assert {inputs[i]: share for i, share in enumerate(row) if share} == {'Q9': 0.5, 'Q14': 0.5}
+    assert np.count_nonzero(matrix[feature_names.index('Best7_Failed_Count')]) == 7
+
+    aq_names = AQ_QUESTION_FIELDS + AQ_COLUMNS
+    aq_matrix = explain.rollup_matrix(aq_names, *explain.INPUTS['aq'])
+    np.testing.assert_allclose(aq_matrix.sum(axis=1), 1)
+
+
+def test_aq_explainer():
+    plan = INSTRUMENTS['aq']['compile_plan'](AQ_QUESTION_FIELDS + AQ_COLUMNS)
+    X = api.preprocess_data('aq', random_aq_records(300, seed=22), plan)
+    y = (X['AQ_Total'] > 45).astype(int)
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+
+    explainer, error = explain.build_explainer('aq', model, plan['feature_names'])
+    features, inputs = explainer.explain(X)
+    assert error is None and inputs.shape == (300, 34)
+    np.testing.assert_allclose(explainer.bias + inputs.sum(axis=1), model.predict_proba(X)[:, 1], atol=1e-9)
+
+
+def test_explain_endpoints(monkeypatch):
+    bundle = mchat_bundle(RandomForestClassifier, n_estimators=10)
+    monkeypatch.setattr(api, 'get_model', lambda name: bundle)
+    client = api.app.test_client()
+    records = random_mchat_records(3, seed=23)
+
+    plain = client.post('/predict', json=records[0]).get_json()
+    result = client.post('/predict?explain=true', json=records[0]).get_json()
+    explanation = result.pop('explanation')
+    assert result == plain and 'explanation' not in plain
+
+    assert [q['field'] for q in explanation['questions']][:3] == ['Q1', 'Q2', 'Q3']
+    assert len(explanation['top_features']) == api.EXPLAIN_TOP_FEATURES
+    total = explanation['base_value'] + sum(q['contribution'] for q in explanation['questions'])
+    assert total == pytest.approx(result['probabilities']['asd'])
+
+    body = client.post('/predict/batch?explain=1', json=records + [{'Age': 3}]).get_json()
+    assert body['succeeded'] == 3
+    assert all('explanation' in r for r in body['results'][:3])
+
+
+def test_unexplainable_model(monkeypatch):
+    bundle = mchat_bundle(DummyClassifier)
+    assert bundle['explainer'] is None
+    monkeypatch.setattr(api, 'get_model', lambda name: bundle)
+    client = api.app.test_client()
+    record = random_mchat_records(1, seed=24)[0]
+
+    assert client.post('/predict/mchat?explain=true', json=record).status_code == 501
+    assert client.post('/predict/mchat', json=record).status_code == 200
+    body = client.post('/predict/batch?explain=true', json=[record]).get_json()
+    assert body['results'][0]['error'] == 'Explanation unavailable'
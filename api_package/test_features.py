@@ -0,0 +1,252 @@
+import numpy as np
+import pandas as pd
+import joblib
+import os
+
+import pytest
+
+from features import longest_run
+from instruments import INSTRUMENTS
+
+OUTPUTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outputs')
+MCHAT_FEATURES = joblib.load(os.path.join(OUTPUTS_DIR, 'mchat_feature_names.pkl'))
+MCHAT = INSTRUMENTS['mchat']
+MCHAT_PLAN = MCHAT['compile_plan'](MCHAT_FEATURES)
+AQ_FEATURES = joblib.load(os.path.join(OUTPUTS_DIR, 'aq_feature_names.pkl'))
+AQ = INSTRUMENTS['aq']
+AQ_PLAN = AQ['compile_plan'](AQ_FEATURES)
+
+
+def reference_preprocess_mchat(records, feature_names):
+    """The original pandas M-CHAT feature engineering, kept as a parity oracle"""
+    df = pd.DataFrame(records)
+
+    BEST7_QUESTIONS = [2, 5, 7, 9, 14, 15, 20]
+    INVERTED_QUESTIONS = [11, 18, 20, 22]
+
+    failure_cols = []
+    for i in range(1, 24):
+        q_col = f'Q{i}'
+        fail_col = f'Q{i}_Failed'
+        if i in INVERTED_QUESTIONS:
+            df[fail_col] = df[q_col]
+        else:
+            df[fail_col] = (df[q_col] == 0).astype(int)
+        failure_cols.append(fail_col)
+
+    best7_fail_cols = [f'Q{i}_Failed' for i in BEST7_QUESTIONS]
+    df['Best7_Failed_Count'] = df[best7_fail_cols].sum(axis=1)
+    df['Total_Failed_Count'] = df[failure_cols].sum(axis=1)
+    df['MCHAT_Risk_Flag'] = (
+        (df['Best7_Failed_Count'] >= 2) |
+        (df['Total_Failed_Count'] >= 3)
+    ).astype(int)
+    df['Best7_Pass_Rate'] = 1 - (df['Best7_Failed_Count'] / len(BEST7_QUESTIONS))
+    df['Total_Pass_Rate'] = 1 - (df['Total_Failed_Count'] / 23)
+
+    non_best7_fail_cols = [f'Q{i}_Failed' for i in range(1, 24) if i not in BEST7_QUESTIONS]
+    df['NonBest7_Failed_Count'] = df[non_best7_fail_cols].sum(axis=1)
+    df['Best7_to_NonBest7_Ratio'] = df['Best7_Failed_Count'] / (df['NonBest7_Failed_Count'] + 1)
+
+    social_questions = [2, 7, 9, 14, 15, 17, 19, 21, 23]
+    social_fail_cols = [f'Q{i}_Failed' for i in social_questions]
+    df['Social_Failed_Count'] = df[social_fail_cols].sum(axis=1)
+    df['Social_Pass_Rate'] = 1 - (df['Social_Failed_Count'] / len(social_questions))
+
+    joint_attention = [6, 7, 9, 15]
+    joint_attention_cols = [f'Q{i}_Failed' for i in joint_attention]
+    df['JointAttention_Failed_Count'] = df[joint_attention_cols].sum(axis=1)
+
+    df['PretendPlay_Failed'] = df['Q5_Failed']
+
+    sensory_questions = [11, 18, 22]
+    sensory_fail_cols = [f'Q{i}_Failed' for i in sensory_questions]
+    df['Sensory_Failed_Count'] = df[sensory_fail_cols].sum(axis=1)
+
+    df['Q9_Q14_Interaction'] = df['Q9_Failed'] * df['Q14_Failed']
+    df['Q9_Q15_Interaction'] = df['Q9_Failed'] * df['Q15_Failed']
+    df['Q7_Q14_Interaction'] = df['Q7_Failed'] * df['Q14_Failed']
+
+    df['Risk_Factors_Sum'] = df['Family_ASD_History'] + df['Jaundice']
+    df['Male_With_Family_History'] = df['Gender'] * df['Family_ASD_History']
+    df['High_Risk_Profile'] = (
+        (df['Family_ASD_History'] == 1) &
+        (df['Best7_Failed_Count'] >= 1)
+    ).astype(int)
+
+    df['Best7_All_Passed'] = (df['Best7_Failed_Count'] == 0).astype(int)
+    df['Best7_Multiple_Failed'] = (df['Best7_Failed_Count'] >= 2).astype(int)
+
+    df['Age_Squared'] = df['Age'] ** 2
+    df['Age_Group'] = pd.cut(
+        df['Age'],
+        bins=[0, 18, 24, 30, 100],
+        labels=[0, 1, 2, 3]
+    ).astype(int)
+
+    question_fail_cols = [f'Q{i}_Failed' for i in range(1, 24)]
+    df['Failure_Mean'] = df[question_fail_cols].mean(axis=1)
+    df['Failure_Std'] = df[question_fail_cols].std(axis=1)
+
+    consecutive_failures = []
+    for _, row in df[question_fail_cols].iterrows():
+        max_consecutive = 0
+        current_consecutive = 0
+        for val in row:
+            if val == 1:
+                current_consecutive += 1
+                max_consecutive = max(max_consecutive, current_consecutive)
+            else:
+                current_consecutive = 0
+        consecutive_failures.append(max_consecutive)
+
+    df['Max_Consecutive_Failures'] = consecutive_failures
+
+    for feature in feature_names:
+        if feature not in df.columns:
+            df[feature] = 0
+
+    return df[feature_names]
+
+
+def random_mchat_records(n, seed):
+    rng = np.random.default_rng(seed)
+    answers = rng.integers(0, 2, size=(n, 23))
+    # Include the all-pass and all-fail patterns alongside random ones
+    answers[:1] = 0
+    answers[1:2] = 1
+    ages = rng.integers(12, 37, size=n)
+    records = []
+    for row, age in zip(answers, ages):
+        record = {
+            'Age': int(age),
+            'Gender': int(rng.integers(0, 2)),
+            'Jaundice': int(rng.integers(0, 2)),
+            'Family_ASD_History': int(rng.integers(0, 2)),
+        }
+        record.update({f'Q{i + 1}': int(v) for i, v in enumerate(row)})
+        records.append(record)
+    return records
+
+
+def test_mchat_engine_matches_pandas_reference():
+    records = random_mchat_records(2000, seed=7)
+    expected = reference_preprocess_mchat(records, MCHAT_FEATURES)
+    X = MCHAT['build_features'](*MCHAT['encode'](records), MCHAT_PLAN)
+
+    assert X.shape == expected.shape
+    for slot, name in enumerate(MCHAT_FEATURES):
+        np.testing.assert_allclose(X[:, slot], expected[name].to_numpy(dtype=float), err_msg=name)
+
+
+def test_mchat_engine_covers_every_age_bucket_edge():
+    records = random_mchat_records(8, seed=11)
+    for record, age in zip(records, [12, 18, 19, 24, 25, 30, 31, 36]):
+        record['Age'] = age
+    expected = reference_preprocess_mchat(records, MCHAT_FEATURES)
+    X = MCHAT['build_features'](*MCHAT['encode'](records), MCHAT_PLAN)
+
+    slot = MCHAT_FEATURES.index('Age_Group')
+    np.testing.assert_array_equal(X[:, slot], expected['Age_Group'].to_numpy())
+
+
+def test_mchat_encoding_accepts_strings_and_numbers():
+    record = random_mchat_records(1, seed=3)[0]
+    as_strings = dict(record)
+    as_strings.update({f'Q{i}': 'Yes' if record[f'Q{i}'] else 'no' for i in range(1, 24)})
+    as_strings['Gender'] = 'MALE' if record['Gender'] else 'female'
+    as_strings['Jaundice'] = 'yes' if record['Jaundice'] else 'No'
+
+    X_numbers = MCHAT['build_features'](*MCHAT['encode']([record]), MCHAT_PLAN)
+    X_strings = MCHAT['build_features'](*MCHAT['encode']([as_strings]), MCHAT_PLAN)
+    np.testing.assert_array_equal(X_numbers, X_strings)
+
+
+def test_longest_run_matches_python_loop():
+    rng = np.random.default_rng(5)
+    for width in (1, 23, 30, 64, 80):
+        binary = rng.integers(0, 2, size=(500, width))
+        binary[:1] = 1
+        binary[1:2] = 0
+        expected = []
+        for row in binary:
+            longest = current = 0
+            for val in row:
+                current = current + 1 if val else 0
+                longest = max(longest, current)
+            expected.append(longest)
+        np.testing.assert_array_equal(longest_run(binary), expected, err_msg=f'width {width}')
+
+
+def test_plan_follows_any_feature_order():
+    records = random_mchat_records(50, seed=13)
+    shuffled = list(np.random.default_rng(2).permutation(MCHAT_FEATURES))
+    X = MCHAT['build_features'](*MCHAT['encode'](records), MCHAT_PLAN)
+    X_shuffled = MCHAT['build_features'](*MCHAT['encode'](records), MCHAT['compile_plan'](shuffled))
+
+    for slot, name in enumerate(shuffled):
+        np.testing.assert_array_equal(X_shuffled[:, slot], X[:, MCHAT_FEATURES.index(name)])
+
+
+def test_plan_rejects_features_the_engine_cannot_produce():
+    with pytest.raises(ValueError, match='Q24_Failed'):
+        MCHAT['compile_plan'](MCHAT_FEATURES + ['Q24_Failed'])
+
+
+def reference_preprocess_aq(records, feature_names):
+    """The original pandas AQ feature engineering, kept as a parity oracle"""
+    df = pd.DataFrame(records)
+
+    social = ['Q1', 'Q2', 'Q3', 'Q4', 'Q5', 'Q6']
+    switching = ['Q7', 'Q8', 'Q9', 'Q10', 'Q11', 'Q12']
+    detail = ['Q13', 'Q14', 'Q15', 'Q16', 'Q17', 'Q18']
+    communication = ['Q19', 'Q20', 'Q21', 'Q22', 'Q23', 'Q24', 'Q25']
+    imagination = ['Q26', 'Q27', 'Q28', 'Q29', 'Q30']
+
+    df['Social_Mean'] = df[social].mean(axis=1)
+    df['Switching_Mean'] = df[switching].mean(axis=1)
+    df['Detail_Mean'] = df[detail].mean(axis=1)
+    df['Communication_Mean'] = df[communication].mean(axis=1)
+    df['Imagination_Mean'] = df[imagination].mean(axis=1)
+
+    df['AQ_Total'] = df[[f'Q{i}' for i in range(1, 31)]].sum(axis=1)
+    df['High_Score_Count'] = (df[[f'Q{i}' for i in range(1, 31)]] >= 2).sum(axis=1)
+    df['Score_STD'] = df[[f'Q{i}' for i in range(1, 31)]].std(axis=1)
+
+    df['Comm_x_Family'] = df['Communication_Mean'] * df['Family_ASD_History']
+    df['Social_x_Family'] = df['Social_Mean'] * df['Family_ASD_History']
+
+    for feature in feature_names:
+        if feature not in df.columns:
+            df[feature] = 0
+
+    return df[feature_names]
+
+
+def random_aq_records(n, seed):
+    rng = np.random.default_rng(seed)
+    answers = rng.integers(0, 4, size=(n, 30))
+    # Constant rows give a zero standard deviation
+    answers[:1] = 0
+    answers[1:2] = 3
+    records = []
+    for row in answers:
+        record = {
+            'Age': float(rng.integers(36, 133)) / 12,
+            'Gender': int(rng.integers(0, 2)),
+            'Jaundice': int(rng.integers(0, 2)),
+            'Family_ASD_History': int(rng.integers(0, 2)),
+        }
+        record.update({f'Q{i + 1}': int(v) for i, v in enumerate(row)})
+        records.append(record)
+    return records
+
+
+def test_aq_engine_matches_pandas_reference():
+    records = random_aq_records(2000, seed=17)
+    expected = reference_preprocess_aq(records, AQ_FEATURES)
+    X = AQ['build_features'](*AQ['encode'](records), AQ_PLAN)
+
+    assert X.shape == expected.shape
+    for slot, name in enumerate(AQ_FEATURES):
+        np.testing.assert_array_equal(X[:, slot], expected[name].to_numpy(dtype=float), err_msg=name)
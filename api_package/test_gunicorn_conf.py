@@ -0,0 +1,79 @@
+import gc
+import json
+import os
+import runpy
+import shutil
+import subprocess
+import sys
+
+import joblib
+import pytest
+
+from test_model_reload import fit_mchat_model
+from test_scoring import FEATURES_PATH
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(API_DIR, 'gunicorn.conf.py')
+
+
+@pytest.fixture(autouse=True)
+def restore_preload_setting(monkeypatch):
+    # Running the config sets ASD_PRELOAD_MODELS; undo it after each test so
+    # later app imports do not load models eagerly. setenv first: monkeypatch
+    # only restores a variable it has seen, and then removes it again if it
+    # was unset.
+    monkeypatch.setenv('ASD_PRELOAD_MODELS', '')
+    monkeypatch.delenv('ASD_PRELOAD_MODELS')
+
+
+def test_tunables_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv('ASD_API_BIND', '127.0.0.1:8000')
+    monkeypatch.setenv('ASD_API_WORKERS', '3')
+    monkeypatch.setenv('ASD_API_THREADS', '4')
+    monkeypatch.setenv('ASD_API_MAX_REQUESTS', '500')
+    config = runpy.run_path(CONFIG_PATH)
+
+    assert config['bind'] == '127.0.0.1:8000'
+    assert (config['workers'], config['threads'], config['worker_class']) == (3, 4, 'gthread')
+    assert config['max_requests'] == 500
+    assert config['preload_app'] is True
+
+    monkeypatch.setenv('ASD_API_THREADS', '1')
+    assert runpy.run_path(CONFIG_PATH)['worker_class'] == 'sync'
+
+
+def test_preloads_both_models_unless_told_otherwise(monkeypatch):
+    runpy.run_path(CONFIG_PATH)
+    assert os.environ['ASD_PRELOAD_MODELS'] == 'mchat,aq'
+
+    monkeypatch.setenv('ASD_PRELOAD_MODELS', '')
+    runpy.run_path(CONFIG_PATH)
+    assert os.environ['ASD_PRELOAD_MODELS'] == ''
+
+
+def test_pre_fork_freezes_the_collector():
+    config = runpy.run_path(CONFIG_PATH)
+    try:
+        config['pre_fork'](None, None)
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+
+
+def test_app_import_preloads_listed_models_from_any_directory(tmp_path):
+    # What the gunicorn master does: import app.py with ASD_PRELOAD_MODELS
+    # set, here from a directory other than the API's
+    model_dir = tmp_path / 'models'
+    model_dir.mkdir()
+    shutil.copy(FEATURES_PATH, model_dir)
+    joblib.dump(fit_mchat_model(0), model_dir / 'mchat_model.pkl')
+    script = (
+        f'import sys; sys.path.insert(0, {API_DIR!r}); import json, app, model_loader; '
+        'print(json.dumps({name: bundle is not None for name, bundle in model_loader._LOADED.items()}))'
+    )
+    env = dict(os.environ, ASD_MODEL_DIR=str(model_dir), ASD_PRELOAD_MODELS='mchat', ASD_MODEL_RUNTIME='sklearn')
+
+    output = subprocess.run(
+        [sys.executable, '-c', script], cwd=tmp_path, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    assert json.loads(output.strip().splitlines()[-1]) == {'mchat': True, 'aq': False}
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import app as api
+import history
+from test_scoring import mchat_bundle, random_mchat_records
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(history, 'RESULT_DB', str(tmp_path / 'results.sqlite3'))
+    history.flush()
+    return tmp_path
+
+
+def result(model, risk_percentage, category):
+    return {
+        'model_used': model, 'model_version': 'abc', 'age': 24, 'age_unit': 'months', 'prediction': 1,
+        'risk_percentage': risk_percentage, 'risk_category': category,
+        'probabilities': {'no_asd': 1 - risk_percentage / 100, 'asd': risk_percentage / 100},
+    }
+
+
+def test_writes_are_queued_until_flushed(store):
+    history.record([result('mchat', 80.0, 'High Risk'), {'error': 'Age out of range'}], ['c1', None], 'test')
+    assert history.status()['queued'] == 2
+
+    assert history.flush() == 1
+    results, next_cursor = history.query_history()
+    assert [r['child_id'] for r in results] == ['c1'] and next_cursor is None
+    assert history.status()['queued'] == 0
+
+
+def test_pagination_and_filters(store, monkeypatch):
+    for i in range(7):
+        monkeypatch.setattr(history, 'time', SimpleNamespace(time=lambda i=i: 1_700_000_000 + i * 86400))
+        category = 'High Risk' if i % 2 else 'Low Risk'
+        history.record([result('aq' if i < 3 else 'mchat', 10.0 * i, category)], [f'c{i % 2}'], 'test')
+    history.flush()
+
+    pages = []
+    cursor = None
+    while True:
+        results, cursor = history.query_history(limit=3, cursor=cursor)
+        pages.append([r['risk_percentage'] for r in results])
+        if cursor is None:
+            break
+    assert pages == [[60.0, 50.0, 40.0], [30.0, 20.0, 10.0], [0.0]]
+
+    results, _ = history.query_history(child_id='c1', model='mchat')
+    assert [r['risk_percentage'] for r in results] == [50.0, 30.0]
+    results, _ = history.query_history(
+        risk_category='Low Risk', since=history.parse_time('2023-11-16'), until=1_700_000_000 + 6 * 86400
+    )
+    assert [r['risk_percentage'] for r in results] == [40.0, 20.0]
+
+
+def test_history_endpoints(store, monkeypatch):
+    bundle = mchat_bundle(RandomForestClassifier, n_estimators=5)
+    monkeypatch.setattr(api, 'get_model', lambda name: bundle)
+    client = api.app.test_client()
+    records = random_mchat_records(4, seed=9)
+
+    client.post('/predict', json=dict(records[0], child_id=42))
+    client.post('/predict/batch', json=[dict(record, child_id=42) for record in records[1:]] + [{'Age': 3}])
+
+    page = client.get('/history?child_id=42&limit=2').get_json()
+    assert page['count'] == 2 and page['next_cursor']
+    assert {r['source'] for r in page['results']} == {'predict_batch'}
+    rest = client.get(f"/history?child_id=42&cursor={page['next_cursor']}").get_json()
+    assert rest['count'] == 2 and rest['next_cursor'] is None
+    assert rest['results'][-1]['source'] == 'predict'
+
+    trend = client.get('/history/42/trend').get_json()
+    assert trend['count'] == 4
+    assert trend['models']['mchat']['assessments'][0]['source'] == 'predict'
+
+    assert client.get('/history/nobody/trend').status_code == 404
+    assert client.get('/history?from=yesterday').status_code == 400
+    assert client.get('/history?limit=100000').status_code == 400
+
+
+def test_history_disabled(monkeypatch):
+    monkeypatch.setattr(history, 'RESULT_DB', None)
+    assert api.app.test_client().get('/history').status_code == 503
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import app as api
+import instruments
+import schema
+from instruments import INSTRUMENTS
+from test_features import AQ_PLAN, MCHAT_PLAN, random_aq_records
+from test_scoring import random_mchat_records
+
+
+def test_routing_table_edges():
+    assert [instruments.route(age)[0] for age in (12, 24, 36, 36.5, 37, 132)] == [
+        'mchat', 'mchat', 'mchat', 'aq', 'aq', 'aq',
+    ]
+
+    name, error = instruments.route(11)
+    assert name is None
+    assert error['message'] == 'Child is too young (11 months / 0.9 years). M-CHAT is for 12-36 months minimum.'
+
+    name, error = instruments.route(133)
+    assert name is None
+    assert error['message'] == (
+        'Child is too old (133 months / 11.1 years). Maximum supported: AQ for up to 11 years (132 months). '
+        'Consider using adult ASD screening tools.'
+    )
+
+
+def test_overlapping_age_bands_are_rejected():
+    declarations = [
+        dict(instruments.DECLARATIONS[0], age_months=(12, 48)),
+        instruments.DECLARATIONS[1],
+    ]
+    with pytest.raises(ValueError, match='overlap'):
+        instruments.compile_routes(declarations)
+
+
+def test_instrument_bands_and_ages():
+    mchat, aq = INSTRUMENTS['mchat'], INSTRUMENTS['aq']
+    assert (mchat['ages'][0], mchat['ages'][-1]) == (12, 36)
+    assert (aq['ages'][0], aq['ages'][-1]) == (37, 132)
+    assert (mchat['age_range'], aq['age_range']) == ('12-36 months', '3-11 years')
+    assert instruments.model_age(mchat, 24) == 24 and instruments.model_age(aq, 90) == 7.5
+
+    assert instruments.band_error(mchat, 24) is None
+    assert instruments.band_error(aq, 30)['message'] == 'AQ is for ages 36-132 months (3-11 years). Provided: 30 months.'
+
+
+@pytest.mark.parametrize('name, plan, make_records', [
+    ('mchat', MCHAT_PLAN, random_mchat_records),
+    ('aq', AQ_PLAN, random_aq_records),
+])
+def test_raw_payloads_and_validated_rows_build_the_same_features(name, plan, make_records):
+    instrument = INSTRUMENTS[name]
+    records = make_records(50, seed=9)
+    rows = [schema.validate(instrument['schema'], record)[0] for record in records]
+
+    np.testing.assert_array_equal(instrument['preprocess'](records, plan), instrument['preprocess'](rows, plan))
+
+
+def test_every_instrument_has_an_endpoint():
+    endpoints = {rule.rule: rule.endpoint for rule in api.app.url_map.iter_rules()}
+    for name in INSTRUMENTS:
+        assert endpoints[f'/predict/{name}'] == f'predict_{name}'
@@ -0,0 +1,96 @@
+import io
+import json
+import time
+
+import jobs
+
+
+def fake_score_records(records):
+    # Stands in for app.score_records: echoes Age, rejects missing ones
+    return [
+        {'age': record['Age']} if isinstance(record, dict) and 'Age' in record else {'error': 'Missing required field: Age'}
+        for record in records
+    ]
+
+
+def run(tmp_path, monkeypatch, body, fmt):
+    monkeypatch.setattr(jobs, 'JOB_DIR', str(tmp_path))
+    monkeypatch.setattr(jobs, 'JOB_CHUNK_ROWS', 2)
+    job = jobs.create_job(io.BytesIO(body.encode()), fmt, f'upload.{fmt}')
+    assert job['status'] == 'queued'
+
+    jobs.run_job(job['id'], fake_score_records)
+    with open(jobs.results_path(job['id'])) as f:
+        return jobs.get_job(job['id']), [json.loads(line) for line in f]
+
+
+def test_jsonl_job_reports_errors_per_line(tmp_path, monkeypatch):
+    body = '{"Age": 24}\n{not json\n\n{"Gender": "male"}\n{"Age": 72}\n'
+    job, results = run(tmp_path, monkeypatch, body, 'jsonl')
+
+    assert job['status'] == 'completed'
+    assert (job['total'], job['processed'], job['succeeded'], job['failed']) == (4, 4, 2, 2)
+    assert [result['index'] for result in results] == [0, 1, 2, 3]
+    assert results[0]['age'] == 24 and results[3]['age'] == 72
+    assert results[1]['error'] == 'Invalid JSON'
+
+
+def test_records_with_an_error_field_are_scored(tmp_path, monkeypatch):
+    # Only lines that failed to parse are passed through unscored
+    body = '{"Age": 30, "error": "none"}\n{"error": "x", "message": "y"}\n'
+    job, results = run(tmp_path, monkeypatch, body, 'jsonl')
+
+    assert (job['succeeded'], job['failed']) == (1, 1)
+    assert results[0] == {'age': 30, 'index': 0}
+    assert results[1] == {'error': 'Missing required field: Age', 'index': 1}
+
+
+def test_csv_values_are_coerced_to_numbers(tmp_path, monkeypatch):
+    body = 'Age,Gender,Q1\n24,male,yes\n84.5,female,2\n'
+    job, results = run(tmp_path, monkeypatch, body, 'csv')
+
+    assert job['status'] == 'completed'
+    assert [result['age'] for result in results] == [24, 84.5]
+
+
+def test_jobs_of_a_stopped_process_are_failed(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_DIR', str(tmp_path))
+    monkeypatch.setattr(jobs, '_ACTIVE', set())
+    monkeypatch.setattr(jobs, 'executor', lambda: type('Idle', (), {'submit': lambda *args: None})())
+    created = [jobs.create_job(io.BytesIO(b'{"Age": 24}\n'), 'jsonl')['id'] for _ in range(4)]
+    orphaned, queued, alive, fresh = created
+
+    # A running job whose worker was recycled, a queued one never picked
+    # up, and one whose process is still sending heartbeats
+    jobs.update_job(orphaned, status='running', heartbeat_at=time.time() - 120)
+    jobs.update_job(queued, created_at=time.time() - 120)
+    jobs.submit(alive, fake_score_records)
+    jobs.update_job(alive, status='running', heartbeat_at=time.time() - 120)
+    jobs.send_heartbeat()
+
+    assert jobs.recover_stale_jobs() == 2
+    for job_id in (orphaned, queued):
+        job = jobs.get_job(job_id)
+        assert job['status'] == 'failed' and job['error'] == jobs.STALE_ERROR
+    assert jobs.get_job(alive)['status'] == 'running'
+    assert jobs.get_job(alive)['owner'] == jobs.job_owner()
+    assert jobs.get_job(fresh)['status'] == 'queued'
+
+    # A job that goes stale later fails when next read, ending its event stream
+    jobs.update_job(fresh, heartbeat_at=time.time() - 120)
+    events = list(jobs.job_events(fresh, interval=0))
+    assert len(events) == 1 and json.loads(events[0][len('data: '):])['status'] == 'failed'
+
+
+def test_recovery_without_a_job_table_creates_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_DIR', str(tmp_path / 'jobs'))
+    assert jobs.recover_stale_jobs() == 0
+    assert not (tmp_path / 'jobs').exists()
+
+
+def test_detect_format():
+    assert jobs.detect_format('sheet.CSV') == 'csv'
+    assert jobs.detect_format('batch.ndjson') == 'jsonl'
+    assert jobs.detect_format(None, 'application/x-ndjson') == 'jsonl'
+    assert jobs.detect_format('sheet.csv', requested='JSONL') == 'jsonl'
+    assert jobs.detect_format('sheet.xlsx') is None
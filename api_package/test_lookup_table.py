@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import app as api
+import lookup_table
+import schema
+from instruments import INSTRUMENTS
+from lookup_table import ROWS_PER_AGE, decode_entries, decode_rows, encode_entries, table_index
+from test_scoring import mchat_bundle, random_mchat_records
+
+
+def test_table_index_round_trips_through_decode_rows():
+    ages = [12, 24, 36]
+    rng = np.random.default_rng(1)
+    rows = np.sort(rng.integers(0, len(ages) * ROWS_PER_AGE, size=1000))
+
+    for row in rows[:50]:
+        answers, age, gender, jaundice, family_history = decode_rows(row, row + 1, ages)
+        slot = ages.index(int(age[0]))
+        assert table_index(answers, gender, jaundice, family_history, [slot])[0] == row
+
+
+def test_entries_keep_label_and_quantized_probability():
+    probas = np.random.default_rng(2).random(10000)
+    prediction_probas = np.column_stack([1 - probas, probas])
+    predictions = (probas > 0.5).astype(int)
+
+    decoded_predictions, decoded_probas = decode_entries(encode_entries(predictions, prediction_probas))
+    np.testing.assert_array_equal(decoded_predictions, predictions)
+    np.testing.assert_allclose(decoded_probas, prediction_probas, atol=2e-5)
+
+
+# ----------------------------------------------------------------------------
+# Serving, with a one-age table scored only at the rows the tests read
+# ----------------------------------------------------------------------------
+
+def write_table(tmp_path, bundle, records, ages=(24,)):
+    """Build a table the way build_table does, scoring only the given records.
+
+    The file is sparse: unscored rows are never written.
+    """
+    model_path = tmp_path / 'mchat_model.pkl'
+    features_path = tmp_path / 'mchat_feature_names.pkl'
+    table_path = str(tmp_path / 'mchat_table.npy')
+    joblib.dump(bundle['model'], model_path)
+    joblib.dump(bundle['features'], features_path)
+
+    ages = list(ages)
+    values = np.lib.format.open_memmap(table_path, mode='w+', dtype=np.uint16, shape=(len(ages) * ROWS_PER_AGE,))
+    del values
+    lookup_table.init_worker(str(model_path), str(features_path), table_path, ages)
+    answers, age, gender, jaundice, family_history = INSTRUMENTS['mchat']['encode'](records)
+    slots = [ages.index(int(months)) for months in age]
+    for row in table_index(answers, gender, jaundice, family_history, slots):
+        lookup_table.score_rows(row, row + 1)
+
+    meta = {
+        'format_version': lookup_table.FORMAT_VERSION,
+        'model_sha256': bundle['sha256'],
+        'feature_names': bundle['features'],
+        'ages': ages,
+        'rows': len(ages) * ROWS_PER_AGE,
+    }
+    with open(lookup_table.meta_path(table_path), 'w') as f:
+        json.dump(meta, f)
+    return table_path
+
+
+@pytest.fixture
+def serving(tmp_path, monkeypatch):
+    # A fresh serving state and build worker; returns (bundle, records at 24 months)
+    monkeypatch.setattr(lookup_table, '_SERVING', {'table': None, 'status': 'disabled', 'reason': None, 'hits': 0})
+    monkeypatch.setattr(lookup_table, '_WORKER', {})
+    bundle = mchat_bundle(RandomForestClassifier, n_estimators=10)
+    bundle['features'] = bundle['plan']['feature_names']
+    mchat_schema = INSTRUMENTS['mchat']['schema']
+    records = [schema.validate(mchat_schema, dict(record, Age=24))[0] for record in random_mchat_records(20, seed=51)]
+    table_path = write_table(tmp_path, bundle, records)
+    monkeypatch.setattr(lookup_table, 'LOOKUP_TABLE_PATH', table_path)
+    return bundle, records
+
+
+def test_table_for_the_loaded_model_is_served(serving):
+    bundle, _ = serving
+    lookup_table.attach(bundle)
+
+    assert lookup_table.serving_status()['status'] == 'active'
+    assert lookup_table.serving_status()['ages'] == [24]
+    assert lookup_table.active_table(bundle) is not None
+    # Another model version never reads it
+    assert lookup_table.active_table(dict(bundle, sha256='f' * 64)) is None
+
+
+@pytest.mark.parametrize('change, reason', [
+    (lambda bundle: {'sha256': 'f' * 64}, 'model hash mismatch'),
+    (lambda bundle: {'features': bundle['features'][::-1]}, 'feature list mismatch'),
+])
+def test_table_for_another_model_is_refused(serving, change, reason):
+    bundle, _ = serving
+    other = dict(bundle, **change(bundle))
+    lookup_table.attach(other)
+
+    status = lookup_table.serving_status()
+    assert status['status'] == 'refused' and status['reason'].startswith(reason)
+    assert lookup_table.active_table(other) is None
+
+
+def test_table_rebuilt_for_a_new_model_is_picked_up(serving, tmp_path):
+    bundle, records = serving
+    new = dict(bundle, sha256='f' * 64)
+    lookup_table.attach(new)
+    assert lookup_table.serving_status()['status'] == 'refused'
+
+    # Rebuilt in place for the new model: the next attach reads it from disk
+    write_table(tmp_path, new, records)
+    lookup_table.attach(new)
+    assert lookup_table.serving_status()['status'] == 'active'
+    assert lookup_table.active_table(new) is not None
+
+
+def test_incomplete_table_is_refused(serving):
+    bundle, _ = serving
+    os.remove(lookup_table.meta_path(lookup_table.LOOKUP_TABLE_PATH))
+    lookup_table.attach(bundle)
+
+    status = lookup_table.serving_status()
+    assert status['status'] == 'refused' and 'did not finish' in status['reason']
+    assert lookup_table.active_table(bundle) is None
+
+
+def test_run_model_reads_covered_records_from_the_table(serving, monkeypatch):
+    bundle, covered = serving
+    lookup_table.attach(bundle)
+    # 25 months is not in the table: inferred as usual
+    uncovered = [dict(covered[0], Age=25), dict(covered[1], Age=25)]
+    records = covered + uncovered
+
+    X = api.preprocess_data('mchat', records, bundle['plan'])
+    expected_probas = bundle['model'].predict_proba(X)
+    expected_labels = bundle['model'].predict(X)
+
+    model = bundle['model']
+    calls = []
+    predict_proba = model.predict_proba
+    monkeypatch.setattr(model, 'predict_proba', lambda X: calls.append(len(X)) or predict_proba(X))
+    results = api.run_model('mchat', records, bundle)
+
+    assert calls == [len(uncovered)]
+    assert lookup_table.serving_status()['hits'] == len(covered)
+    assert [result['prediction'] for result in results] == expected_labels.tolist()
+    np.testing.assert_allclose(
+        [result['probabilities']['asd'] for result in results], expected_probas[:, 1], atol=2e-5
+    )
+    # Inferred records carry the exact probabilities
+    assert [result['confidence'] for result in results[-2:]] == expected_probas[-2:, 1].tolist()
+
+
+def test_hits_are_exact_under_concurrent_requests(monkeypatch):
+    monkeypatch.setattr(lookup_table, '_SERVING', {'table': None, 'status': 'disabled', 'reason': None, 'hits': 0})
+
+    def serve():
+        for _ in range(2000):
+            lookup_table.record_hits(3)
+
+    threads = [threading.Thread(target=serve) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert lookup_table.serving_status()['hits'] == 8 * 2000 * 3
@@ -0,0 +1,66 @@
+import os
+import time
+
+import app as api
+import metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('test_seconds', 'Test.', ('model',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(('mchat',), value)
+
+    lines = histogram.render()
+    assert 'test_seconds_bucket{model="mchat",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{model="mchat",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{model="mchat",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{model="mchat"} 4' in lines
+    assert 'test_seconds_sum{model="mchat"} 3.65' in lines
+
+
+def test_stages_are_recorded_per_request():
+    metrics.begin_request('unit')
+    metrics.set_model('aq')
+    for _ in range(2):
+        with metrics.stage('preprocess'):
+            pass
+    metrics.end_request(200)
+
+    rendered = metrics.render()
+    assert 'asd_request_duration_seconds_count{endpoint="unit",model="aq",status="200"} 1' in rendered
+    # Re-entered stages add up to one observation per request
+    assert 'asd_stage_duration_seconds_count{stage="preprocess",model="aq",status="200"}' in rendered
+
+    # Outside a request, stages are a no-op
+    with metrics.stage('preprocess'):
+        pass
+
+
+def test_metrics_endpoint_labels_by_status():
+    client = api.app.test_client()
+    assert client.post('/predict', json={'Age': 6}).status_code == 400
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert 'asd_request_duration_seconds_count{endpoint="predict",model="none",status="400"}' in text
+    assert 'asd_stage_duration_seconds_count{stage="parse",model="none",status="400"}' in text
+
+
+def test_slow_request_writes_folded_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'PROFILE_SLOW_MS', 1)
+    monkeypatch.setattr(metrics, 'PROFILE_INTERVAL_MS', 1)
+    monkeypatch.setattr(metrics, 'PROFILE_DIR', str(tmp_path))
+
+    metrics.begin_request('slow')
+    deadline = time.perf_counter() + 0.1
+    while time.perf_counter() < deadline:
+        pass
+    metrics.end_request(200)
+
+    [name] = os.listdir(tmp_path)
+    with open(tmp_path / name) as f:
+        lines = f.read().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(' ', 1)
+    assert int(count) > 0 and 'test_slow_request_writes_folded_profile' in stack
@@ -0,0 +1,104 @@
+import shutil
+
+import joblib
+import pytest
+
+import model_loader
+from export_model import compile_model
+from test_model_reload import fit_mchat_model
+from test_scoring import FEATURES_PATH
+
+
+@pytest.fixture
+def empty_model_dir(tmp_path, monkeypatch):
+    # No model loaded or failed yet; every file read is counted
+    monkeypatch.setattr(model_loader, 'MODEL_DIR', str(tmp_path))
+    monkeypatch.setattr(model_loader, 'MODEL_RUNTIME', 'sklearn')
+    for state in (model_loader._LOADED, model_loader._ERRORS, model_loader._RELOADS):
+        for name in model_loader.MODEL_SPECS:
+            monkeypatch.setitem(state, name, None)
+    reads = []
+    read_model_files = model_loader.read_model_files
+    monkeypatch.setattr(
+        model_loader, 'read_model_files', lambda spec: reads.append(spec['label']) or read_model_files(spec)
+    )
+    return tmp_path, reads
+
+
+def write_mchat_model(model_dir, seed=0):
+    shutil.copy(FEATURES_PATH, model_dir)
+    model = fit_mchat_model(seed)
+    joblib.dump(model, model_dir / 'mchat_model.pkl')
+    return model
+
+
+def test_models_load_lazily_on_first_use(empty_model_dir):
+    model_dir, reads = empty_model_dir
+    write_mchat_model(model_dir)
+    assert reads == [] and model_loader.model_status('mchat')['loaded'] is False
+
+    bundle = model_loader.get_model('mchat')
+    assert bundle is model_loader.get_model('mchat')
+    # Loaded once; the AQ model was never touched
+    assert reads == ['M-CHAT']
+    assert model_loader._LOADED['aq'] is None and model_loader._ERRORS['aq'] is None
+
+    status = model_loader.model_status('mchat')
+    assert status['loaded'] is True and status['version'] == bundle['version']
+    assert status['load_seconds'] >= 0 and status['bytes'] > 0
+
+
+def test_failed_load_is_reported_and_not_retried_until_reload(empty_model_dir):
+    model_dir, reads = empty_model_dir
+
+    assert model_loader.get_model('mchat') is None
+    assert model_loader.get_model('mchat') is None
+    # The failure is cached: requests do not hit the disk again
+    assert reads == ['M-CHAT']
+    status = model_loader.model_status('mchat')
+    assert status['loaded'] is False and 'mchat_model.pkl' in status['error']
+
+    # A reload (admin endpoint or file watcher) picks up the fixed files
+    write_mchat_model(model_dir)
+    assert model_loader.reload_model('mchat')['status'] == 'reloaded'
+    assert model_loader.get_model('mchat') is not None
+    assert model_loader.model_status('mchat')['error'] is None
+
+
+def test_unproducible_feature_list_fails_the_load(empty_model_dir):
+    model_dir, reads = empty_model_dir
+    write_mchat_model(model_dir)
+    joblib.dump(list(joblib.load(FEATURES_PATH)) + ['Q99_Failed'], model_dir / 'mchat_feature_names.pkl')
+
+    assert model_loader.get_model('mchat') is None
+    assert model_loader.get_model('mchat') is None
+    assert reads == ['M-CHAT']
+    assert 'Q99_Failed' in model_loader.model_status('mchat')['error']
+
+
+def test_feature_list_from_another_training_run_is_refused(empty_model_dir):
+    # The new model is in place but the feature list is not (or vice versa)
+    model_dir, _ = empty_model_dir
+    write_mchat_model(model_dir)
+    features = list(joblib.load(FEATURES_PATH))
+    joblib.dump(features[1:] + features[:1], model_dir / 'mchat_feature_names.pkl')
+
+    assert model_loader.get_model('mchat') is None
+    error = model_loader.model_status('mchat')['error']
+    assert error.startswith('Feature list does not match') and repr(features[0]) in error
+
+
+@pytest.mark.parametrize('mmap, mapped', [(True, True), (False, False)])
+def test_compiled_exports_are_memory_mapped(empty_model_dir, monkeypatch, mmap, mapped):
+    model_dir, _ = empty_model_dir
+    model = write_mchat_model(model_dir)
+    features = list(joblib.load(FEATURES_PATH))
+    compile_model(model, features, '0' * 64).save(str(model_dir / 'mchat_model.npz'))
+    monkeypatch.setattr(model_loader, 'MODEL_RUNTIME', 'compiled')
+    monkeypatch.setattr(model_loader, 'MODEL_MMAP', mmap)
+
+    bundle = model_loader.get_model('mchat')
+
+    # Every node array is mapped; only classes_ comes from the JSON metadata
+    unmapped = bundle['bytes'] - bundle['mmap_bytes']
+    assert unmapped == (bundle['model'].classes_.nbytes if mapped else bundle['bytes'])
@@ -0,0 +1,146 @@
+import os
+import shutil
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import app as api
+import model_loader
+from test_scoring import FEATURES_PATH, random_mchat_records
+
+
+def fit_mchat_model(seed, classes=2):
+    features = list(joblib.load(FEATURES_PATH))
+    X = api.preprocess_data('mchat', random_mchat_records(300, seed=seed), model_loader.MODEL_SPECS['mchat']['compile_plan'](features))
+    y = np.random.default_rng(seed).integers(0, classes, len(X))
+    return RandomForestClassifier(n_estimators=5, random_state=seed).fit(pd.DataFrame(X, columns=features), y)
+
+
+@pytest.fixture
+def model_dir(tmp_path, monkeypatch):
+    shutil.copy(FEATURES_PATH, tmp_path)
+    joblib.dump(fit_mchat_model(0), tmp_path / 'mchat_model.pkl')
+    monkeypatch.setattr(model_loader, 'MODEL_DIR', str(tmp_path))
+    monkeypatch.setattr(model_loader, 'MODEL_RUNTIME', 'sklearn')
+    for state in (model_loader._LOADED, model_loader._ERRORS, model_loader._RELOADS):
+        monkeypatch.setitem(state, 'mchat', None)
+    monkeypatch.setattr(model_loader, '_WATCHER', {'pid': None, 'marker': None})
+    return tmp_path
+
+
+def replace_model(model_dir, model):
+    # Written aside and renamed in, as a deployment should
+    joblib.dump(model, model_dir / 'mchat_model.pkl.new')
+    os.replace(model_dir / 'mchat_model.pkl.new', model_dir / 'mchat_model.pkl')
+
+
+def test_reload_swaps_version_and_keeps_old_bundle(model_dir):
+    old = model_loader.get_model('mchat')
+    assert model_loader.reload_model('mchat')['status'] == 'unchanged'
+
+    replace_model(model_dir, fit_mchat_model(1))
+    outcome = model_loader.reload_model('mchat')
+
+    new = model_loader.get_model('mchat')
+    assert outcome['status'] == 'reloaded'
+    assert outcome['previous_version'] == old['version'] != new['version'] == outcome['version']
+    assert 0 <= outcome['smoke_agreement'] <= 1
+    # A request holding the old bundle still scores with the old model
+    assert api.run_model('mchat', random_mchat_records(1), old)[0]['model_version'] == old['version']
+    assert api.run_model('mchat', random_mchat_records(1), new)[0]['model_version'] == new['version']
+
+
+@pytest.mark.filterwarnings('ignore:X has feature names')
+def test_new_feature_list_alone_is_a_new_version(model_dir):
+    # A model fitted without column names takes its column order from the
+    # feature list, so a new list with the same model file is a new model
+    model = fit_mchat_model(0)
+    del model.feature_names_in_
+    replace_model(model_dir, model)
+    old = model_loader.get_model('mchat')
+
+    features = list(joblib.load(FEATURES_PATH))
+    joblib.dump(features[1:] + features[:1], model_dir / 'mchat_feature_names.pkl')
+    outcome = model_loader.reload_model('mchat')
+
+    new = model_loader.get_model('mchat')
+    assert outcome['status'] == 'reloaded'
+    assert new['sha256'] == old['sha256'] and new['version'] != old['version']
+    assert new['features'] == features[1:] + features[:1]
+
+
+def test_reload_rejects_a_model_that_fails_the_smoke_test(model_dir):
+    old = model_loader.get_model('mchat')
+
+    replace_model(model_dir, fit_mchat_model(1, classes=3))
+    outcome = model_loader.reload_model('mchat')
+
+    assert outcome['status'] == 'rejected'
+    assert 'classes' in outcome['error']
+    assert model_loader.get_model('mchat') is old
+    assert model_loader.model_status('mchat')['last_reload'] == outcome
+
+
+def test_watcher_reloads_once_files_settle(model_dir):
+    model_loader.get_model('mchat')
+    seen = {name: model_loader.files_signature(name) for name in model_loader.MODEL_SPECS}
+    pending = {}
+
+    replace_model(model_dir, fit_mchat_model(1))
+    model_loader.poll_model_files(seen, pending)
+    assert 'mchat' in pending and model_loader._RELOADS['mchat'] is None
+
+    model_loader.poll_model_files(seen, pending)
+    assert model_loader._RELOADS['mchat']['status'] == 'reloaded'
+    assert not pending
+
+
+def test_watcher_of_a_new_worker_catches_up_with_changed_files(model_dir):
+    # A worker forked after the files changed holds the master's older model
+    old = model_loader.get_model('mchat')
+    replace_model(model_dir, fit_mchat_model(1))
+    seen = model_loader.loaded_signatures()
+    pending = {}
+
+    model_loader.poll_model_files(seen, pending)
+    model_loader.poll_model_files(seen, pending)
+    assert model_loader.get_model('mchat')['version'] != old['version']
+
+
+def test_admin_reload_reaches_the_other_workers(model_dir, monkeypatch):
+    monkeypatch.setattr(api, 'ADMIN_TOKEN', 'secret')
+    old = model_loader.get_model('mchat')
+    replace_model(model_dir, fit_mchat_model(1))
+
+    response = api.app.test_client().post('/admin/reload', headers={'Authorization': 'Bearer secret'})
+    assert response.get_json()['all_workers'] is True
+    new_version = response.get_json()['models']['mchat']['version']
+    # The worker that answered does not act on its own marker
+    outcome = model_loader._RELOADS['mchat']
+    model_loader.poll_reload_marker()
+    assert model_loader._RELOADS['mchat'] is outcome
+
+    # Another worker, still serving the old version, follows on its next poll
+    model_loader.install('mchat', old)
+    monkeypatch.setitem(model_loader._WATCHER, 'marker', None)
+    model_loader.poll_reload_marker()
+    assert model_loader.get_model('mchat')['version'] == new_version
+    assert model_loader._RELOADS['mchat']['status'] == 'reloaded'
+    model_loader.poll_reload_marker()
+    assert model_loader._RELOADS['mchat']['previous_version'] == old['version']
+
+
+def test_admin_reload_needs_token(model_dir, monkeypatch):
+    client = api.app.test_client()
+    monkeypatch.setattr(api, 'ADMIN_TOKEN', None)
+    assert client.post('/admin/reload').status_code == 403
+
+    monkeypatch.setattr(api, 'ADMIN_TOKEN', 'secret')
+    assert client.post('/admin/reload', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+    response = client.post('/admin/reload?model=mchat', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.get_json()['models']['mchat']['status'] == 'reloaded'
@@ -0,0 +1,123 @@
+import json
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import app as api
+import packed
+import schema
+from instruments import INSTRUMENTS
+from test_features import random_aq_records
+from test_scoring import mchat_bundle, random_mchat_records
+
+
+def test_records_round_trip_to_validated_rows():
+    records = random_mchat_records(50, seed=5) + random_aq_records(50, seed=6)
+    for record in records[50:]:
+        record['Age'] = int(record['Age'] * 12)
+    records[0]['Age'] = 24.5
+
+    decoded = packed.decode_records(packed.encode_records(records))
+
+    assert decoded[0]['Age'] == 24.5 and isinstance(decoded[1]['Age'], int)
+    for model_schema, original, row in zip(
+        [INSTRUMENTS['mchat']['schema']] * 50 + [INSTRUMENTS['aq']['schema']] * 50, records, decoded
+    ):
+        assert schema.validate(model_schema, row) == schema.validate(model_schema, original)
+
+
+def test_encode_rejects_bad_values():
+    record = random_mchat_records(1)[0]
+    with pytest.raises(ValueError, match='record 0: must be "yes" or "no"'):
+        packed.encode_records([dict(record, Q5='maybe')])
+    # 40 months routes to AQ, so the AQ answers are read
+    with pytest.raises(ValueError, match='record 0: '):
+        packed.encode_records([dict(record, Age=40)])
+    del record['Jaundice']
+    with pytest.raises(ValueError, match='missing field Jaundice'):
+        packed.encode_records([record])
+
+
+def test_records_are_packed_as_their_instrument():
+    aq_record = random_aq_records(1, seed=9)[0]
+    unrouted = dict(random_mchat_records(1, seed=9)[0], Age=6)
+    records = [dict(aq_record, Age=36), unrouted, {**unrouted, 'Age': 150}]
+
+    # By age unless the target endpoint is given; uncovered ages carry no answers
+    assert [len(row) for row in packed.decode_records(packed.encode_records(records[1:]))] == [4, 4]
+    assert len(packed.decode_records(packed.encode_records(records[:1], 'aq'))[0]) == 4 + 30
+    del aq_record['Q30']
+    assert len(packed.decode_records(packed.encode_records([dict(aq_record, Age=24)]))[0]) == 4 + 23
+    with pytest.raises(ValueError, match='record 1: missing field Q30'):
+        packed.encode_records(records[1:2] + [dict(aq_record, Age=40)])
+    # One model code per registered instrument, in declaration order
+    assert list(packed.MODEL_CODES) == list(INSTRUMENTS)
+    assert packed.MAX_QUESTIONS == max(instrument['questions'] for instrument in INSTRUMENTS.values())
+
+
+def test_decode_rejects_truncated_bodies():
+    body = packed.encode_records(random_mchat_records(2))
+    with pytest.raises(ValueError, match='whole number'):
+        packed.decode_records(body[:-1])
+    with pytest.raises(ValueError, match='marker'):
+        packed.decode_records(b'{"Age": 24}')
+
+
+def test_packed_batch_matches_json(monkeypatch):
+    bundle = mchat_bundle(RandomForestClassifier, n_estimators=10)
+    monkeypatch.setattr(api, 'get_model', lambda name: bundle if name == 'mchat' else None)
+    records = random_mchat_records(20, seed=7)
+    records[3]['Age'] = 6
+    records[8]['Age'] = 150
+
+    client = api.app.test_client()
+    expected = client.post('/predict/batch', json=records).get_json()['results']
+    response = client.post(
+        '/predict/batch',
+        data=packed.encode_records(records),
+        content_type=packed.PACKED_MIMETYPE,
+        headers={'Accept': packed.PACKED_MIMETYPE},
+    )
+
+    assert response.mimetype == packed.PACKED_MIMETYPE
+    results = packed.decode_results(response.get_data())
+    assert len(results) == 20
+    assert results[3] == {key: value for key, value in expected[3].items() if key != 'index'}
+    for result, json_result in zip(results, expected):
+        if 'error' in json_result:
+            assert result == {key: value for key, value in json_result.items() if key != 'index'}
+            continue
+        assert result['model_used'] == json_result['model_used']
+        assert result['prediction'] == json_result['prediction']
+        assert result['probabilities'] == json_result['probabilities']
+
+
+def test_single_endpoint_negotiates_response(monkeypatch):
+    bundle = mchat_bundle(RandomForestClassifier, n_estimators=10)
+    monkeypatch.setattr(api, 'get_model', lambda name: bundle)
+    record = random_mchat_records(1, seed=8)[0]
+    client = api.app.test_client()
+
+    body = packed.encode_records([record])
+    as_json = client.post('/predict', data=body, content_type=packed.PACKED_MIMETYPE)
+    assert as_json.mimetype == 'application/json'
+    assert as_json.get_json()['probabilities'] == client.post('/predict', json=record).get_json()['probabilities']
+
+    two = client.post('/predict/mchat', data=body + body[4:], content_type=packed.PACKED_MIMETYPE)
+    assert two.status_code == 400
+    assert 'exactly one record' in two.get_json()['message']
+
+
+def test_results_round_trip_with_errors():
+    results = [
+        {'model_used': 'aq', 'prediction': 1, 'probabilities': {'no_asd': 0.25, 'asd': 0.75}, 'age': 5.0},
+        {'error': 'Age out of range', 'message': 'Child is too young', 'index': 1},
+    ]
+    decoded = packed.decode_results(packed.encode_results(results))
+    assert decoded == [
+        {'model_used': 'aq', 'prediction': 1, 'probabilities': {'no_asd': 0.25, 'asd': 0.75}},
+        {'error': 'Age out of range', 'message': 'Child is too young'},
+    ]
+    assert json.loads(packed.encode_results(results[:1])[4 + 4 + packed.RESULT_DTYPE.itemsize:]) == {}
+    assert np.frombuffer(packed.encode_results(results), dtype='<u4', count=1, offset=4)[0] == 2
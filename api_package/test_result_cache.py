@@ -0,0 +1,82 @@
+import threading
+
+import result_cache
+import schema
+from instruments import INSTRUMENTS
+from result_cache import LRUCache, cache_keys
+
+
+def mchat_record(**overrides):
+    record = {'Age': 24, 'Gender': 'male', 'Jaundice': 'no', 'Family_ASD_History': 'yes'}
+    record.update({f'Q{i}': 'yes' if i % 2 else 'no' for i in range(1, 24)})
+    record.update(overrides)
+    return record
+
+
+def cache_key(model_name, record, model_identity):
+    return cache_keys(model_name, [record], model_identity)[0]
+
+
+def test_equivalent_answers_share_a_key():
+    spelled = mchat_record(Q1='Yes', Q2='NO', Gender='Male')
+    numeric = mchat_record(Q1=1, Q2=0, Gender=1, Age=24.0)
+    validated, _ = schema.validate(INSTRUMENTS['mchat']['schema'], spelled)
+    assert cache_key('mchat', spelled, 'abc') == cache_key('mchat', numeric, 'abc') == cache_key('mchat', validated, 'abc')
+
+
+def test_key_depends_on_answers_age_and_model_version():
+    base = cache_key('mchat', mchat_record(), 'abc')
+    assert cache_key('mchat', mchat_record(Q23='no'), 'abc') != base
+    assert cache_key('mchat', mchat_record(Age=25), 'abc') != base
+    assert cache_key('mchat', mchat_record(), 'def') != base
+    assert cache_keys('mchat', [mchat_record()], 'abc', threshold=0.3)[0] != base
+
+
+def test_keys_follow_the_instrument_encoding():
+    aq = {'Age': 6.0, 'Gender': 'female', 'Jaundice': 'no', 'Family_ASD_History': 'no'}
+    aq.update({f'Q{i}': 1 for i in range(1, 31)})
+    keys = cache_keys('aq', [aq, dict(aq, Q30=2), aq], 'abc')
+    assert keys[0] == keys[2] != keys[1]
+    # Records the instrument cannot encode are not cached
+    assert cache_keys('mchat', [mchat_record(), {'Age': 24}], 'abc') == [None, None]
+    assert cache_keys('unknown', [aq], 'abc') == [None]
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put('mchat:a', 1)
+    cache.put('mchat:b', 2)
+    cache.get('mchat:a')
+    cache.put('aq:c', 3)
+    assert cache.get('mchat:b') is None
+    assert cache.get('mchat:a') == 1
+    assert cache.evictions == 1
+
+    cache.clear('mchat:')
+    assert len(cache) == 1 and cache.get('aq:c') == 3
+
+
+def test_stats_count_hits_and_misses():
+    before = result_cache.stats()
+    result_cache.put('test:key', {'prediction': 0})
+    assert result_cache.get('test:key') == {'prediction': 0}
+    assert result_cache.get('test:missing') is None
+    after = result_cache.stats()
+    assert after['hits'] == before['hits'] + 1
+    assert after['misses'] == before['misses'] + 1
+    result_cache.clear('test')
+
+
+def test_counters_are_exact_under_concurrent_lookups():
+    before = result_cache.stats()
+
+    def look_up():
+        for _ in range(2000):
+            result_cache.get('test:missing')
+
+    threads = [threading.Thread(target=look_up) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert result_cache.stats()['misses'] == before['misses'] + 16000
@@ -0,0 +1,63 @@
+import app as api
+import schema
+from instruments import INSTRUMENTS
+
+MCHAT_SCHEMA = INSTRUMENTS['mchat']['schema']
+AQ_SCHEMA = INSTRUMENTS['aq']['schema']
+
+
+def mchat_payload(**overrides):
+    payload = {'Age': 24, 'Gender': 'male', 'Jaundice': 'no', 'Family_ASD_History': 'yes'}
+    payload.update({f'Q{i}': 'yes' if i % 2 else 'no' for i in range(1, 24)})
+    payload.update(overrides)
+    return payload
+
+
+def aq_payload(**overrides):
+    payload = {'Age': 7.0, 'Gender': 'female', 'Jaundice': 'no', 'Family_ASD_History': 'no'}
+    payload.update({f'Q{i}': i % 4 for i in range(1, 31)})
+    payload.update(overrides)
+    return payload
+
+
+def test_flags_and_answers_are_encoded():
+    row, errors = schema.validate(MCHAT_SCHEMA, mchat_payload(Gender=' Male ', Jaundice=True, Q2=1.0, Extra='x'))
+    assert errors == []
+    assert list(row) == MCHAT_SCHEMA['fields']
+    assert (row['Age'], row['Gender'], row['Jaundice'], row['Family_ASD_History']) == (24, 1, 1, 1)
+    assert row['Q1'] == 1 and row['Q2'] == 1 and row['Q4'] == 0
+
+
+def test_every_bad_field_is_reported():
+    payload = aq_payload(Q3=7, Q4='2', Gender='other', Age='seven')
+    del payload['Q30']
+    row, errors = schema.validate(AQ_SCHEMA, payload)
+
+    assert [(error['field'], error['error']) for error in errors] == [
+        ('Age', 'invalid'), ('Gender', 'invalid'), ('Q3', 'invalid'), ('Q4', 'invalid'), ('Q30', 'missing'),
+    ]
+    body = schema.error_body(AQ_SCHEMA, errors)
+    assert body['error'] == 'Invalid fields' and body['missing_fields'] == ['Q30']
+
+
+def test_non_yes_no_answers_are_rejected():
+    for value in ('maybe', '', None, 2, 0.5, [1]):
+        _, errors = schema.validate(MCHAT_SCHEMA, mchat_payload(Q5=value))
+        assert [error['field'] for error in errors] == ['Q5'], value
+
+
+def test_batch_returns_structured_errors():
+    client = api.app.test_client()
+    records = [
+        mchat_payload(Q1='perhaps', Jaundice='unknown'),
+        dict(aq_payload(Q10=9), Age=84),
+        {'Age': 24, 'Gender': 'male'},
+    ]
+    results = client.post('/predict/batch', json=records).get_json()['results']
+
+    assert [error['field'] for error in results[0]['field_errors']] == ['Jaundice', 'Q1']
+    assert results[1]['field_errors'] == [
+        {'field': 'Q10', 'error': 'invalid', 'message': 'must be an integer score from 0 to 3', 'value': 9}
+    ]
+    assert results[2]['error'] == 'Missing required fields'
+    assert len(results[2]['missing_fields']) == 25
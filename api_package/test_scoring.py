@@ -0,0 +1,71 @@
+import os
+
+import joblib
+import numpy as np
+from sklearn.ensemble import ExtraTreesClassifier, GradientBoostingClassifier, RandomForestClassifier
+
+import app as api
+import explain
+from instruments import INSTRUMENTS
+
+FEATURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outputs', 'mchat_feature_names.pkl')
+
+
+def random_mchat_records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            'Age': int(rng.integers(12, 37)),
+            'Gender': str(rng.choice(['male', 'female'])),
+            'Jaundice': str(rng.choice(['yes', 'no'])),
+            'Family_ASD_History': str(rng.choice(['yes', 'no'])),
+            **{f'Q{i}': str(rng.choice(['yes', 'no'])) for i in range(1, 24)},
+        }
+        for _ in range(n)
+    ]
+
+
+def mchat_bundle(model_class, threshold=None, **params):
+    plan = INSTRUMENTS['mchat']['compile_plan'](list(joblib.load(FEATURES_PATH)))
+    X = api.preprocess_data('mchat', random_mchat_records(400, seed=1), plan)
+    y = (X['Total_Failed_Count'] + np.random.default_rng(2).normal(0, 2, len(X)) > 11).astype(int)
+    model = model_class(random_state=0, **params).fit(X, y)
+    explainer, explain_error = explain.build_explainer('mchat', model, plan['feature_names'])
+    return {
+        'name': 'mchat', 'model': model, 'plan': plan, 'sha256': '0' * 64, 'identity': '0' * 64,
+        'version': '0' * 12,
+        'threshold': threshold, 'explainer': explainer, 'explain_error': explain_error,
+    }
+
+
+def test_labels_match_predict_at_default_threshold():
+    records = random_mchat_records(2000, seed=3)
+    for model_class, params in [
+        (RandomForestClassifier, {'n_estimators': 25}),
+        (ExtraTreesClassifier, {'n_estimators': 25}),
+        (GradientBoostingClassifier, {'n_estimators': 25}),
+    ]:
+        bundle = mchat_bundle(model_class, **params)
+        X = api.preprocess_data('mchat', records, bundle['plan'])
+
+        results = api.run_model('mchat', records, bundle)
+        np.testing.assert_array_equal([result['prediction'] for result in results], bundle['model'].predict(X))
+        np.testing.assert_allclose(
+            [result['probabilities']['asd'] for result in results], bundle['model'].predict_proba(X)[:, 1]
+        )
+
+
+def test_custom_threshold_relabels_from_probability():
+    bundle = mchat_bundle(RandomForestClassifier, threshold=0.2, n_estimators=25)
+    results = api.run_model('mchat', random_mchat_records(500, seed=4), bundle)
+
+    for result in results:
+        assert result['prediction'] == int(result['probabilities']['asd'] >= 0.2)
+    assert any(result['prediction'] == 1 and result['confidence'] < 0.5 for result in results)
+
+
+def test_threshold_ties_follow_predict():
+    bundle = {'model': RandomForestClassifier(), 'threshold': None}
+    bundle['model'].classes_ = np.array([0, 1])
+    labels = api.apply_threshold(bundle, np.array([[0.5, 0.5], [0.4, 0.6], [0.6, 0.4]]))
+    np.testing.assert_array_equal(labels, [0, 1, 0])
@@ -0,0 +1,41 @@
+import json
+
+import app as api
+
+
+def stream(lines):
+    client = api.app.test_client()
+    response = client.post('/predict/stream', data=''.join(lines), content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_stream_reports_errors_per_line(monkeypatch):
+    monkeypatch.setattr(api, 'STREAM_BATCH_ROWS', 2)
+    lines = [
+        '{"Age": 6}\n',
+        '{broken\n',
+        '\n',
+        '{"Gender": "male"}\n',
+        '{"Age": 200}\n',
+        '{"Age": 24}\n',
+    ]
+    results = stream(lines)
+
+    assert [result['index'] for result in results] == [0, 1, 2, 3, 4]
+    assert results[0]['error'] == 'Age out of range'
+    assert results[1]['error'] == 'Invalid JSON'
+    assert results[2]['error'] == 'Missing required field: Age'
+    assert results[3]['error'] == 'Age out of range'
+    assert results[4]['error'] == 'Missing required fields'
+
+
+def test_stream_matches_batch_routing(monkeypatch):
+    # Same routing and validation as /predict/batch, micro-batch by micro-batch
+    monkeypatch.setattr(api, 'STREAM_BATCH_ROWS', 3)
+    records = [{'Age': age} for age in (3, 12, 36, 37, 132, 140, 'ten')]
+    results = stream(json.dumps(record) + '\n' for record in records)
+
+    expected = [dict(result, index=i) for i, result in enumerate(api.score_records(records))]
+    assert results == expected
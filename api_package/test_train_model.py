@@ -0,0 +1,88 @@
+import csv
+import json
+import os
+
+import joblib
+import numpy as np
+
+import app as api
+import train_model
+from features import AQ_FEATURES, MCHAT_FEATURES
+from instruments import INSTRUMENTS
+from model_loader import compile_bundle, smoke_test
+from test_scoring import random_mchat_records
+
+OUTPUTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outputs')
+
+
+def write_training_csv(path, n, seed):
+    records = random_mchat_records(n, seed)
+    for record in records:
+        failed = sum(record[f'Q{i}'] == 'no' for i in range(1, 24))
+        record['ASD'] = 'yes' if failed > 11 else 'no'
+    records[0]['Q5'] = 'maybe'
+    fields = list(records[0])
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(records)
+    return records
+
+
+def test_canonical_feature_order_matches_the_shipped_models():
+    for name, features in (('mchat', MCHAT_FEATURES), ('aq', AQ_FEATURES)):
+        shipped = joblib.load(os.path.join(OUTPUTS_DIR, f'{name}_feature_names.pkl'))
+        assert list(shipped) == features
+
+
+def test_only_unparseable_lines_are_skipped_as_such(tmp_path):
+    records = random_mchat_records(3, seed=32)
+    for record in records:
+        record['ASD'] = 'no'
+    # A real "error" column is data like any other
+    records[1]['error'] = 'none'
+    lines = [json.dumps(record) for record in records] + ['{not json', json.dumps({'error': 'x', 'ASD': 'yes'})]
+    data_path = tmp_path / 'mchat.jsonl'
+    data_path.write_text('\n'.join(lines) + '\n')
+
+    X, y, skipped = train_model.load_training_set('mchat', str(data_path), 'ASD')
+    assert len(X) == 3
+    assert [number for number, _ in skipped] == [4, 5]
+    assert skipped[0][1].startswith('Line 4:')
+    assert 'Age' in skipped[1][1]
+
+
+def test_train_writes_a_servable_model(tmp_path):
+    data_path = tmp_path / 'mchat.csv'
+    records = write_training_csv(data_path, 200, seed=31)
+    grid = {'n_estimators': [10, 20], 'max_depth': [4]}
+
+    meta = train_model.train(
+        'mchat', str(data_path), out_dir=str(tmp_path), grid=grid, folds=2, workers=2
+    )
+    assert meta['data']['rows'] == 199 and meta['data']['skipped'] == 1
+    assert 'Q5' in meta['data']['skipped_examples'][0]
+    assert len(meta['search']['results']) == 2
+    assert meta['timings']['feature_cache_hit'] is False
+
+    features = joblib.load(tmp_path / 'mchat_feature_names.pkl')
+    model = joblib.load(tmp_path / 'mchat_model.pkl')
+    assert features == MCHAT_FEATURES
+    assert model.get_params()['n_jobs'] is None
+    smoke_test(compile_bundle('mchat', model, features, str(tmp_path / 'mchat_model.pkl'), '0' * 64))
+    with open(tmp_path / 'mchat_model.json') as f:
+        assert json.load(f)['model_sha256'] == meta['model_sha256']
+
+    # The training matrix is exactly what the API builds for the same rows
+    X = np.load(next((tmp_path / 'feature_cache').glob('mchat-*/X.npy')))
+    expected = api.preprocess_data('mchat', records[1:], INSTRUMENTS['mchat']['compile_plan'](MCHAT_FEATURES))
+    np.testing.assert_array_equal(X, expected.to_numpy())
+
+    features_inode = os.stat(tmp_path / 'mchat_feature_names.pkl').st_ino
+    again = train_model.train(
+        'mchat', str(data_path), out_dir=str(tmp_path), grid=grid, folds=2, workers=2
+    )
+    assert again['timings']['feature_cache_hit'] is True
+    # An unchanged feature list is left alone: only the model is replaced
+    assert os.stat(tmp_path / 'mchat_feature_names.pkl').st_ino == features_inode
+    assert [r['fold_scores'] for r in again['search']['results']] == [r['fold_scores'] for r in meta['search']['results']]
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import ExtraTreesClassifier, GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+
+import tree_runtime
+from export_model import check_parity, compile_model, generate_check_set
+
+FEATURES = [f'F{i}' for i in range(8)]
+
+
+def training_data(seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.integers(0, 4, size=(500, len(FEATURES))).astype(float)
+    X[:, 5] = rng.normal(30, 5, size=500)
+    y = (X[:, :3].sum(axis=1) + rng.normal(0, 1.5, size=500) > 4.5).astype(int)
+    # Fitted on a frame with feature names, like the real models
+    return pd.DataFrame(X, columns=FEATURES), y
+
+
+@pytest.mark.parametrize('model', [
+    DecisionTreeClassifier(max_depth=8, random_state=0),
+    RandomForestClassifier(n_estimators=15, random_state=0),
+    ExtraTreesClassifier(n_estimators=15, max_depth=10, random_state=0),
+    GradientBoostingClassifier(n_estimators=30, random_state=0),
+])
+def test_compiled_probabilities_match_sklearn(model, tmp_path):
+    X, y = training_data()
+    model.fit(X, y)
+    compiled = compile_model(model, FEATURES, '0' * 64)
+
+    path = str(tmp_path / 'model.npz')
+    compiled.save(path)
+    loaded = tree_runtime.load(path)
+
+    X_check = pd.DataFrame(generate_check_set(loaded, 5000), columns=FEATURES)
+    np.testing.assert_allclose(loaded.predict_proba(X_check), model.predict_proba(X_check), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(loaded.predict(X_check), model.predict(X_check))
+    assert check_parity(model, loaded, 2000, atol=1e-12)['passed']
+
+    mapped = tree_runtime.load(path, mmap_mode='r')
+    np.testing.assert_array_equal(mapped.predict_proba(X_check), loaded.predict_proba(X_check))
+
+
+def test_unsupported_models_are_refused():
+    X, y = training_data()
+    with pytest.raises(ValueError, match='not a supported tree ensemble'):
+        compile_model(LogisticRegression().fit(X, y), FEATURES, '0' * 64)
+
+
+def test_feature_count_is_checked():
+    X, y = training_data()
+    compiled = compile_model(DecisionTreeClassifier(random_state=0).fit(X, y), FEATURES, '0' * 64)
+    with pytest.raises(ValueError, match='expects 8'):
+        compiled.predict_proba(X.iloc[:, :5])
@@ -0,0 +1,64 @@
+from sklearn.ensemble import RandomForestClassifier
+
+import app as api
+import schema
+import whatif
+from instruments import INSTRUMENTS
+from test_features import random_aq_records
+from test_scoring import mchat_bundle, random_mchat_records
+
+
+def test_variant_counts_and_dedupe():
+    mchat_row, _ = schema.validate(INSTRUMENTS['mchat']['schema'], random_mchat_records(1)[0])
+    aq_row, _ = schema.validate(INSTRUMENTS['aq']['schema'], random_aq_records(3, seed=0)[2])
+
+    assert len(list(whatif.answer_variants('mchat', mchat_row))) == 23
+    assert len(list(whatif.answer_variants('aq', aq_row))) == 90
+    assert [months for months, _ in whatif.age_variants('aq', aq_row)] == list(range(37, 133))
+
+    rows = [mchat_row] + [row for _, row in whatif.age_variants('mchat', mchat_row)]
+    unique_rows, positions = whatif.dedupe(rows)
+    # The child's own age appears in the age curve too
+    assert len(unique_rows) == 25
+    assert all(rows[i] == unique_rows[position] for i, position in enumerate(positions))
+
+
+def test_whatif_matches_single_predictions(monkeypatch):
+    bundle = mchat_bundle(RandomForestClassifier, n_estimators=10)
+    monkeypatch.setattr(api, 'get_model', lambda name: bundle)
+    calls = []
+    predict_proba = bundle['model'].predict_proba
+    monkeypatch.setattr(bundle['model'], 'predict_proba', lambda X: calls.append(len(X)) or predict_proba(X))
+
+    record = random_mchat_records(1, seed=11)[0]
+    client = api.app.test_client()
+    result = client.post('/predict/whatif', json=record).get_json()
+
+    assert calls == [48]
+    assert len(result['answer_changes']) == 23 and len(result['age_curve']) == 25
+    assert [abs(c['risk_change']) for c in result['answer_changes']] == sorted(
+        (abs(c['risk_change']) for c in result['answer_changes']), reverse=True
+    )
+
+    monkeypatch.setattr(bundle['model'], 'predict_proba', predict_proba)
+    change = result['answer_changes'][0]
+    flipped = client.post('/predict', json=dict(record, **{change['question']: change['alternative']})).get_json()
+    assert flipped['risk_percentage'] == change['risk_percentage']
+    assert change['answer'] == record[change['question']]
+
+    point = result['age_curve'][5]
+    aged = client.post('/predict', json=dict(record, Age=point['age_months'])).get_json()
+    assert aged['risk_percentage'] == point['risk_percentage']
+
+
+def test_whatif_list_reports_errors_and_dedupes_across_children(monkeypatch):
+    bundle = mchat_bundle(RandomForestClassifier, n_estimators=5)
+    monkeypatch.setattr(api, 'get_model', lambda name: bundle)
+    record = random_mchat_records(1, seed=12)[0]
+
+    body = api.app.test_client().post('/predict/whatif', json=[record, record, {'Age': 3}]).get_json()
+
+    assert body['count'] == 3
+    assert body['variants'] == 2 * 49 and body['unique_variants'] == 48
+    assert body['results'][0]['answer_changes'] == body['results'][1]['answer_changes']
+    assert body['results'][2]['error'] == 'Age out of range'
@@ -0,0 +1,405 @@
+"""Train the M-CHAT and AQ models with the serving feature engine.
+
+Training data is a CSV or JSON Lines file of screening payloads exactly as
+the API receives them (Age in months, the same field names and answer
+encodings), plus a label column. Every row goes through schema.validate()
+and the instrument's feature pipeline (instruments.py), the same code
+app.py scores requests with, so the training matrix cannot drift from what
+the API computes. The feature list saved next to the model is the column
+order of that matrix.
+
+Train (random forest, 5-fold search over the default grid, all cores):
+    python train_model.py mchat --data mchat_screenings.csv
+    python train_model.py aq --data aq_screenings.jsonl --label Class --workers 8
+    python train_model.py mchat --data mchat.csv --estimator gradient_boosting \\
+        --grid '{"n_estimators": [200, 400], "learning_rate": [0.05]}'
+
+Writes <model>_model.pkl, <model>_feature_names.pkl and <model>_model.json
+(search results, timings, data and code hashes) to --out-dir. The files are
+replaced atomically, so a server watching them reloads only complete ones.
+
+Engineered feature matrices are cached in --cache-dir, keyed on the data
+file and the feature code; re-running a search on the same data skips
+parsing and feature engineering. Search workers memory-map the cached
+matrix instead of each receiving a copy.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import ExtraTreesClassifier, GradientBoostingClassifier, RandomForestClassifier
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+
+import jobs
+import schema
+from instruments import INSTRUMENTS, model_age
+from model_loader import MODEL_DIR, MODEL_SPECS, compile_bundle, file_sha256, smoke_test
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Every declared instrument trains on its canonical feature list (see
+# instruments.py). Payloads carry Age in months like every API request and
+# are converted to the model's unit before encoding, as app.py does.
+
+# Estimators the runtime can serve (and export_model.py can compile), with
+# the grid searched when --grid is not given
+ESTIMATORS = {
+    'random_forest': (RandomForestClassifier, {
+        'n_estimators': [100, 300],
+        'max_depth': [None, 12],
+        'min_samples_leaf': [1, 3],
+        'max_features': ['sqrt', 0.3],
+    }),
+    'extra_trees': (ExtraTreesClassifier, {
+        'n_estimators': [100, 300],
+        'max_depth': [None, 12],
+        'min_samples_leaf': [1, 3],
+        'max_features': ['sqrt', 0.3],
+    }),
+    'gradient_boosting': (GradientBoostingClassifier, {
+        'n_estimators': [100, 300],
+        'learning_rate': [0.05, 0.1],
+        'max_depth': [2, 3],
+    }),
+}
+
+# Accepted label values (compared lower-cased); any other value skips the row
+POSITIVE_LABELS = {'1', 'yes', 'true', 'asd'}
+NEGATIVE_LABELS = {'0', 'no', 'false', 'no asd', 'no_asd'}
+
+# Source files that define the training matrix; a change to any of them
+# invalidates cached matrices
+FEATURE_CODE = ('features.py', 'schema.py', 'instruments.py', 'train_model.py')
+
+
+# ============================================================================
+# TRAINING DATA
+# ============================================================================
+
+def encode_label(value):
+    text = str(value).strip().lower()
+    if text in POSITIVE_LABELS:
+        return 1
+    if text in NEGATIVE_LABELS:
+        return 0
+    raise ValueError(f'label must be 1/0, yes/no or true/false, got {value!r}')
+
+
+def load_training_set(name, data_path, label):
+    """Validate and engineer a training file into (X, y, skipped).
+
+    Rows that fail validation are skipped rather than guessed at; skipped
+    holds (row number, reason) for each of them.
+    """
+    instrument = INSTRUMENTS[name]
+    fmt = jobs.detect_format(data_path)
+    if fmt is None:
+        raise ValueError(f'{data_path}: training data must be a .csv or .jsonl file')
+
+    rows = []
+    labels = []
+    skipped = []
+    for number, record in enumerate(jobs.read_records(data_path, fmt), start=1):
+        if isinstance(record, jobs.UnreadableLine):
+            skipped.append((number, record['message']))
+            continue
+        try:
+            y = encode_label(record.get(label))
+            if isinstance(record.get('Age'), (int, float)):
+                record = dict(record, Age=model_age(instrument, record['Age']))
+        except ValueError as e:
+            skipped.append((number, str(e)))
+            continue
+
+        row, errors = schema.validate(instrument['schema'], record)
+        if errors:
+            skipped.append((number, '; '.join(f"{e['field']}: {e.get('message', e['error'])}" for e in errors)))
+            continue
+        rows.append(row)
+        labels.append(y)
+
+    if not rows:
+        raise ValueError(f'{data_path}: no valid {instrument["label"]} rows')
+
+    plan = instrument['compile_plan'](instrument['features'])
+    X = instrument['preprocess'](rows, plan)
+    return X, np.array(labels, dtype=np.int64), skipped
+
+
+def code_sha256():
+    digest = hashlib.sha256()
+    for filename in FEATURE_CODE:
+        with open(os.path.join(BASE_DIR, filename), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def cached_training_set(name, data_path, label, cache_dir, refresh=False):
+    """(X path, y path, info) of the engineered matrix, built if needed.
+
+    X and y are saved as .npy so search workers can memory-map them.
+    """
+    data_sha256 = file_sha256(data_path)
+    key = hashlib.sha256(f'{name}|{label}|{data_sha256}|{code_sha256()}'.encode()).hexdigest()[:16]
+    directory = os.path.join(cache_dir, f'{name}-{key}')
+    X_path = os.path.join(directory, 'X.npy')
+    y_path = os.path.join(directory, 'y.npy')
+    info_path = os.path.join(directory, 'info.json')
+
+    if not refresh and os.path.exists(info_path):
+        with open(info_path) as f:
+            info = json.load(f)
+        return X_path, y_path, dict(info, cache_hit=True)
+
+    start = time.perf_counter()
+    X, y, skipped = load_training_set(name, data_path, label)
+    info = {
+        'data_path': os.path.abspath(data_path),
+        'data_sha256': data_sha256,
+        'code_sha256': code_sha256(),
+        'rows': int(len(y)),
+        'positives': int(y.sum()),
+        'skipped': len(skipped),
+        'skipped_examples': [f'row {number}: {reason}' for number, reason in skipped[:10]],
+        'feature_seconds': round(time.perf_counter() - start, 3),
+    }
+    os.makedirs(directory, exist_ok=True)
+    np.save(X_path, X)
+    np.save(y_path, y)
+    # Written last: a directory without info.json is an interrupted build
+    write_json(info_path, info)
+    return X_path, y_path, dict(info, cache_hit=False)
+
+
+# ============================================================================
+# PARALLEL SEARCH
+# ============================================================================
+#
+# Every (parameter set, fold) pair is one task for a process pool with one
+# process per core. Each estimator fits single-threaded, so the pool keeps
+# every core busy without oversubscribing them.
+
+_WORKER = {}
+
+
+def init_worker(X_path, y_path, feature_names):
+    # Memory-mapped, so workers share the cached matrix through the page cache
+    _WORKER['X'] = pd.DataFrame(np.load(X_path, mmap_mode='r'), columns=feature_names, copy=False)
+    _WORKER['y'] = np.load(y_path)
+
+
+def fit_fold(estimator, params, train_index, test_index, scoring, seed):
+    X, y = _WORKER['X'], _WORKER['y']
+    model_class, _ = ESTIMATORS[estimator]
+    model = model_class(random_state=seed, **params)
+    start = time.perf_counter()
+    model.fit(X.iloc[train_index], y[train_index])
+    fit_seconds = time.perf_counter() - start
+    score = get_scorer(scoring)(model, X.iloc[test_index], y[test_index])
+    return float(score), fit_seconds
+
+
+def search(estimator, grid, X_path, y_path, feature_names, folds, scoring, workers, seed):
+    """Cross-validate every parameter set of the grid.
+
+    Returns one result per parameter set, best mean score first.
+    """
+    candidates = list(ParameterGrid(grid))
+    y = np.load(y_path)
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed).split(np.zeros(len(y)), y))
+    if 'n_jobs' in ESTIMATORS[estimator][0]().get_params():
+        candidates = [dict(params, n_jobs=1) for params in candidates]
+
+    scores = [[None] * folds for _ in candidates]
+    fit_seconds = [0.0 for _ in candidates]
+    total = len(candidates) * folds
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(X_path, y_path, feature_names)) as pool:
+        futures = {
+            pool.submit(fit_fold, estimator, params, train_index, test_index, scoring, seed): (i, fold)
+            for i, params in enumerate(candidates)
+            for fold, (train_index, test_index) in enumerate(splits)
+        }
+        for future in as_completed(futures):
+            i, fold = futures[future]
+            score, seconds = future.result()
+            scores[i][fold] = score
+            fit_seconds[i] += seconds
+            done += 1
+            print(f"  {done}/{total} fits", end='\r')
+    print()
+
+    results = [
+        {
+            'params': {key: value for key, value in params.items() if key != 'n_jobs'},
+            'mean_score': float(np.mean(fold_scores)),
+            'std_score': float(np.std(fold_scores)),
+            'fold_scores': fold_scores,
+            'fit_seconds': round(seconds, 3),
+        }
+        for params, fold_scores, seconds in zip(candidates, scores, fit_seconds)
+    ]
+    return sorted(results, key=lambda result: -result['mean_score'])
+
+
+# ============================================================================
+# TRAINING
+# ============================================================================
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def replace_file(path, write):
+    # Write next to the target, then rename over it: readers (and the
+    # hot-reload watcher) only ever see a complete file
+    temp_path = f'{path}.tmp-{os.getpid()}'
+    write(temp_path)
+    os.replace(temp_path, path)
+
+
+def write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def train(name, data_path, label='ASD', out_dir=MODEL_DIR, cache_dir=None, estimator='random_forest',
+          grid=None, folds=5, scoring='roc_auc', workers=None, seed=0, refresh_cache=False):
+    """Search, refit on all rows and write the model files. Returns the metadata."""
+    started = time.perf_counter()
+    spec = MODEL_SPECS[name]
+    feature_names = list(INSTRUMENTS[name]['features'])
+    cache_dir = cache_dir or os.path.join(out_dir, 'feature_cache')
+    workers = workers or os.cpu_count()
+    grid = grid or ESTIMATORS[estimator][1]
+
+    print(f"Training {spec['label']} ({estimator}) on {data_path}")
+    start = time.perf_counter()
+    X_path, y_path, data_info = cached_training_set(name, data_path, label, cache_dir, refresh_cache)
+    prepare_seconds = time.perf_counter() - start
+    print(f"  {data_info['rows']:,} rows ({data_info['positives']:,} ASD), {data_info['skipped']} skipped, "
+          f"features {'from cache' if data_info['cache_hit'] else 'built'} in {prepare_seconds:.1f}s")
+
+    start = time.perf_counter()
+    results = search(estimator, grid, X_path, y_path, feature_names, folds, scoring, workers, seed)
+    search_seconds = time.perf_counter() - start
+    best = results[0]
+    print(f"  Best {scoring} {best['mean_score']:.4f} ± {best['std_score']:.4f}: {best['params']}")
+
+    # Refit on every row with all cores; serve single-threaded, as before
+    start = time.perf_counter()
+    X = pd.DataFrame(np.load(X_path), columns=feature_names)
+    model_class, _ = ESTIMATORS[estimator]
+    model = model_class(random_state=seed, **best['params'])
+    if 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=workers)
+    model.fit(X, np.load(y_path))
+    if 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=None)
+    refit_seconds = time.perf_counter() - start
+
+    # The model must load and score through the serving path before it is
+    # written where the API will pick it up
+    model_path = os.path.join(out_dir, spec['model_file'])
+    smoke_test(compile_bundle(name, model, feature_names, model_path, '0' * 64))
+
+    os.makedirs(out_dir, exist_ok=True)
+    # Each file is replaced atomically, but not the pair. The feature list
+    # is rewritten only when it changed, so a retrain is usually a single
+    # rename. When it did change, the loader refuses the new model next to
+    # the old list (check_feature_list) until both are in place, and the
+    # watcher waits for both files to settle.
+    # Uncompressed, so the API can memory-map the arrays (ASD_MODEL_MMAP)
+    replace_file(model_path, lambda path: joblib.dump(model, path))
+    features_path = os.path.join(out_dir, spec['features_file'])
+    if not os.path.exists(features_path) or list(joblib.load(features_path)) != feature_names:
+        replace_file(features_path, lambda path: joblib.dump(feature_names, path))
+
+    meta = {
+        'model': name,
+        'model_file': spec['model_file'],
+        'model_sha256': file_sha256(model_path),
+        'estimator': estimator,
+        'params': best['params'],
+        'feature_names': feature_names,
+        'label_column': label,
+        'data': {key: value for key, value in data_info.items() if key != 'cache_hit'},
+        'search': {
+            'folds': folds,
+            'scoring': scoring,
+            'seed': seed,
+            'workers': workers,
+            'grid': grid,
+            'results': results,
+        },
+        'timings': {
+            'prepare_seconds': round(prepare_seconds, 3),
+            'feature_cache_hit': data_info['cache_hit'],
+            'search_seconds': round(search_seconds, 3),
+            'refit_seconds': round(refit_seconds, 3),
+            'total_seconds': round(time.perf_counter() - started, 3),
+        },
+        'versions': {
+            'python': platform.python_version(),
+            'scikit-learn': sklearn.__version__,
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+        },
+        'git_commit': git_commit(),
+        'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+    meta_path = os.path.join(out_dir, f'{name}_model.json')
+    replace_file(meta_path, lambda path: write_json(path, meta))
+
+    print(f"✓ {spec['label']} model written to {model_path} in {meta['timings']['total_seconds']:.1f}s")
+    return meta
+
+
+# ============================================================================
+# COMMAND LINE
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('model', choices=sorted(INSTRUMENTS))
+    parser.add_argument('--data', required=True, help='training payloads (.csv or .jsonl)')
+    parser.add_argument('--label', default='ASD', help='label column: 1/0, yes/no or true/false')
+    parser.add_argument('--out-dir', default=MODEL_DIR)
+    parser.add_argument('--cache-dir', help='feature matrix cache (default: <out-dir>/feature_cache)')
+    parser.add_argument('--refresh-cache', action='store_true', help='rebuild the cached feature matrix')
+    parser.add_argument('--estimator', choices=sorted(ESTIMATORS), default='random_forest')
+    parser.add_argument('--grid', type=json.loads, help='parameter grid as JSON (default: built-in grid)')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--scoring', default='roc_auc', help='scikit-learn scorer name')
+    parser.add_argument('--workers', type=int, help='search processes (default: CPU count)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    train(
+        args.model, args.data, args.label, args.out_dir, args.cache_dir, args.estimator, args.grid,
+        args.folds, args.scoring, args.workers, args.seed, args.refresh_cache
+    )
+
+
+if __name__ == '__main__':
+    main()
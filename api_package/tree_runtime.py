@@ -0,0 +1,137 @@
+"""Compiled NumPy evaluator for exported tree-ensemble models.
+
+export_model.py flattens a fitted scikit-learn forest or gradient-boosting
+model into a handful of arrays saved as .npz. CompiledTrees evaluates them
+with plain NumPy, so a worker serving exported models never imports
+scikit-learn. It mirrors the parts of the estimator API the API uses:
+classes_, predict_proba() and predict().
+
+The .npz is written uncompressed, so load(path, mmap_mode='r') maps every
+array straight from the archive: worker processes on one host share the
+node arrays through the page cache.
+"""
+import json
+import struct
+import zipfile
+
+import numpy as np
+
+# Rows evaluated together; bounds the (rows, trees) node-index matrices
+BLOCK_ROWS = 4096
+
+FORMAT_VERSION = 1
+
+
+class CompiledTrees:
+    """Tree ensemble stored as flat node arrays.
+
+    All trees share one node numbering; roots holds each tree's root node.
+    Leaves point to themselves with a +inf threshold, so every row can take
+    exactly max_depth steps without checking which rows are finished.
+    """
+
+    def __init__(self, arrays, meta):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.missing_left = arrays['missing_left']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.meta = meta
+        self.kind = meta['kind']
+        self.classes_ = np.asarray(meta['classes'])
+        self.feature_names = list(meta['feature_names'])
+        self.n_features_in_ = len(self.feature_names)
+        self.max_depth = meta['max_depth']
+
+    def leaves(self, X):
+        # (rows, trees) leaf node reached by every row in every tree. X is
+        # rounded to float32 first, as scikit-learn's trees do.
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[node]]
+            go_left = (x <= self.threshold[node]) | (np.isnan(x) & self.missing_left[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict_proba(self, X):
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f'X has {X.shape[-1]} features, but the model expects {self.n_features_in_}')
+
+        probas = np.empty((len(X), len(self.classes_)))
+        for start in range(0, len(X), BLOCK_ROWS):
+            leaves = self.leaves(X[start:start + BLOCK_ROWS])
+            if self.kind == 'forest':
+                # Average of each tree's class distribution
+                probas[start:start + BLOCK_ROWS] = self.value[leaves].mean(axis=1)
+            else:
+                # Binary gradient boosting: sigmoid of the summed log-odds
+                raw = self.meta['init'] + self.meta['learning_rate'] * self.value[leaves, 0].sum(axis=1)
+                positive = 1.0 / (1.0 + np.exp(-raw))
+                probas[start:start + BLOCK_ROWS, 0] = 1.0 - positive
+                probas[start:start + BLOCK_ROWS, 1] = positive
+        return probas
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def save(self, path):
+        arrays = {
+            name: getattr(self, name)
+            for name in ('feature', 'threshold', 'left', 'right', 'missing_left', 'value', 'roots')
+        }
+        with open(path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(self.meta)), **arrays)
+
+
+def map_arrays(path, mmap_mode):
+    """Memory-map the arrays of an uncompressed .npz, by name.
+
+    Each member is a .npy file stored as is, so its data starts right after
+    the zip local header and the .npy header. Raises ValueError for a
+    compressed member.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-len('.npy')]
+            if name == 'meta':
+                continue
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f'{path}: {name} is compressed and cannot be memory-mapped')
+            # Local header: 30 fixed bytes, then the file name and extra field
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            if not np.prod(shape, dtype=np.int64):
+                arrays[name] = np.empty(shape, dtype=dtype)
+                continue
+            mapped = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=f.tell(), shape=shape,
+                               order='F' if fortran_order else 'C')
+            # A plain view: results computed from it are ordinary arrays
+            arrays[name] = mapped.view(np.ndarray)
+    return arrays
+
+
+def load(path, mmap_mode=None):
+    """Load a CompiledTrees model written by export_model.py.
+
+    With mmap_mode ('r'), the node arrays are mapped from the file instead
+    of read into private memory.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        if mmap_mode is None:
+            arrays = {name: data[name] for name in data.files if name != 'meta'}
+    if mmap_mode is not None:
+        arrays = map_arrays(path, mmap_mode)
+    if meta.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported export format {meta.get('format_version')!r}")
+    return CompiledTrees(arrays, meta)
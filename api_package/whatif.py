@@ -0,0 +1,50 @@
+from instruments import INSTRUMENTS, model_age
+
+# ============================================================================
+# WHAT-IF VARIANTS
+# ============================================================================
+#
+# Variants are encoded rows as produced by schema.validate() (Age in the
+# model's unit, years for AQ), each differing from the child's own row in one
+# answer or in age. Scoring them all in one call is what makes the analysis
+# interactive.
+
+
+def answer_variants(model_name, row):
+    """Yield (question, alternative answer, row) for every single-answer change.
+
+    Each answer takes every other value the instrument allows: M-CHAT
+    answers flip between yes (1) and no (0), 23 variants; AQ answers take
+    every other score from 0 to 3, 90 variants.
+    """
+    instrument = INSTRUMENTS[model_name]
+    for question in instrument['question_fields']:
+        for alternative in instrument['answer_values']:
+            if alternative != row[question]:
+                yield question, alternative, dict(row, **{question: alternative})
+
+
+def age_variants(model_name, row):
+    """Yield (age in months, row) for every age the model is routed."""
+    instrument = INSTRUMENTS[model_name]
+    for months in instrument['ages']:
+        yield months, dict(row, Age=model_age(instrument, months))
+
+
+def dedupe(rows):
+    """Collapse identical rows so each is scored once.
+
+    Returns (unique_rows, positions) with rows[i] == unique_rows[positions[i]].
+    Rows must share one field order, as validated rows of a schema do.
+    """
+    index = {}
+    unique_rows = []
+    positions = []
+    for row in rows:
+        key = tuple(row.values())
+        position = index.get(key)
+        if position is None:
+            position = index[key] = len(unique_rows)
+            unique_rows.append(row)
+        positions.append(position)
+    return unique_rows, positions